@@ -0,0 +1,24 @@
+import streamlit as st
+import os
+
+
+def get_setting(name, default):
+    """設定を st.secrets → 環境変数 → 既定値 の順で取得する
+
+    値は既定値の型に変換する（真偽値は "1" / "true" / "yes" / "on" を真とする）。
+
+    Args:
+        name: 設定名
+        default: 設定が無い場合の値
+    """
+    try:
+        value = st.secrets.get(name)
+    except Exception:  # secrets.tomlが無い場合
+        value = None
+    if value is None:
+        value = os.environ.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return str(value).lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
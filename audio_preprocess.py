@@ -0,0 +1,146 @@
+import os
+import time
+import wave
+import shutil
+import threading
+import subprocess
+from chunked_transcription import silent_windows, silence_midpoints, SILENCE_WINDOW_SEC
+
+# ==========================
+#  音声の前処理設定
+# ==========================
+CACHE_DIR = os.environ.get("APP_CACHE_DIR", ".cache")
+NORMALIZED_DIR = os.path.join(CACHE_DIR, "normalized_audio")
+SAMPLE_RATE = 16000                      # 話者分離モデル（pyannote）の入力のサンプリング周波数
+UPLOAD_BITRATE = "32k"                   # 文字起こしに送るMP3のビットレート（音声の認識には十分）
+MAX_NORMALIZED_BYTES = 2 * 1024 ** 3     # 変換済み音声の保存上限（2GB、超えたら古い順に削除）
+FFMPEG_TIMEOUT_SEC = 60 * 60             # 変換のタイムアウト
+PCM_BLOCK_SEC = 60                       # 無音検出でPCMを読み込む単位
+IN_USE_SEC = 3 * 60 * 60                 # この秒数以内に使われた変換済み音声は削除しない（処理中の可能性があるため）
+
+
+def ffmpeg_path():
+    """ffmpegのパス（インストールされていなければNone）"""
+    return shutil.which("ffmpeg")
+
+
+def normalized_paths(audio_hash, directory=NORMALIZED_DIR):
+    """変換済み音声の保存先（16kHzモノラルのWAVと、アップロード用のMP3）"""
+    return {
+        "pcm": os.path.join(directory, f"{audio_hash}.wav"),
+        "upload": os.path.join(directory, f"{audio_hash}.mp3"),
+    }
+
+
+def build_command(ffmpeg, src, pcm_path, upload_path):
+    """1回のデコードで、話者分離用のPCMとアップロード用のMP3を書き出すffmpegのコマンド"""
+    return [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", src,
+        "-map", "0:a:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_s16le", pcm_path,
+        "-map", "0:a:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "libmp3lame", "-b:a", UPLOAD_BITRATE,
+        upload_path,
+    ]
+
+
+def normalize_audio(src, audio_hash, directory=NORMALIZED_DIR, max_bytes=MAX_NORMALIZED_BYTES, ffmpeg=None):
+    """音声を16kHzモノラルに変換し、{"pcm": WAVのパス, "upload": MP3のパス} を返す
+
+    話者分離はリサンプリング不要のPCMを読み、文字起こしには小さなMP3を送る。
+    変換結果は入力のハッシュごとに保存し、同じ音声では変換し直さない。
+    ffmpegが無い場合や変換に失敗した場合はNoneを返す（元のファイルをそのまま使う）。
+
+    Args:
+        src: 元の音声ファイルのパス
+        audio_hash: 元の音声のSHA-256
+        directory: 変換済み音声の保存先
+        max_bytes: 保存先の合計サイズの上限
+        ffmpeg: ffmpegのパス（Noneの場合はPATHから探す）
+    """
+    paths = normalized_paths(audio_hash, directory)
+    if all(os.path.exists(path) for path in paths.values()):
+        # アクセス順に削除するため、使うたびに更新時刻を更新する
+        for path in paths.values():
+            os.utime(path)
+        return paths
+
+    ffmpeg = ffmpeg or ffmpeg_path()
+    if ffmpeg is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    # 同じ音声を同時に変換しても壊れないよう、一時ファイルに書いてから置き換える
+    suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+    partial = {name: path[:-4] + suffix + path[-4:] for name, path in paths.items()}
+    try:
+        result = subprocess.run(
+            build_command(ffmpeg, src, partial["pcm"], partial["upload"]),
+            capture_output=True, timeout=FFMPEG_TIMEOUT_SEC
+        )
+        if result.returncode != 0:
+            return None
+        for name, path in paths.items():
+            os.replace(partial[name], path)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        for path in partial.values():
+            if os.path.exists(path):
+                os.remove(path)
+    evict(directory, max_bytes, keep=audio_hash)
+    return paths
+
+
+def evict(directory=NORMALIZED_DIR, max_bytes=MAX_NORMALIZED_BYTES, keep=None, in_use_sec=IN_USE_SEC):
+    """保存先の合計サイズが上限を超えていれば、使われていない順に削除する
+
+    最近使われた音声は、他のセッションの話者分離や文字起こしがまだ読んでいる
+    可能性があるため、上限を超えていても削除しない。
+
+    Args:
+        directory: 変換済み音声の保存先
+        max_bytes: 保存先の合計サイズの上限
+        keep: 削除しない音声のハッシュ（呼び出し元が使う音声）
+        in_use_sec: この秒数以内に使われた音声は削除しない
+    """
+    groups = {}
+    for name in os.listdir(directory):
+        if name.endswith(".tmp.wav") or name.endswith(".tmp.mp3"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        audio_hash = os.path.splitext(name)[0]
+        size, used = groups.get(audio_hash, (0, 0.0))
+        groups[audio_hash] = (size + stat.st_size, max(used, stat.st_mtime))
+
+    total = sum(size for size, _ in groups.values())
+    recent = time.time() - in_use_sec
+    for audio_hash, (size, used) in sorted(groups.items(), key=lambda item: item[1][1]):
+        if total <= max_bytes or used >= recent:
+            break
+        if audio_hash == keep:
+            continue
+        for path in normalized_paths(audio_hash, directory).values():
+            if os.path.exists(path):
+                os.remove(path)
+        total -= size
+
+
+def detect_silences_in_wav(path, window=SILENCE_WINDOW_SEC):
+    """16bitモノラルのWAVから無音区間の中央の時刻を返す（一定時間ずつ読むためメモリを消費しない）"""
+    import numpy as np
+
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        hop = max(int(round(sample_rate * window)), 1)
+        block = hop * max(int(PCM_BLOCK_SEC / window), 1)
+        parts = []
+        while True:
+            frames = wav.readframes(block)
+            if not frames:
+                break
+            samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+            parts.append(silent_windows(samples, sample_rate, window=hop / sample_rate))
+    silent = np.concatenate(parts) if parts else []
+    return silence_midpoints(silent, window=hop / sample_rate)
@@ -0,0 +1,218 @@
+"""チャットページのオフラインベンチマーク
+
+ローカルのOpenAI互換スタブサーバーに対して chat.main() を Streamlit の
+テスト用ランタイム（AppTest）で実行し、ネットワークを除いた描画・履歴管理の
+コストを計測する。
+
+    python benchmarks/bench_chat.py --chunks 200 --delay 0.005 --history 0,100,500
+
+計測値が BUDGETS の上限を超えた場合や応答がエラーになった場合は終了コード1で終了する
+（デプロイ前の性能劣化の検出用）。
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import gc
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from stub_openai import start_stub_process
+
+# ==========================
+#  ベンチマーク設定
+# ==========================
+DEFAULT_HISTORY_LENGTHS = "0,100,500"  # 事前に投入する履歴メッセージ数
+DEFAULT_ITERATIONS = 5                 # 履歴長ごとの計測回数
+HISTORY_MESSAGE_TEXT = "これは過去の会話のメッセージです。" * 10
+APP_TIMEOUT_SEC = 120
+OUTPUT_PATH = "bench_output.txt"
+BENCH_OWNER = "bench"                  # 事前に投入する会話の所有者
+WARMUP_TURNS = 2                       # 計測前に応答させる回数（初回の読み込み等を計測に含めない）
+
+# 計測値の上限（履歴長ごとに判定する。--budget 名前=値 で上書き可能）
+BUDGETS = {
+    "idle_rerun_ms": 150,            # 入力なしの再実行
+    "overhead_ms": 600,              # 応答1回あたりの、API応答時間を除いた処理時間
+    "render_us_per_chunk": 300,      # チャンク1つあたりの描画コスト
+    "mem_growth_kb_per_turn": 512,   # 応答1回あたりのメモリ増加
+}
+
+
+def chat_app(conversation_id, owner):
+    """AppTestで実行するスクリプト（事前に投入した会話を再開してから描画する）
+
+    関数の本体だけが実行されるため、モジュールの定数は引数で渡す。
+    """
+    import streamlit as st
+    import chat
+
+    if "conversation_id" not in st.session_state:
+        st.session_state.history_version = 0
+        st.session_state.conversation_owner = owner
+        chat.start_conversation(conversation_id)
+    chat.main()
+
+
+def seed_conversation(history_length):
+    """指定した件数の履歴を持つ会話を作成し、会話IDを返す"""
+    from conversation_store import ConversationStore
+
+    store = ConversationStore()
+    conversation_id = store.create_conversation(BENCH_OWNER)
+    for i in range(history_length):
+        role = "user" if i % 2 == 0 else "assistant"
+        message = {"role": role, "content": f"{i}: {HISTORY_MESSAGE_TEXT}", "ts": int(time.time())}
+        if role == "assistant":
+            message["model_info"] = "GPT-5 (最強・統合型)"
+            message["params"] = {"model": "gpt-5", "max_completion_tokens": 1000}
+        store.append(conversation_id, message)
+    return conversation_id
+
+
+def timed_run(app):
+    started = time.perf_counter()
+    app.run(timeout=APP_TIMEOUT_SEC)
+    return time.perf_counter() - started
+
+
+def median_ms(values):
+    return statistics.median(values) * 1000 if values else float("nan")
+
+
+def bench_history_length(history_length, iterations):
+    """1つの履歴長について、再実行時間・チャンクあたりの描画コスト・メモリ増加を計測する"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(chat_app, args=(seed_conversation(history_length), BENCH_OWNER),
+                                default_timeout=APP_TIMEOUT_SEC)
+    app.secrets["OPENAI_API_KEY"] = "bench"
+    cold = timed_run(app)
+
+    # 入力なしの再実行（履歴の再描画のみ）
+    idle = [timed_run(app) for _ in range(iterations)]
+
+    # 初回の応答で読み込まれるモジュール等の影響を除くため、計測前に応答させる
+    for _ in range(WARMUP_TURNS):
+        app.chat_input[0].set_value(f"ウォームアップ {uuid.uuid4().hex}")
+        timed_run(app)
+
+    # 応答生成を伴う再実行
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    turns, overheads, per_chunk, errors = [], [], [], 0
+    for i in range(iterations):
+        # 応答キャッシュに当たらないよう毎回異なる入力にする
+        app.chat_input[0].set_value(f"ベンチマーク {i} {uuid.uuid4().hex}")
+        elapsed = timed_run(app)
+        turns.append(elapsed)
+        message = app.session_state["messages"][-1]
+        params = message.get("params") or {}
+        if app.exception or message.get("content", "").startswith("❌"):
+            errors += 1
+            continue
+        if params.get("latency_sec") is not None:
+            overheads.append(elapsed - params["latency_sec"])
+        if params.get("chunks"):
+            per_chunk.append((params.get("render_sec") or 0) / params["chunks"])
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "history": history_length,
+        "cold_ms": cold * 1000,
+        "idle_rerun_ms": median_ms(idle),
+        "turn_ms": median_ms(turns),
+        "overhead_ms": median_ms(overheads),
+        "render_us_per_chunk": statistics.median(per_chunk) * 1e6 if per_chunk else float("nan"),
+        "mem_growth_kb_per_turn": (after - before) / 1024 / iterations,
+        "mem_peak_kb": (peak - before) / 1024,
+        "errors": errors,
+    }
+
+
+def format_results(results, args):
+    columns = ["history", "cold_ms", "idle_rerun_ms", "turn_ms", "overhead_ms",
+               "render_us_per_chunk", "mem_growth_kb_per_turn", "mem_peak_kb", "errors"]
+    lines = [
+        f"# chat.main() offline benchmark  chunks={args.chunks} delay={args.delay}s "
+        f"iterations={args.iterations}",
+        "  ".join(f"{c:>22}" for c in columns),
+    ]
+    for row in results:
+        lines.append("  ".join(
+            f"{row[c]:>22.2f}" if isinstance(row[c], float) else f"{row[c]:>22}" for c in columns
+        ))
+    return "\n".join(lines) + "\n"
+
+
+def check_budgets(results, budgets):
+    """上限を超えた計測値を「履歴長・指標・値・上限」の文字列のリストで返す"""
+    violations = []
+    for row in results:
+        if row["errors"]:
+            violations.append(f"history={row['history']}: errors={row['errors']}")
+        for metric, limit in budgets.items():
+            value = row[metric]
+            # 計測できなかった値（NaN）も失敗として扱う
+            if not value <= limit:
+                violations.append(f"history={row['history']}: {metric}={value:.2f} (上限 {limit})")
+    return violations
+
+
+def parse_budgets(overrides):
+    budgets = dict(BUDGETS)
+    for item in overrides:
+        name, _, value = item.partition("=")
+        if name not in BUDGETS:
+            raise SystemExit(f"未知の指標です: {name}（{', '.join(BUDGETS)}）")
+        budgets[name] = float(value)
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="チャットページのオフラインベンチマーク")
+    parser.add_argument("--chunks", type=int, default=200, help="1応答あたりのチャンク数")
+    parser.add_argument("--delay", type=float, default=0.0, help="チャンク間の待ち時間（秒）")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_LENGTHS, help="履歴メッセージ数（カンマ区切り）")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--output", default=OUTPUT_PATH, help="結果を追記するファイル（空文字で書き出さない）")
+    parser.add_argument("--budget", action="append", default=[], metavar="NAME=VALUE",
+                        help="計測値の上限を上書きする（複数指定可）")
+    args = parser.parse_args(argv)
+    budgets = parse_budgets(args.budget)
+
+    stub, base_url = start_stub_process(chunks=args.chunks, delay_sec=args.delay)
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        # キャッシュ・会話ストア・計測ログは一時ディレクトリに分離する（アプリのモジュール読込前に設定）
+        os.environ["APP_CACHE_DIR"] = workdir.name
+        os.environ["APP_METRICS_PATH"] = os.path.join(workdir.name, "metrics.jsonl")
+        os.environ["OPENAI_BASE_URL"] = base_url
+
+        results = [bench_history_length(int(n), args.iterations) for n in args.history.split(",")]
+    finally:
+        stub.terminate()
+        workdir.cleanup()
+
+    report = format_results(results, args)
+    print(report, end="")
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(report)
+    violations = check_budgets(results, budgets)
+    if violations:
+        print("⚠️ 性能の上限を超えました:", file=sys.stderr)
+        for violation in violations:
+            print(f"  {violation}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import json
+import time
+import socket
+import argparse
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================
+#  スタブサーバー設定
+# ==========================
+DEFAULT_CHUNKS = 200      # 1応答あたりのチャンク数
+DEFAULT_CHUNK_TEXT = "テスト応答です。"  # 各チャンクで返すテキスト
+DEFAULT_DELAY_SEC = 0.0   # チャンク間の待ち時間
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI互換の /chat/completions だけを返すハンドラ
+
+    ストリーム指定時はサーバー設定のチャンク数・待ち時間でSSEを再生し、
+    stream_options.include_usage が指定されていれば最後にusageチャンクを送る。
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body or b"{}")
+        model = request.get("model", "stub")
+        if request.get("stream"):
+            self._send_stream(model, request.get("stream_options") or {})
+        else:
+            self._send_completion(model)
+
+    def _send_completion(self, model):
+        config = self.server.config
+        content = config["chunk_text"] * config["chunks"]
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": config["chunks"],
+                      "total_tokens": config["chunks"]},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, model, stream_options):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def event(delta, finish_reason=None, usage=None, choices=True):
+            data = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+            if usage is not None:
+                data["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for _ in range(config["chunks"]):
+            if config["delay_sec"]:
+                time.sleep(config["delay_sec"])
+            event({"content": config["chunk_text"]})
+        event({}, finish_reason="stop")
+        if stream_options.get("include_usage"):
+            event(None, usage={"prompt_tokens": 0, "completion_tokens": config["chunks"],
+                               "total_tokens": config["chunks"]}, choices=False)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(port=0, chunks=DEFAULT_CHUNKS, delay_sec=DEFAULT_DELAY_SEC, chunk_text=DEFAULT_CHUNK_TEXT):
+    """スタブサーバーを作成する（port=0で空きポートを使用）"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.config = {"chunks": chunks, "delay_sec": delay_sec, "chunk_text": chunk_text}
+    return server
+
+
+def _serve(port, chunks, delay_sec, chunk_text, ready):
+    server = make_server(port, chunks, delay_sec, chunk_text)
+    ready.set()
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_process(chunks=DEFAULT_CHUNKS, delay_sec=DEFAULT_DELAY_SEC, chunk_text=DEFAULT_CHUNK_TEXT):
+    """スタブサーバーを別プロセスで起動し、(プロセス, ベースURL) を返す
+
+    計測対象のプロセスとGILやメモリを共有しないよう、サーバーは別プロセスで動かす。
+    """
+    port = _free_port()
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=_serve, args=(port, chunks, delay_sec, chunk_text, ready), daemon=True
+    )
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("スタブサーバーが起動しませんでした")
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI互換のストリーミングスタブサーバー")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chunks", type=int, default=DEFAULT_CHUNKS)
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_SEC)
+    args = parser.parse_args()
+    print(f"http://127.0.0.1:{args.port}/v1")
+    make_server(args.port, args.chunks, args.delay).serve_forever()
@@ -0,0 +1,159 @@
+import time
+import queue
+import functools
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# ==========================
+#  中断設定
+# ==========================
+HEARTBEAT_SEC = 0.25  # 応答待ちの間に停止・再実行の要求を確認する間隔
+
+
+class GenerationCancelled(Exception):
+    """生成が中断された場合のエラー（途中までのテキストを持つ）"""
+
+    def __init__(self, partial=""):
+        super().__init__("生成を中断しました")
+        self.partial = partial
+
+
+class CancelToken:
+    """進行中の生成に中断を伝えるトークン
+
+    中断時に呼ぶ関数（ストリームのclose等）を登録しておくと、別スレッドから
+    cancel() されたときにすぐ呼び出して、読み込み待ちのHTTP接続も閉じる。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """中断する（登録済みの関数を1度だけ呼ぶ）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """中断時に呼ぶ関数を登録する（既に中断済みならすぐ呼ぶ）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        try:
+            callback()
+        except Exception:
+            pass
+
+
+def status_heartbeat(placeholder, label):
+    """待機中の経過時間を表示するheartbeat関数を返す"""
+    started = time.perf_counter()
+
+    def heartbeat():
+        placeholder.caption(f"⏳ {label}… {time.perf_counter() - started:.1f}秒")
+    return heartbeat
+
+
+def with_script_context(fn):
+    """呼び出し元のスクリプト実行コンテキストを引き継いでfnを実行する関数を返す
+
+    ワーカースレッドからもセッションを識別できるようにする（流量制御の公平性のため）。
+    スクリプト実行スレッドの外で呼ばれた場合は、fnをそのまま実行する。
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return run
+
+
+def _start_worker(target):
+    thread = threading.Thread(target=with_script_context(target), daemon=True)
+    thread.start()
+    return thread
+
+
+def run_cancellable(fn, cancel, heartbeat=None, interval=HEARTBEAT_SEC):
+    """fnをワーカースレッドで実行し、完了を待つ間は一定間隔でheartbeat()を呼ぶ
+
+    Streamlitはst.*で画面を更新するときにだけ停止・再実行の要求を処理するため、
+    待機中もheartbeat（経過時間の表示など）で画面を更新して停止ボタンにすぐ反応する。
+    停止などで例外が送出された場合は、cancelで接続を閉じてから例外をそのまま伝播する。
+    """
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = _start_worker(target)
+    try:
+        while thread.is_alive():
+            thread.join(interval)
+            if heartbeat is not None and thread.is_alive():
+                heartbeat()
+    except BaseException:
+        cancel.cancel()
+        raise
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def iter_cancellable(make_iterable, cancel, heartbeat=None, interval=HEARTBEAT_SEC):
+    """make_iterable()の要素をワーカースレッドで受信し、呼び出し元のスレッドで順に返す
+
+    受信待ちの間は一定間隔でheartbeat()を呼ぶ。呼び出し元が途中で読むのをやめた場合や
+    例外で抜けた場合は、cancelで接続を閉じてワーカーを止める。
+    """
+    events = queue.Queue()
+
+    def target():
+        try:
+            for item in make_iterable():
+                if cancel.cancelled:
+                    break
+                events.put(("item", item))
+            events.put(("done", None))
+        except BaseException as e:
+            events.put(("error", e))
+
+    _start_worker(target)
+    finished = False
+    try:
+        while True:
+            try:
+                kind, payload = events.get(timeout=interval)
+            except queue.Empty:
+                if heartbeat is not None:
+                    heartbeat()
+                continue
+            if kind == "item":
+                yield payload
+                continue
+            finished = True
+            if kind == "error":
+                raise payload
+            return
+    finally:
+        if not finished:
+            cancel.cancel()
@@ -1,11 +1,19 @@
 import streamlit as st
-from openai import OpenAI
+import streamlit.components.v1 as components
 import time
-
-# ==========================
-#  OpenAI APIキーの設定
-# ==========================
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])  # ここにOpenAIのAPIキーを入力してください
+import uuid
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from streaming import ThrottledRenderer
+from context_window import build_context, context_tokens
+from llm_cache import get_response_cache, complete, stream_completion
+from openai_client import get_client
+from chat_export import EXPORT_FORMATS, build_export, export_file_info, get_cached_export, cache_export
+from conversation_store import get_conversation_store
+from telemetry import metrics_params, render_diagnostics
+from chat_search import SearchIndex, snippet
+from cancellation import CancelToken, iter_cancellable, status_heartbeat, with_script_context
+from model_router import AUTO_MODEL_ID, FALLBACK_STATUS_CODES, get_router, estimate_output_tokens, is_fallback_error
 
 # ==========================
 #  モデル設定
@@ -14,39 +22,518 @@ MODELS = {
     "GPT-5 (最強・統合型)": {
         "id": "gpt-5",
         "description": "2025年8月リリースの最強モデル。GPTシリーズとoシリーズを統合",
-        "category": "最強モデル"
+        "category": "最強モデル",
+        "context_budget": 32000
     },
     "GPT-5 Mini (軽量版)": {
         "id": "gpt-5-mini",
         "description": "GPT-5の軽量版。高速処理とコスト効率を重視したモデル",
-        "category": "最強モデル"
+        "category": "最強モデル",
+        "context_budget": 32000
     },
     "GPT-5 Chat (対話特化)": {
         "id": "gpt-5-chat",
         "description": "対話型アプリケーション向けに最適化されたGPT-5モデル",
-        "category": "最強モデル"
+        "category": "最強モデル",
+        "context_budget": 32000
     },
     "GPT-4o (マルチモーダル)": {
         "id": "gpt-4o",
         "description": "テキスト、画像、音声の統合処理が可能なマルチモーダルモデル",
-        "category": "最新モデル"
+        "category": "最新モデル",
+        "context_budget": 32000
     },
     "o1-mini (推論特化)": {
         "id": "o1-mini",
         "description": "推論能力に特化したモデル。数学や科学の問題解決に優れる",
-        "category": "推論特化"
+        "category": "推論特化",
+        "context_budget": 32000
     },
     "GPT-4-turbo (高性能)": {
         "id": "gpt-4-turbo",
         "description": "GPT-4の高性能版。複雑なタスクに優れた性能を発揮",
-        "category": "高性能"
+        "category": "高性能",
+        "context_budget": 32000
     },
     "GPT-3.5-turbo (従来型)": {
         "id": "gpt-3.5-turbo",
         "description": "安定した性能とコスト効率を提供する従来型モデル",
-        "category": "従来型"
+        "category": "従来型",
+        "context_budget": 12000
+    },
+    "自動選択 (応答速度優先)": {
+        "id": AUTO_MODEL_ID,
+        "description": "質問の長さ・想定される出力量・直近の応答速度とエラー率から、最も早く答えられるモデルを選びます。失敗時は別のモデルに切り替えます",
+        "category": "自動選択",
+        "context_budget": 12000
     }
 }
+MODEL_NAMES_BY_ID = {model["id"]: name for name, model in MODELS.items()}
+
+# ==========================
+#  履歴表示設定
+# ==========================
+HISTORY_WINDOW = 20       # 完全に表示する直近のメッセージ数（「さらに表示」1回あたりの追加数）
+STUB_PREVIEW_CHARS = 80   # 折りたたみ表示でのプレビュー文字数
+STUB_LIMIT = 200          # 折りたたみ表示で一度に読み込む古いメッセージ数
+MAX_MESSAGES_IN_MEMORY = 100  # セッションのメモリに保持するメッセージ数の目安（古いものはストアから読む）
+SEARCH_CONTEXT_MESSAGES = 5  # 検索結果へ移動したときに前後へ表示するメッセージ数
+OWNER_QUERY_PARAM = "owner"   # 未ログイン時の所有者トークンを保持するURLパラメータ（再読み込み後も会話を再開できるように）
+
+def summarize_history(model_id, previous_summary, messages):
+    """古い会話を要約に畳み込む（前回の要約がある場合はそれも含めて再要約）"""
+    conversation = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous_summary:
+        conversation = f"これまでの要約:\n{previous_summary}\n\n続きの会話:\n{conversation}"
+    # o1系はsystemロールを受け付けないため、指示はuserメッセージに含める
+    api_params = {
+        "model": model_id,
+        "messages": [{
+            "role": "user",
+            "content": f"以下の会話を、後続の会話に必要な事実・決定事項・未解決の質問を残して簡潔に要約してください。\n\n{conversation}"
+        }]
+    }
+    return complete(get_client(), api_params, get_response_cache()) or ""
+
+def build_api_params(model_id, messages, temperature, max_tokens):
+    """モデル固有の制約に合わせてストリーミング呼び出し用のパラメータを組み立てる"""
+    api_params = {
+        "model": model_id,
+        "messages": messages,
+        "stream": True,
+        # 最後のチャンクでトークン数を受け取る（計測用）
+        "stream_options": {"include_usage": True},
+    }
+    if model_id.startswith("o1"):
+        # o1系はtemperatureとmax_tokensを設定しない
+        pass
+    elif model_id.startswith("gpt-5"):
+        # GPT-5系はパラメータ制限あり
+        api_params["temperature"] = 1.0
+        api_params["max_completion_tokens"] = max_tokens
+    else:
+        # その他のモデルは従来通り
+        api_params["temperature"] = temperature
+        api_params["max_tokens"] = max_tokens
+    return api_params
+
+def describe_params(model_id, temperature, max_tokens):
+    """履歴・エクスポート用に、実際に使用したパラメータを返す"""
+    return {
+        "model": model_id,
+        # GPT-5系はmax_completion_tokens、それ以外はmax_tokensを採用
+        "temperature": 1.0 if model_id.startswith("gpt-5") else (
+            None if model_id.startswith("o1") else temperature
+        ),
+        "max_tokens": None if model_id.startswith("gpt-5") else (
+            None if model_id.startswith("o1") else max_tokens
+        ),
+        "max_completion_tokens": max_tokens if model_id.startswith("gpt-5") else None,
+    }
+
+def assistant_message(model_id, content, stats, temperature, max_tokens, routed=False, truncated=False):
+    """実際に応答したモデル・利用パラメータ・計測値・タイムスタンプ付きの応答メッセージを作る"""
+    params = describe_params(model_id, temperature, max_tokens)
+    params.update(metrics_params(stats))
+    if routed:
+        params["routed_by"] = AUTO_MODEL_ID
+    message = {
+        "role": "assistant",
+        "content": content,
+        "model_info": MODEL_NAMES_BY_ID[model_id],
+        "params": params,
+        "ts": int(time.time())
+    }
+    if truncated:
+        # 停止ボタンなどで途中で打ち切った応答
+        message["truncated"] = True
+    return message
+
+def run_comparison(model_names, messages, temperature, max_tokens, cache=None):
+    """同じ入力を複数モデルへ同時に送り、各モデルの応答を列ごとにストリーミング表示する
+
+    API呼び出しはスレッドプールで並行に行い、描画はメインスレッドのみで行う
+    （Streamlitの要素はスクリプト実行スレッドからしか更新できないため）。
+    所要時間は合計ではなく最も遅いモデルの応答時間になる。
+
+    Returns:
+        モデルごとの (応答テキスト, 計測値, エラー) のリスト
+    """
+    renderers = []
+    for column, name in zip(st.columns(len(model_names)), model_names):
+        with column:
+            st.markdown(f"**🤖 {name}**")
+            renderers.append(ThrottledRenderer(st.empty()))
+
+    stop_placeholder = st.empty()
+    stop_placeholder.button("⏹️ 比較を停止", key="stop_comparison")
+
+    client = get_client()
+    events = queue.Queue()
+    # 停止ボタン・再実行で中断されたら全モデルの接続を閉じる
+    cancel = CancelToken()
+
+    @with_script_context
+    def worker(index, model_id):
+        stats = {}
+        try:
+            api_params = build_api_params(model_id, messages, temperature, max_tokens)
+            for delta in stream_completion(client, api_params, cache, stats=stats, cancel=cancel):
+                events.put((index, "delta", delta))
+            events.put((index, "done", stats))
+        except Exception as e:
+            events.put((index, "error", e))
+
+    results = [None] * len(model_names)
+    with ThreadPoolExecutor(max_workers=len(model_names)) as executor:
+        for index, name in enumerate(model_names):
+            executor.submit(worker, index, MODELS[name]["id"])
+
+        remaining = len(model_names)
+        try:
+            while remaining:
+                try:
+                    index, kind, payload = events.get(timeout=renderers[0].interval)
+                except queue.Empty:
+                    # 途中で止まっているモデルの未描画分を描画
+                    for renderer in renderers:
+                        renderer.tick()
+                    continue
+
+                renderer = renderers[index]
+                if kind == "delta":
+                    renderer.append(payload)
+                    continue
+
+                remaining -= 1
+                if kind == "done":
+                    renderer.flush(final=True)
+                    payload["render_sec"] = renderer.render_sec
+                    results[index] = (renderer.text, payload, None)
+                else:
+                    renderer.placeholder.error(f"❌ エラーが発生しました: {payload}")
+                    results[index] = (renderer.text, {}, payload)
+        except BaseException:
+            # 停止ボタン・再実行による中断では、残りのワーカーの接続を閉じ、
+            # 途中までの応答を打ち切られた応答として残してから伝播する
+            cancel.cancel()
+            unfinished = {index for index, result in enumerate(results) if result is None}
+            partial = [
+                result or (renderer.text, {"render_sec": renderer.render_sec}, None)
+                for result, renderer in zip(results, renderers)
+            ]
+            append_comparison(model_names, partial, temperature, max_tokens, truncated=unfinished)
+            raise
+    stop_placeholder.empty()
+    return results
+
+def append_comparison(model_names, results, temperature, max_tokens, truncated=()):
+    """比較モードの各モデルの応答を、同じグループのメッセージとして履歴に追加する
+
+    Args:
+        model_names: 比較したモデル名のリスト
+        results: モデルごとの (応答テキスト, 計測値, エラー) のリスト
+        truncated: 途中で打ち切られたモデルの添字（応答が空なら追加しない）
+    """
+    group = time.time_ns()
+    context_assigned = False
+    for index, (name, (text, stats, error)) in enumerate(zip(model_names, results)):
+        model_id = MODELS[name]["id"]
+        if error is not None:
+            append_message({
+                "role": "assistant",
+                "content": f"❌ エラーが発生しました: {str(error)}",
+                "model_info": name,
+                "params": {"model": model_id},
+                "compare_group": group,
+                "ts": int(time.time())
+            })
+            continue
+        if index in truncated and not text:
+            continue
+
+        message = assistant_message(model_id, text, stats, temperature, max_tokens, truncated=index in truncated)
+        message["compare_group"] = group
+        # 以降の文脈に使うのは最初に成功したモデルの応答のみ
+        message["compare_alternate"] = context_assigned
+        append_message(message)
+        context_assigned = True
+
+def anonymous_owner_token():
+    """未ログイン時の所有者トークン（URLパラメータに保持し、再読み込み・サーバー再起動後も同じものを使う）"""
+    token = st.query_params.get(OWNER_QUERY_PARAM)
+    if not isinstance(token, str) or len(token) != 32 or any(c not in "0123456789abcdef" for c in token):
+        token = uuid.uuid4().hex
+        st.query_params[OWNER_QUERY_PARAM] = token
+    return token
+
+def conversation_owner():
+    """会話の所有者（ログイン中はユーザー、それ以外はURLに保持した匿名トークン）"""
+    if "conversation_owner" not in st.session_state:
+        owner = None
+        try:
+            if st.user.is_logged_in:
+                owner = f"user:{st.user.email}"
+        except Exception:  # 認証が設定されていない場合
+            owner = None
+        st.session_state.conversation_owner = owner or f"session:{anonymous_owner_token()}"
+    return st.session_state.conversation_owner
+
+def start_conversation(conversation_id=None):
+    """新しい会話を開始する、または保存済みの会話を再開する
+
+    再開時は要約済みの位置以降と直近の表示分のみを読み込み、
+    それより古いメッセージは表示が必要になったときにストアから読み込む。
+    再開できるのは同じ所有者（conversation_owner）の会話だけ。
+    """
+    store = get_conversation_store()
+    owner = conversation_owner()
+    if conversation_id is not None and store.owner_of(conversation_id) != owner:
+        # 他の利用者の会話は再開しない
+        conversation_id = None
+    if conversation_id is None:
+        # ストアには最初のメッセージを保存するときに作成する（ページを開いただけでは記録しない）
+        offset, messages, summary_state = 0, [], {}
+    else:
+        total = store.count(conversation_id)
+        upto, summary = store.load_summary(conversation_id)
+        # 要約に含まれていないメッセージは文脈から外さない（次の応答時に要約へ畳み込む）
+        offset = max(min(upto, total - HISTORY_WINDOW), 0)
+        messages = store.load_range(conversation_id, offset, total)
+        summary_state = {"upto": max(upto - offset, 0), "text": summary} if summary else {}
+
+    st.session_state.conversation_id = conversation_id
+    st.session_state.message_offset = offset
+    st.session_state.messages = messages
+    st.session_state.context_summary = summary_state
+    st.session_state.history_window = HISTORY_WINDOW
+    st.session_state.history_version += 1
+    # 検索インデックスは最初に検索したときに作る
+    st.session_state.search_index = None
+    st.session_state.search_target = None
+    st.session_state.history_focus = None
+
+def append_message(message):
+    """履歴にメッセージを追加する
+
+    ストアへ即座に追記し、エクスポート等のキャッシュ判定用に履歴バージョンを進める。
+    検索インデックスが作成済みであれば、追加したメッセージだけを索引に加える。
+    """
+    store = get_conversation_store()
+    if st.session_state.conversation_id is None:
+        st.session_state.conversation_id = store.create_conversation(conversation_owner())
+    position = st.session_state.message_offset + len(st.session_state.messages)
+    store.append(st.session_state.conversation_id, message)
+    if st.session_state.search_index is not None:
+        st.session_state.search_index.add(position, message["content"])
+    st.session_state.messages.append(message)
+    st.session_state.history_version += 1
+    trim_messages()
+
+def trim_messages():
+    """要約済みの古いメッセージをセッションのメモリから外す（ストアには保存済み）"""
+    messages = st.session_state.messages
+    excess = min(len(messages) - MAX_MESSAGES_IN_MEMORY, st.session_state.context_summary.get("upto", 0))
+    if excess <= 0:
+        return
+    del messages[:excess]
+    st.session_state.context_summary["upto"] -= excess
+    st.session_state.message_offset += excess
+
+def save_context_summary():
+    """文脈の要約をストアに保存する（会話の再開時に再利用するため）"""
+    summary_state = st.session_state.context_summary
+    if summary_state.get("text"):
+        get_conversation_store().save_summary(
+            st.session_state.conversation_id,
+            st.session_state.message_offset + summary_state.get("upto", 0),
+            summary_state["text"]
+        )
+
+def get_search_index():
+    """会話全体の検索インデックスを返す（未作成ならストアから1度だけ作る）"""
+    if st.session_state.search_index is None:
+        index = SearchIndex()
+        for position, message in enumerate(get_conversation_store().iter_messages(st.session_state.conversation_id)):
+            index.add(position, message.get("content", ""))
+        st.session_state.search_index = index
+    return st.session_state.search_index
+
+def jump_to_message(position):
+    """次の描画で検索結果のメッセージとその前後を表示し、そこへスクロールする
+
+    直近の表示範囲は広げない（古いメッセージへ移動しても全件を読み込まないため）。
+    """
+    st.session_state.history_focus = position
+    st.session_state.search_target = position
+
+def back_to_latest():
+    """検索結果の表示をやめ、直近のメッセージの表示に戻る"""
+    st.session_state.history_focus = None
+    st.session_state.search_target = None
+
+def message_texts(positions):
+    """通し番号ごとのメッセージ本文（メモリ上に無いものはストアから1件ずつ読む）"""
+    offset = st.session_state.message_offset
+    messages = st.session_state.messages
+    texts = {}
+    for position in positions:
+        if offset <= position < offset + len(messages):
+            message = messages[position - offset]
+        else:
+            loaded = get_conversation_store().load_range(st.session_state.conversation_id, position, position + 1)
+            message = loaded[0] if loaded else {}
+        texts[position] = message.get("content", "")
+    return texts
+
+def render_search_results(query):
+    """検索結果を新しい・関連度の高い順に表示する（クリックでそのメッセージへ移動）"""
+    index = get_search_index()
+    started = time.perf_counter()
+    hits = index.search(query)
+    elapsed = time.perf_counter() - started
+    st.caption(f"{len(hits)}件（{elapsed * 1000:.2f} ms）")
+    # 索引は本文を持たないため、表示する件数分だけ本文を読み込む
+    texts = message_texts([position for position, _ in hits])
+    for position, _ in hits:
+        st.button(
+            snippet(texts.get(position, ""), query),
+            key=f"search_hit_{position}",
+            on_click=jump_to_message,
+            args=(position,),
+            use_container_width=True
+        )
+
+def load_display_messages(window):
+    """表示範囲のメッセージと、その先頭の通し番号を返す
+
+    表示範囲がメモリ上のメッセージより広い場合は、不足分をストアから読み込む。
+    """
+    messages = st.session_state.messages
+    offset = st.session_state.message_offset
+    if window <= len(messages) or offset == 0:
+        return offset, messages
+    older = get_conversation_store().load_range(
+        st.session_state.conversation_id, offset - (window - len(messages)), offset
+    )
+    return offset - len(older), older + messages
+
+def history_window_start(messages, window):
+    """完全に表示する直近メッセージの開始位置を返す（比較モードのグループは分割しない）"""
+    start = max(len(messages) - window, 0)
+    group = messages[start].get("compare_group") if start < len(messages) else None
+    while start > 0 and group is not None and messages[start - 1].get("compare_group") == group:
+        start -= 1
+    return start
+
+def render_history_stubs(end):
+    """表示範囲外の古いメッセージを「さらに表示」ボタンと折りたたんだ概要で表示する"""
+    if st.button(f"⬆️ 以前のメッセージをさらに表示（残り {end} 件）", key="load_older_messages"):
+        st.session_state.history_window += HISTORY_WINDOW
+        st.rerun()
+    # 概要は開いたときだけストアから読み込む
+    if st.toggle(f"📜 以前のメッセージ（{end} 件）の概要を表示", value=False, key="show_history_stubs"):
+        older = get_conversation_store().load_range(
+            st.session_state.conversation_id, end - STUB_LIMIT, end
+        )
+        # 1要素にまとめて送信量を抑える
+        lines = []
+        for message in older:
+            icon = "🧑" if message["role"] == "user" else "🤖"
+            preview = message["content"].replace("\n", " ")
+            if len(preview) > STUB_PREVIEW_CHARS:
+                preview = preview[:STUB_PREVIEW_CHARS] + "…"
+            lines.append(f"- {icon} {preview}")
+        st.markdown("\n".join(lines))
+
+def render_focused_messages(position, end):
+    """検索結果のメッセージの前後だけをストアから読み込んで表示する
+
+    Args:
+        position: 検索結果のメッセージの通し番号
+        end: 直近の表示範囲の先頭（これより後ろは通常どおり表示される）
+    """
+    st.button("⬇️ 最新のメッセージに戻る", key="back_to_latest", on_click=back_to_latest)
+    start = max(position - SEARCH_CONTEXT_MESSAGES, 0)
+    around = get_conversation_store().load_range(
+        st.session_state.conversation_id, start, min(position + SEARCH_CONTEXT_MESSAGES + 1, end)
+    )
+    if start > 0:
+        st.caption(f"… 以前のメッセージ {start} 件 …")
+    render_messages(start, around)
+    if start + len(around) < end:
+        st.caption(f"… {end - start - len(around)} 件 …")
+
+def render_messages(base, messages, i=0):
+    """messages[i:] を表示する（比較モードの応答は列に並べる）
+
+    Args:
+        base: messages[0] の通し番号
+        messages: 表示するメッセージのリスト
+        i: 表示を始める位置
+    """
+    while i < len(messages):
+        message = messages[i]
+        group = message.get("compare_group")
+        if group is None:
+            with st.chat_message(message["role"]):
+                render_message(message, base + i)
+            i += 1
+            continue
+
+        # 比較モードの応答は列に並べて表示
+        group_start = i
+        while i < len(messages) and messages[i].get("compare_group") == group:
+            i += 1
+        with st.chat_message("assistant"):
+            for column, index in zip(st.columns(i - group_start), range(group_start, i)):
+                with column:
+                    render_message(messages[index], base + index)
+
+def render_message(message, index):
+    """履歴の1メッセージを表示する"""
+    # 検索結果から移動してきた場合は、このメッセージまでスクロールする
+    if index == st.session_state.get("search_target"):
+        st.session_state.search_target = None
+        st.markdown(f'<div id="message-{index}"></div>', unsafe_allow_html=True)
+        st.caption("🔍 検索結果")
+        components.html(
+            f"<script>window.parent.document.getElementById('message-{index}')"
+            f".scrollIntoView({{behavior: 'smooth', block: 'start'}});</script>",
+            height=0
+        )
+
+    # メッセージを完全に表示
+    content = message["content"]
+    
+    st.markdown(content)
+    
+    # プレーンテキスト表示は開いたときだけ生成する（再実行ごとに全文を3重に送らないため）
+    if st.toggle("📄 完全なテキストを表示", value=False, key=f"raw_view_{index}"):
+        st.text(content)
+        # さらに確実にするため、生のテキストも表示
+        st.code(content, language=None)
+    
+    if message["role"] == "assistant":
+        # モデル情報を表示
+        model_info = message.get("model_info", "")
+        if model_info:
+            st.caption(f"🤖 {model_info}")
+        if message.get("truncated"):
+            st.caption("⏹️ 生成を途中で停止した応答です")
+        # 計測値を表示
+        params = message.get("params") or {}
+        if params.get("latency_sec") is not None:
+            parts = []
+            if params.get("ttft_sec") is not None:
+                parts.append(f"TTFT {params['ttft_sec']:.2f}s")
+            parts.append(f"合計 {params['latency_sec']:.2f}s")
+            if params.get("tokens_per_sec"):
+                parts.append(f"{params['tokens_per_sec']:.0f} tokens/s")
+            parts.append(f"トークン 入力 {params.get('prompt_tokens') or '-'}・出力 {params.get('completion_tokens') or '-'}")
+            if params.get("cached"):
+                parts.append("キャッシュ")
+            st.caption("⏱️ " + " / ".join(parts))
 
 def main():
     # タイトル
@@ -158,6 +645,12 @@ def main():
     </style>
     """, unsafe_allow_html=True)
 
+    # セッション状態の初期化
+    if "history_version" not in st.session_state:
+        st.session_state.history_version = 0
+    if "conversation_id" not in st.session_state:
+        start_conversation()
+
     # サイドバーでモデル選択
     with st.sidebar:
         st.header("⚙️ モデル設定")
@@ -191,38 +684,80 @@ def main():
         
         max_tokens = st.slider("最大トークン数", 100, 4000, 1000, 100)
 
+        # 複数モデルの比較モード
+        compare_mode = st.checkbox("🆚 比較モード", value=False, help="同じメッセージを複数のモデルに同時に送り、応答を並べて比較します")
+        compare_model_names = []
+        if compare_mode:
+            # 比較モードでは自動選択は使わない（実際のモデル同士を並べる）
+            compare_options = [name for name in model_options if MODELS[name]["id"] != AUTO_MODEL_ID]
+            compare_model_names = st.multiselect(
+                "比較するモデルを選択してください",
+                compare_options,
+                default=[selected_model_name] if selected_model_name in compare_options else [],
+                help="先頭のモデルの応答が以降の会話の文脈として使われます"
+            )
+
+        # 会話全体の全文検索
+        st.markdown("---")
+        st.subheader("🔍 履歴を検索")
+        search_query = st.text_input("キーワード", key="history_search", placeholder="例: 議事録、Python")
+        if search_query:
+            render_search_results(search_query)
+
+        # 保存済みの会話の再開
+        st.markdown("---")
+        st.subheader("🗂️ 会話履歴")
+        conversations = get_conversation_store().list_conversations(conversation_owner())
+        if conversations:
+            conversation_labels = {
+                c["id"]: f"{time.strftime('%m/%d %H:%M', time.localtime(c['updated']))} {c['title'] or '(無題)'}（{c['message_count']}件）"
+                for c in conversations
+            }
+            resume_id = st.selectbox(
+                "過去の会話",
+                list(conversation_labels.keys()),
+                format_func=lambda cid: conversation_labels.get(cid, cid),
+                key="resume_conversation_id"
+            )
+            if st.button("↩️ この会話を再開", key="resume_conversation"):
+                start_conversation(resume_id)
+                st.rerun()
+        else:
+            st.caption("保存された会話はまだありません")
+
+        # 同一リクエストの再送を避ける応答キャッシュ
+        use_cache = st.checkbox("🗂️ 応答キャッシュを使用", value=True, help="同じ履歴・設定での再質問はAPIを呼ばずに保存済みの応答を返します")
+        if use_cache:
+            cache = get_response_cache()
+            stats = cache.stats
+            st.caption(
+                f"キャッシュ: ヒット {stats['memory_hits'] + stats['disk_hits']} / "
+                f"ミス {stats['misses']}（ヒット率 {cache.hit_rate():.0%}）"
+            )
+
+        # API呼び出しの計測値（モデルごとのp50/p95）
+        render_diagnostics()
+
     # メインエリア
     st.subheader("💬 チャット")
 
-    # セッション状態の初期化
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-
-    # チャット履歴の表示
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            # メッセージを完全に表示
-            content = message["content"]
-            
-            # メッセージを複数の方法で表示（確実に完全表示）
-            st.markdown(content)
-            
-            # すべてのメッセージにプレーンテキスト表示を追加（確実に完全表示）
-            with st.expander("📄 完全なテキストを表示", expanded=False):
-                st.text(content)
-                # さらに確実にするため、生のテキストも表示
-                st.code(content, language=None)
-            
-            if message["role"] == "assistant":
-                # モデル情報を表示
-                model_info = message.get("model_info", "")
-                if model_info:
-                    st.caption(f"🤖 {model_info}")
+    # チャット履歴の表示（直近のメッセージのみ完全に表示）
+    base, messages = load_display_messages(st.session_state.history_window)
+    i = history_window_start(messages, st.session_state.history_window)
+    focus = st.session_state.history_focus
+    if focus is not None and focus < base + i:
+        # 表示範囲より古い検索結果は、その前後だけを表示する
+        render_focused_messages(focus, base + i)
+    elif base + i > 0:
+        render_history_stubs(base + i)
+    render_messages(base, messages, i)
 
     # ユーザー入力
     if prompt := st.chat_input("メッセージを入力してください..."):
+        # 次の描画からは直近のメッセージの表示に戻る
+        st.session_state.history_focus = None
         # 入力メッセージにタイムスタンプを付与
-        st.session_state.messages.append({
+        append_message({
             "role": "user",
             "content": prompt,
             "ts": int(time.time())
@@ -230,149 +765,179 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # OpenAI APIを使用して応答を生成
-        with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            full_response = ""
-            
-            try:
-                # モデル固有のパラメータ設定
-                api_params = {
-                    "model": selected_model["id"],
-                    "messages": [
-                    {"role": m["role"], "content": m["content"]}
-                    for m in st.session_state.messages
-                ],
-                }
-                
-                # ストリーミング設定
-                api_params["stream"] = True
-                
-                # モデル固有のパラメータ設定
-                if selected_model["id"].startswith("o1"):
-                    # o1系はtemperatureとmax_tokensを設定しない
-                    pass
-                elif selected_model["id"].startswith("gpt-5"):
-                    # GPT-5系はパラメータ制限あり
-                    api_params["temperature"] = 1.0
-                    api_params["max_completion_tokens"] = max_tokens
+        # トークン予算内に収めた履歴（エラーは除外、古いターンは要約）
+        cache = get_response_cache() if use_cache else None
+
+        if compare_mode and compare_model_names:
+            # 比較モード: 最も小さい予算に合わせて共通の文脈を作る
+            primary = MODELS[compare_model_names[0]]
+            with st.chat_message("assistant"):
+                try:
+                    context = build_context(
+                        st.session_state.messages,
+                        primary["id"],
+                        min(MODELS[name]["context_budget"] for name in compare_model_names),
+                        st.session_state.context_summary,
+                        lambda previous, folded: summarize_history(primary["id"], previous, folded),
+                        summary_role="user" if any(MODELS[name]["id"].startswith("o1") for name in compare_model_names) else "system"
+                    )
+                    save_context_summary()
+                    results = run_comparison(compare_model_names, context, temperature, max_tokens, cache)
+                except Exception as e:
+                    st.error(f"❌ エラーが発生しました: {str(e)}")
+                    results = [("", {}, e) for _ in compare_model_names]
+
+            append_comparison(compare_model_names, results, temperature, max_tokens)
+        else:
+            # OpenAI APIを使用して応答を生成
+            with st.chat_message("assistant"):
+                message_placeholder = st.empty()
+                status_placeholder = st.empty()
+                stop_placeholder = st.empty()
+                full_response = ""
+
+                # 自動選択では予想応答時間の短い順に候補を並べる
+                routed = selected_model["id"] == AUTO_MODEL_ID
+                if routed:
+                    # 今回の入力だけでなく、要約と直近の履歴を含めて送信する文脈の長さで選ぶ
+                    prompt_tokens = context_tokens(
+                        st.session_state.messages, "gpt-4o", st.session_state.context_summary,
+                        selected_model["context_budget"]
+                    )
+                    candidates = get_router().route(prompt_tokens, estimate_output_tokens(prompt, max_tokens))
                 else:
-                    # その他のモデルは従来通り
-                    api_params["temperature"] = temperature
-                    api_params["max_tokens"] = max_tokens
-                
-                # API呼び出し
-                response_stream = client.chat.completions.create(**api_params)
-                
-                for response in response_stream:
-                    if response.choices[0].delta.content:
-                        full_response += response.choices[0].delta.content
-                message_placeholder.markdown(full_response + "▌")
-                
-                message_placeholder.markdown(full_response)
-                
-                # メッセージにモデル情報・利用パラメータ・タイムスタンプを追加
-                used_params = {
-                    "model": selected_model["id"],
-                    # GPT-5系はmax_completion_tokens、それ以外はmax_tokensを採用
-                    "temperature": 1.0 if selected_model["id"].startswith("gpt-5") else (
-                        None if selected_model["id"].startswith("o1") else temperature
-                    ),
-                    "max_tokens": None if selected_model["id"].startswith("gpt-5") else (
-                        None if selected_model["id"].startswith("o1") else max_tokens
-                    ),
-                    "max_completion_tokens": max_tokens if selected_model["id"].startswith("gpt-5") else None,
-                }
-
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": full_response,
-                    "model_info": selected_model_name,
-                    "params": used_params,
-                    "ts": int(time.time())
-                })
-                
-            except Exception as e:
-                error_msg = f"❌ エラーが発生しました: {str(e)}"
-                message_placeholder.error(error_msg)
-                
-                # モデルが存在しない場合の特別な処理
-                if "does not exist" in str(e) or "model_not_found" in str(e):
-                    st.warning(f"⚠️ モデル '{selected_model['id']}' が見つかりません。別のモデルを選択してください。")
-                    st.info("💡 推奨モデル: GPT-4o, GPT-4o-mini, o1-mini, GPT-4-turbo, GPT-3.5-turbo")
-                elif "rate_limit" in str(e).lower():
-                    st.warning("⚠️ レート制限に達しました。しばらく待ってから再試行してください。")
-                elif "insufficient_quota" in str(e).lower():
-                    st.warning("⚠️ APIクォータが不足しています。アカウント設定を確認してください。")
-                
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": error_msg,
-                    "model_info": selected_model_name,
-                    "params": {"model": selected_model["id"]},
-                    "ts": int(time.time())
-                })
+                    candidates = [selected_model["id"]]
+                served_id = candidates[0]
+
+                # 停止ボタンで再実行されると描画中に中断されるので、接続を閉じて途中までの応答を残す
+                cancel = CancelToken()
+                stop_placeholder.button("⏹️ 生成を停止", key="stop_generation")
+                renderer = None
+                stats = {}
+
+                try:
+                    for attempt, served_id in enumerate(candidates):
+                        served_model = MODELS[MODEL_NAMES_BY_ID[served_id]]
+                        api_params = build_api_params(
+                            served_id,
+                            build_context(
+                                st.session_state.messages,
+                                served_id,
+                                served_model["context_budget"],
+                                st.session_state.context_summary,
+                                lambda previous, folded: summarize_history(served_id, previous, folded),
+                                summary_role="user" if served_id.startswith("o1") else "system"
+                            ),
+                            temperature,
+                            max_tokens
+                        )
+                        save_context_summary()
+
+                        # API呼び出し（キャッシュヒット時は保存済みの応答をストリームとして再生）
+                        # 受信はワーカースレッドで行い、待機中も経過時間を表示して停止要求を受け付ける
+                        stats = {}
+                        renderer = ThrottledRenderer(message_placeholder)
+                        show_waiting = status_heartbeat(status_placeholder, "応答を生成中")
+
+                        def heartbeat():
+                            renderer.tick()
+                            # 応答が届き始めたら待機表示を消す
+                            if renderer.text:
+                                status_placeholder.empty()
+                            else:
+                                show_waiting()
+
+                        # 次の候補がある場合、レート制限等は再試行で待たずにすぐ次の候補へ切り替える
+                        fail_fast = FALLBACK_STATUS_CODES if attempt < len(candidates) - 1 else ()
+                        response_stream = iter_cancellable(
+                            lambda: stream_completion(
+                                get_client(), api_params, cache, stats=stats, cancel=cancel, fail_fast_status=fail_fast
+                            ),
+                            cancel,
+                            heartbeat=heartbeat,
+                            interval=renderer.interval
+                        )
+
+                        # 一定間隔・一定文字数ごとに間引いて逐次描画
+                        try:
+                            full_response = renderer.consume(response_stream)
+                        except Exception as e:
+                            # 応答が始まる前のモデル不在・レート制限は次の候補で再送する
+                            if renderer.text or attempt == len(candidates) - 1 or not is_fallback_error(e):
+                                raise
+                            get_router().mark_failure(served_id, e)
+                            st.caption(f"⚠️ {served_id} が利用できないため、{candidates[attempt + 1]} に切り替えます")
+                            continue
+                        break
+                    stats["render_sec"] = renderer.render_sec
+                    status_placeholder.empty()
+                    stop_placeholder.empty()
+
+                    append_message(assistant_message(served_id, full_response, stats, temperature, max_tokens, routed))
+
+                except Exception as e:
+                    error_msg = f"❌ エラーが発生しました: {str(e)}"
+                    message_placeholder.error(error_msg)
+                    status_placeholder.empty()
+                    stop_placeholder.empty()
+
+                    # モデルが存在しない場合の特別な処理
+                    if "does not exist" in str(e) or "model_not_found" in str(e):
+                        st.warning(f"⚠️ モデル '{served_id}' が見つかりません。別のモデルを選択してください。")
+                        st.info("💡 推奨モデル: GPT-4o, GPT-4o-mini, o1-mini, GPT-4-turbo, GPT-3.5-turbo")
+                    elif "rate_limit" in str(e).lower():
+                        st.warning("⚠️ レート制限に達しました。しばらく待ってから再試行してください。")
+                    elif "insufficient_quota" in str(e).lower():
+                        st.warning("⚠️ APIクォータが不足しています。アカウント設定を確認してください。")
+
+                    append_message({
+                        "role": "assistant",
+                        "content": error_msg,
+                        "model_info": selected_model_name,
+                        "params": {"model": served_id},
+                        "ts": int(time.time())
+                    })
+                except BaseException:
+                    # 停止ボタン・再実行による中断（Streamlitの制御例外）は接続を閉じてから伝播する
+                    cancel.cancel()
+                    if renderer is not None and renderer.text:
+                        append_message(assistant_message(
+                            served_id, renderer.text, stats, temperature, max_tokens, routed, truncated=True
+                        ))
+                    raise
 
     # チャット履歴管理
     if st.session_state.messages:
         col1, col2 = st.columns([1, 1])
         with col1:
-            if st.button("🗑️ 履歴をクリア"):
-                st.session_state.messages = []
+            if st.button("🗑️ 履歴をクリア", help="新しい会話を開始します（これまでの会話はサイドバーから再開できます）"):
+                start_conversation()
                 st.rerun()
         with col2:
-            if st.button("💾 履歴をエクスポート"):
-                # エクスポート形式選択を表示
-                export_format = st.selectbox("エクスポート形式", ["CSV", "JSONL"], index=0, key="export_format")
-                
-                if export_format == "CSV":
-                    # 比較しやすい縦持ちCSV: index,ts,role,model,temperature,max_tokens,max_completion_tokens,content
-                    import csv
-                    from io import StringIO
-                    buffer = StringIO()
-                    writer = csv.writer(buffer)
-                    writer.writerow(["index", "ts", "role", "model", "temperature", "max_tokens", "max_completion_tokens", "content"])
-                    for i, msg in enumerate(st.session_state.messages):
-                        params = msg.get("params", {})
-                        model = params.get("model", msg.get("model_info", ""))
-                        writer.writerow([
-                            i,
-                            msg.get("ts", ""),
-                            msg.get("role", ""),
-                            model,
-                            params.get("temperature", ""),
-                            params.get("max_tokens", ""),
-                            params.get("max_completion_tokens", ""),
-                            msg.get("content", "").replace("\n", " ")
-                        ])
-                    data = buffer.getvalue()
-                    st.download_button(
-                        label="📥 CSVダウンロード",
-                        data=data,
-                        file_name=f"chat_history_{int(time.time())}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    # JSONL: 1行1メッセージ（比較のための完全情報）
-                    import json
-                    lines = []
-                    for i, msg in enumerate(st.session_state.messages):
-                        record = {
-                            "index": i,
-                            "ts": msg.get("ts"),
-                            "role": msg.get("role"),
-                            "model_info": msg.get("model_info"),
-                            "params": msg.get("params"),
-                            "content": msg.get("content"),
-                        }
-                        lines.append(json.dumps(record, ensure_ascii=False))
-                    data = "\n".join(lines)
-                    st.download_button(
-                        label="📥 JSONLダウンロード",
-                        data=data,
-                        file_name=f"chat_history_{int(time.time())}.jsonl",
-                        mime="application/jsonl"
-                    )
+            # エクスポート形式選択
+            export_format = st.selectbox("エクスポート形式", list(EXPORT_FORMATS.keys()), index=0, key="export_format")
+            compress = st.checkbox("gzipで圧縮する", value=False, key="export_gzip")
+
+            # 履歴が変わっていなければ前回生成したファイルを再利用
+            if "export_cache" not in st.session_state:
+                st.session_state.export_cache = {}
+            version = st.session_state.history_version
+            data = get_cached_export(st.session_state.export_cache, version, export_format, compress)
+            if data is None and st.button("💾 履歴をエクスポート"):
+                with st.spinner("エクスポートファイルを作成中..."):
+                    # メモリ外の古いメッセージも含めてストアから順に読み込む
+                    store = get_conversation_store()
+                    data = build_export(store.iter_messages(st.session_state.conversation_id), export_format, compress)
+                cache_export(st.session_state.export_cache, version, export_format, compress, data)
+
+            if data is not None:
+                file_name, mime = export_file_info(export_format, compress, int(time.time()))
+                st.download_button(
+                    label=f"📥 {export_format}ダウンロード",
+                    data=data,
+                    file_name=file_name,
+                    mime=mime
+                )
 
 # スクリプトが直接実行された場合にmainを呼び出す
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+import io
+import csv
+import gzip
+import json
+
+# ==========================
+#  エクスポート設定
+# ==========================
+CSV_HEADER = ["index", "ts", "role", "model", "temperature", "max_tokens", "max_completion_tokens",
+              "ttft_sec", "latency_sec", "prompt_tokens", "completion_tokens", "content"]
+GZIP_LEVEL = 6
+
+
+def iter_csv_lines(messages):
+    """比較しやすい縦持ちCSVを1行ずつ返す
+
+    列: index,ts,role,model,temperature,max_tokens,max_completion_tokens,
+        ttft_sec,latency_sec,prompt_tokens,completion_tokens,content
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    writer.writerow(CSV_HEADER)
+    yield take()
+    for i, msg in enumerate(messages):
+        params = msg.get("params") or {}
+        model = params.get("model", msg.get("model_info", ""))
+        writer.writerow([
+            i,
+            msg.get("ts", ""),
+            msg.get("role", ""),
+            model,
+            params.get("temperature", ""),
+            params.get("max_tokens", ""),
+            params.get("max_completion_tokens", ""),
+            params.get("ttft_sec", ""),
+            params.get("latency_sec", ""),
+            params.get("prompt_tokens", ""),
+            params.get("completion_tokens", ""),
+            msg.get("content", "").replace("\n", " ")
+        ])
+        yield take()
+
+
+def iter_jsonl_lines(messages):
+    """JSONL（1行1メッセージ、比較のための完全情報）を1行ずつ返す"""
+    for i, msg in enumerate(messages):
+        record = {
+            "index": i,
+            "ts": msg.get("ts"),
+            "role": msg.get("role"),
+            "model_info": msg.get("model_info"),
+            "params": msg.get("params"),
+            "truncated": msg.get("truncated", False),
+            "content": msg.get("content"),
+        }
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+EXPORT_FORMATS = {
+    "CSV": {"lines": iter_csv_lines, "extension": "csv", "mime": "text/csv"},
+    "JSONL": {"lines": iter_jsonl_lines, "extension": "jsonl", "mime": "application/jsonl"},
+}
+
+
+def write_export(lines, fileobj, compress=False):
+    """行のイテラブルをUTF-8でファイルへ逐次書き込む（compress=Trueでgzip圧縮）"""
+    if compress:
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as gz:
+            for line in lines:
+                gz.write(line.encode("utf-8"))
+    else:
+        for line in lines:
+            fileobj.write(line.encode("utf-8"))
+
+
+def build_export(messages, export_format, compress=False):
+    """エクスポートファイルの内容をバイト列で返す"""
+    buffer = io.BytesIO()
+    write_export(EXPORT_FORMATS[export_format]["lines"](messages), buffer, compress)
+    return buffer.getvalue()
+
+
+def export_file_info(export_format, compress, ts):
+    """ダウンロード用のファイル名とMIMEタイプを返す"""
+    info = EXPORT_FORMATS[export_format]
+    file_name = f"chat_history_{ts}.{info['extension']}"
+    if compress:
+        return file_name + ".gz", "application/gzip"
+    return file_name, info["mime"]
+
+
+def get_cached_export(cache, version, export_format, compress):
+    """履歴バージョンが同じ場合のみキャッシュ済みのエクスポートを返す"""
+    if cache.get("key") == (version, export_format, compress):
+        return cache["data"]
+    return None
+
+
+def cache_export(cache, version, export_format, compress, data):
+    """エクスポート結果を履歴バージョンと合わせて保持する（最新の1件のみ）"""
+    cache.clear()
+    cache.update({"key": (version, export_format, compress), "data": data})
@@ -0,0 +1,129 @@
+import re
+import math
+import heapq
+import unicodedata
+from collections import Counter, defaultdict
+
+# ==========================
+#  検索設定
+# ==========================
+NGRAM_SIZE = 2          # 日本語でも単語分割なしで検索できるよう文字bigramで索引を作る
+SEARCH_LIMIT = 10       # 表示する検索結果の件数
+SNIPPET_CHARS = 60      # 検索結果に表示する前後の文字数
+MAX_CANDIDATES = 200    # スコア計算する候補の上限（多い場合は新しいメッセージを優先）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """全角・半角や大文字・小文字の違いを吸収する"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """正規化済みテキストの文字n-gram（空白をまたぐものは除く）を返す
+
+    n文字未満の語は、その語自体を1つのトークンとして扱う。
+    """
+    grams = []
+    for word in text.split(" "):
+        if not word:
+            continue
+        if len(word) < n:
+            grams.append(word)
+            continue
+        grams.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return grams
+
+
+class SearchIndex:
+    """メッセージ本文の転置インデックス
+
+    追加時にn-gramごとの出現回数を記録しておき、検索時は
+    クエリのn-gramをすべて含むメッセージだけを転置リストから求めて
+    BM25でスコア付けする（全メッセージの本文は走査しない）。
+    1文字のクエリにも対応できるよう、各文字も索引に含める。
+    本文は保持しないため、スニペットは表示する件数分だけ呼び出し側で本文を読んで作る。
+
+    Args:
+        n: n-gramの文字数
+    """
+
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self._postings = defaultdict(dict)   # トークン -> {メッセージ位置: 出現回数}（位置の追加順）
+        self._lengths = {}                   # メッセージ位置 -> n-gram数
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def _tokens(self, text):
+        normalized = normalize(text)
+        grams = ngrams(normalized, self.n)
+        counts = Counter(grams)
+        if self.n > 1:
+            # n文字以上の語は各文字も索引する（n文字未満の語は語自体がトークンになっている）
+            counts.update(char for word in normalized.split(" ") if len(word) >= self.n for char in word)
+        return counts, len(grams)
+
+    def add(self, position, text):
+        """メッセージを索引に追加する（同じ位置を再追加した場合は置き換える）"""
+        if position in self._lengths:
+            self.remove(position)
+        counts, length = self._tokens(text)
+        for token, count in counts.items():
+            self._postings[token][position] = count
+        self._lengths[position] = length
+        self._total_length += length
+
+    def remove(self, position):
+        """メッセージを索引から取り除く（本文を持たないため全トークンの転置リストから探す）"""
+        length = self._lengths.pop(position, None)
+        if length is None:
+            return
+        for token in [token for token, postings in self._postings.items() if position in postings]:
+            postings = self._postings[token]
+            del postings[position]
+            if not postings:
+                del self._postings[token]
+        self._total_length -= length
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """クエリに一致するメッセージを (位置, スコア) のスコア順リストで返す"""
+        grams = list(dict.fromkeys(ngrams(normalize(query), self.n)))
+        if not grams or not self._lengths:
+            return []
+        postings = sorted((self._postings.get(gram, {}) for gram in grams), key=len)
+        rest = postings[1:]
+
+        # 最も短い転置リストを新しい順にたどり、すべてのn-gramを含むものを候補にする
+        candidates = []
+        for position in reversed(postings[0]):
+            if all(position in matches for matches in rest):
+                candidates.append(position)
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+
+        total = len(self._lengths)
+        average_length = self._total_length / total or 1
+        idfs = [math.log(1 + (total - len(m) + 0.5) / (len(m) + 0.5)) for m in postings]
+
+        def score(position):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[position] / average_length)
+            return sum(idf * m[position] * (BM25_K1 + 1) / (m[position] + norm) for idf, m in zip(idfs, postings))
+
+        # 同じスコアなら新しいメッセージを優先
+        return heapq.nlargest(limit, ((position, score(position)) for position in candidates),
+                              key=lambda hit: (hit[1], hit[0]))
+
+
+def snippet(text, query, width=SNIPPET_CHARS):
+    """検索結果に表示する、一致箇所の前後の抜粋"""
+    flat = _SPACES.sub(" ", text or "")
+    found = normalize(flat).find(normalize(query).strip())
+    start = max(found - width // 2, 0) if found >= 0 else 0
+    excerpt = flat[start:start + width]
+    return ("…" if start > 0 else "") + excerpt + ("…" if start + width < len(flat) else "")
@@ -0,0 +1,308 @@
+import io
+import os
+import mmap
+import bisect
+import difflib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cancellation import with_script_context
+
+# ==========================
+#  分割文字起こし設定
+# ==========================
+MAX_CHUNK_BYTES = 20 * 1024 * 1024  # 1チャンクの上限（Whisper APIの25MB制限に余裕を持たせる）
+TARGET_CHUNK_SEC = 300              # 1チャンクの目安の長さ
+BOUNDARY_WINDOW_SEC = 30            # 目安の位置から前後この範囲で区切りやすい位置を探す
+OVERLAP_SEC = 2.0                   # 隣接チャンクと重ねる長さ（区切り位置の語の欠落を防ぐ）
+MAX_WORKERS = 4                     # 同時にアップロードするチャンク数
+MIN_GAP_SEC = 0.3                   # 区切り候補とみなす発話間の無音の長さ
+SILENCE_WINDOW_SEC = 0.05           # 無音検出でRMSを計算する窓の長さ
+SILENCE_RMS = 0.01                  # これ未満のRMSを無音とみなす
+MIN_SILENCE_SEC = 0.5               # 区切り候補とみなす無音の長さ
+STITCH_WINDOW_CHARS = 200           # 重なり部分を探す範囲（前のチャンクの末尾・次のチャンクの先頭）
+MIN_OVERLAP_CHARS = 6               # 重複とみなす一致の最小文字数
+STITCH_SLACK_CHARS = 20             # 一致部分と前のチャンクの末尾・次のチャンクの先頭との許容する隔たり
+
+# MPEGオーディオのフレームヘッダー（kbps・Hz）
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+class Mp3Frames:
+    """MP3ファイルのフレーム位置と開始時刻
+
+    デコードせずにフレームヘッダーだけを読むため、フレーム境界で
+    音声を切り出してもそのままWhisper APIに送れる。
+
+    Attributes:
+        offsets: 各フレームの先頭バイト位置（末尾に終端位置を追加）
+        starts: 各フレームの開始時刻（秒、末尾に全体の長さを追加）
+    """
+
+    def __init__(self, offsets, starts):
+        self.offsets = offsets
+        self.starts = starts
+
+    @property
+    def duration(self):
+        return self.starts[-1]
+
+    @property
+    def size(self):
+        return self.offsets[-1] - self.offsets[0]
+
+    def _first_frame(self, start_sec):
+        return max(bisect.bisect_right(self.starts, start_sec) - 1, 0)
+
+    def byte_range(self, start_sec, end_sec):
+        """時刻の範囲を含むフレームのバイト範囲 (start, end) を返す"""
+        last = min(bisect.bisect_left(self.starts, end_sec), len(self.offsets) - 1)
+        return self.offsets[self._first_frame(start_sec)], self.offsets[last]
+
+    def frame_start(self, start_sec):
+        """start_secを含むフレームの開始時刻（切り出した音声の先頭の時刻）"""
+        return self.starts[self._first_frame(start_sec)]
+
+
+def _frame_info(data, i):
+    """位置iのフレームヘッダーを読み、(フレーム長, 秒数) を返す（ヘッダーでなければNone）"""
+    if data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (data[i + 1] >> 3) & 0x03
+    layer_bits = (data[i + 1] >> 1) & 0x03
+    bitrate_index = data[i + 2] >> 4
+    rate_index = (data[i + 2] >> 2) & 0x03
+    padding = (data[i + 2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384 / sample_rate
+    samples = 576 if layer == 3 and version != 1 else 1152
+    return samples // 8 * bitrate // sample_rate + padding, samples / sample_rate
+
+
+def parse_mp3_frames(data):
+    """MP3データ（bytesやmmap）のフレーム位置を読み取る"""
+    i = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2タグを読み飛ばす（サイズは7bitずつのsynchsafe整数）
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        i = 10 + size + (10 if data[5] & 0x10 else 0)
+    offsets, starts = [], []
+    elapsed = 0.0
+    end = len(data)
+    frame_end = i
+    while i + 4 <= end:
+        info = _frame_info(data, i)
+        if info is None or info[0] <= 0 or i + info[0] > end:
+            # 同期が外れている箇所は1バイトずつ読み進める
+            i += 1
+            continue
+        offsets.append(i)
+        starts.append(elapsed)
+        i += info[0]
+        elapsed += info[1]
+        frame_end = i
+    offsets.append(frame_end)
+    starts.append(elapsed)
+    return Mp3Frames(offsets, starts)
+
+
+def boundaries_from_turns(turns, min_gap=MIN_GAP_SEC):
+    """話者分離の区間 (開始秒, 終了秒, 話者) から区切り候補（発話間の無音の中央・話者の交代位置）を返す"""
+    turns = sorted(tuple(turn) for turn in turns)
+    boundaries = []
+    latest_end = None
+    previous_speaker = None
+    for start, end, speaker in turns:
+        if latest_end is not None:
+            if start - latest_end >= min_gap:
+                boundaries.append((latest_end + start) / 2)
+            elif speaker != previous_speaker and start >= latest_end:
+                boundaries.append(start)
+        latest_end = end if latest_end is None else max(latest_end, end)
+        previous_speaker = speaker
+    return boundaries
+
+
+def silent_windows(samples, sample_rate, threshold=SILENCE_RMS, window=SILENCE_WINDOW_SEC):
+    """モノラルPCM（-1.0〜1.0のnumpy配列）を一定時間の窓に分け、各窓が無音かどうかを返す
+
+    末尾の窓に満たないサンプルは無視するため、長い音声を分割して渡す場合は
+    窓の長さの倍数ずつ渡す。
+    """
+    import numpy as np
+
+    hop = max(int(round(sample_rate * window)), 1)
+    count = len(samples) // hop
+    frames = np.asarray(samples[:count * hop], dtype=np.float32).reshape(count, hop)
+    return np.sqrt(np.mean(frames * frames, axis=1)) < threshold
+
+
+def silence_midpoints(silent, window=SILENCE_WINDOW_SEC, min_silence=MIN_SILENCE_SEC):
+    """窓ごとの無音判定から、min_silence以上続く無音区間の中央の時刻を返す"""
+    boundaries = []
+    run_start = None
+    for index, is_silent in enumerate(list(silent) + [False]):
+        if is_silent and run_start is None:
+            run_start = index
+        elif not is_silent and run_start is not None:
+            if (index - run_start) * window >= min_silence:
+                boundaries.append((run_start + index) / 2 * window)
+            run_start = None
+    return boundaries
+
+
+def detect_silences(samples, sample_rate, threshold=SILENCE_RMS, min_silence=MIN_SILENCE_SEC,
+                    window=SILENCE_WINDOW_SEC):
+    """モノラルPCM（-1.0〜1.0のnumpy配列）から無音区間の中央の時刻を返す"""
+    return silence_midpoints(silent_windows(samples, sample_rate, threshold, window), window, min_silence)
+
+
+def plan_chunks(duration, boundaries=(), target_sec=TARGET_CHUNK_SEC, window_sec=BOUNDARY_WINDOW_SEC,
+                overlap_sec=OVERLAP_SEC):
+    """チャンクの (開始秒, 終了秒) のリストを返す
+
+    目安の長さごとに、その前後window_secの範囲で最も近い区切り候補
+    （無音・話者の交代位置）で区切る。候補が無ければ目安の位置で区切る。
+    隣接チャンクとはoverlap_secずつ重ねる。
+    """
+    window_sec = min(window_sec, target_sec / 10)
+    boundaries = sorted(b for b in boundaries if 0 < b < duration)
+    cuts = [0.0]
+    while duration - cuts[-1] > target_sec + window_sec:
+        desired = cuts[-1] + target_sec
+        lo = bisect.bisect_left(boundaries, desired - window_sec)
+        hi = bisect.bisect_right(boundaries, desired + window_sec)
+        nearby = boundaries[lo:hi]
+        cuts.append(min(nearby, key=lambda b: abs(b - desired)) if nearby else desired)
+    cuts.append(duration)
+    return [
+        (max(start - overlap_sec, 0.0) if i > 0 else 0.0, min(end + overlap_sec, duration))
+        for i, (start, end) in enumerate(zip(cuts, cuts[1:]))
+    ]
+
+
+def stitch(texts, window=STITCH_WINDOW_CHARS, min_overlap=MIN_OVERLAP_CHARS):
+    """チャンクごとの文字起こしを結合し、重なり部分で重複した文字列を取り除く
+
+    前のチャンクの末尾と次のチャンクの先頭で最も長く一致する部分を探し、
+    一致が十分に長く、かつ両チャンクの境目の近くにあれば、前のチャンクは
+    その手前まで・次のチャンクはそこから使う。
+    """
+    result = ""
+    for text in texts:
+        text = text.strip()
+        if not result or not text:
+            result = result or text
+            continue
+        tail = result[-window:]
+        head = text[:window]
+        match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+            0, len(tail), 0, len(head)
+        )
+        anchored = (len(tail) - match.a - match.size <= STITCH_SLACK_CHARS
+                    and match.b <= STITCH_SLACK_CHARS)
+        if match.size >= min_overlap and anchored:
+            result = result[:len(result) - len(tail) + match.a] + text[match.b:]
+        else:
+            result = result + "\n" + text
+    return result
+
+
+def merge_segments(chunk_segments, offsets, cuts):
+    """チャンクごとのセグメントを全体の時刻に直して1つのリストにする
+
+    重なり部分のセグメントは、中央の時刻が区切り位置のどちら側にあるかで
+    どちらか一方のチャンクのものだけを使う。
+
+    Args:
+        chunk_segments: チャンクごとのセグメント（チャンク先頭からの時刻）のリスト
+        offsets: 各チャンクの先頭の時刻
+        cuts: 隣接チャンクの区切り位置（チャンク数 - 1 個）
+    """
+    bounds = [float("-inf")] + list(cuts) + [float("inf")]
+    merged = []
+    for index, segments in enumerate(chunk_segments):
+        for segment in segments:
+            start = segment["start"] + offsets[index]
+            end = segment["end"] + offsets[index]
+            if bounds[index] <= (start + end) / 2 < bounds[index + 1]:
+                merged.append({"start": start, "end": end, "text": segment["text"]})
+    return merged
+
+
+def transcribe_chunks(audio_path, transcribe, boundaries=(), max_workers=MAX_WORKERS, on_progress=None,
+                      target_sec=TARGET_CHUNK_SEC, overlap_sec=OVERLAP_SEC):
+    """長い音声をチャンクに分けて並行に文字起こしし、結合した結果を返す
+
+    結果は {"text": 全体のテキスト, "segments": [{"start", "end", "text"}, ...]} の形式で、
+    セグメントの時刻は音声全体の先頭からの秒数。
+
+    Args:
+        audio_path: MP3ファイルのパス
+        transcribe: (ファイル名, MP3のバイト列) を受け取り、{"text", "segments"} を返す関数
+            （セグメントの時刻はチャンクの先頭から）
+        boundaries: 区切り候補の時刻（無音・話者の交代位置）
+        max_workers: 同時にアップロードするチャンク数
+        on_progress: (完了数, 全チャンク数) を受け取る関数（呼び出し元のスレッドで呼ばれる）
+    """
+    if os.path.getsize(audio_path) == 0:
+        return {"text": "", "segments": []}
+    with open(audio_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        frames = parse_mp3_frames(data)
+        if frames.duration > 0:
+            # 1チャンクがアップロード上限を超えないよう、ビットレートから長さを制限する
+            bytes_per_sec = frames.size / frames.duration
+            # （区切り候補を探す範囲の分だけ目安より長くなることがある）
+            target_sec = min(target_sec, (MAX_CHUNK_BYTES / bytes_per_sec - 2 * overlap_sec) / 1.1)
+            chunks = plan_chunks(frames.duration, boundaries, target_sec, overlap_sec=overlap_sec)
+            ranges = [frames.byte_range(start, end) for start, end in chunks]
+            offsets = [frames.frame_start(start) for start, _ in chunks]
+            # 重なり部分の中央（重ねる前の区切り位置）
+            cuts = [(previous[1] + following[0]) / 2 for previous, following in zip(chunks, chunks[1:])]
+        else:
+            # MP3のフレームが見つからない場合は分割せずにそのまま送る
+            ranges, offsets, cuts = [(0, len(data))], [0.0], []
+
+        results = [None] * len(ranges)
+        @with_script_context
+        def work(index):
+            start, end = ranges[index]
+            return transcribe(f"chunk_{index:04d}.mp3", data[start:end])
+
+        if on_progress is not None:
+            on_progress(0, len(ranges))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ranges)))) as executor:
+            futures = {executor.submit(work, index): index for index in range(len(ranges))}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    results[futures[future]] = future.result()
+                    if on_progress is not None:
+                        on_progress(done, len(ranges))
+            except BaseException:
+                # 失敗・中断時は未開始のチャンクを送らない
+                for future in futures:
+                    future.cancel()
+                raise
+    return {
+        "text": stitch([result["text"] for result in results]),
+        "segments": merge_segments([result["segments"] for result in results], offsets, cuts),
+    }
+
+
+def as_upload(name, data):
+    """バイト列をファイル名付きのファイルオブジェクトにする（APIがファイル形式を判別するため）"""
+    upload = io.BytesIO(data)
+    upload.name = name
+    return upload
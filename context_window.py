@@ -0,0 +1,135 @@
+# ==========================
+#  コンテキスト管理設定
+# ==========================
+MESSAGE_OVERHEAD_TOKENS = 4  # role等のメッセージ毎のオーバーヘッド
+SUMMARY_TARGET_RATIO = 0.6   # 要約時は予算のこの割合まで直近履歴を縮める
+ERROR_PREFIX = "❌"
+SUMMARY_PREFIX = "これまでの会話の要約:\n"
+
+_encodings = {}
+
+
+def _get_encoding(model_id):
+    """モデルに対応するtiktokenのエンコーディングを返す（無ければNone）"""
+    if model_id not in _encodings:
+        try:
+            # 起動を速くするため、最初にトークン数を数えるときに読み込む
+            import tiktoken
+            try:
+                _encodings[model_id] = tiktoken.encoding_for_model(model_id)
+            except KeyError:
+                _encodings[model_id] = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktokenが無い・エンコーディング定義を取得できない場合（オフライン等）は概算にフォールバック
+            _encodings[model_id] = None
+    return _encodings[model_id]
+
+
+def count_tokens(text, model_id):
+    """テキストのトークン数を数える
+
+    tiktokenが利用できない場合は、ASCIIは4文字で1トークン、
+    日本語などの非ASCII文字は1文字1トークンとして概算する。
+    """
+    encoding = _get_encoding(model_id)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def message_tokens(message, model_id):
+    """メッセージのトークン数を返す（結果はメッセージ辞書にキャッシュする）"""
+    cache = message.setdefault("token_counts", {})
+    if model_id not in cache:
+        cache[model_id] = count_tokens(message.get("content", ""), model_id) + MESSAGE_OVERHEAD_TOKENS
+    return cache[model_id]
+
+
+def is_error_message(message):
+    """保存されたエラーメッセージかどうか"""
+    return message.get("role") == "assistant" and message.get("content", "").startswith(ERROR_PREFIX)
+
+
+def _usable(items):
+    # 比較モードで文脈に採用しなかった応答も除外する
+    return [m for m in items
+            if m.get("role") != "system" and not is_error_message(m) and not m.get("compare_alternate")]
+
+
+def context_tokens(messages, model_id, state, budget=None):
+    """build_contextで送信する入力のトークン数の見積もり（要約は作り直さない）
+
+    Args:
+        messages: セッションの全メッセージ
+        model_id: トークン数を数えるモデルID
+        state: 要約状態を保持する辞書（{"upto": 要約済みの件数, "text": 要約}）
+        budget: 指定した場合、予算を超える分は要約に畳み込まれるものとして予算で頭打ちにする
+    """
+    upto = state.get("upto", 0)
+    summary = state.get("text", "")
+    if upto > len(messages):
+        # 履歴がクリアされた場合は要約も使われない
+        upto, summary = 0, ""
+    tokens = sum(message_tokens(m, model_id) for m in messages if m.get("role") == "system")
+    tokens += count_tokens(summary, model_id) if summary else 0
+    tokens += sum(message_tokens(m, model_id) for m in _usable(messages[upto:]))
+    return tokens if budget is None else min(tokens, budget)
+
+
+def build_context(messages, model_id, budget, state, summarize, summary_role="system"):
+    """トークン予算内に収まるAPI送信用のメッセージ列を組み立てる
+
+    systemメッセージと直近のターンを予算内で残し、溢れた古いターンは
+    要約に畳み込む。要約はstateに保持して再利用し、新たに溢れたターンが
+    出た場合のみ前回の要約と合わせて再計算する。
+
+    Args:
+        messages: セッションの全メッセージ
+        model_id: 送信先のモデルID
+        budget: 入力に使用できるトークン数
+        state: 要約状態を保持する辞書（{"upto": 要約済みの件数, "text": 要約}）
+        summarize: summarize(前回の要約, 新たに畳み込むメッセージ) -> 要約テキスト
+        summary_role: 要約を載せるメッセージのロール（o1系はsystem非対応のためuser）
+    """
+    system_messages = [m for m in messages if m.get("role") == "system"]
+    upto = state.get("upto", 0)
+    if upto > len(messages):
+        # 履歴がクリアされた場合は要約もリセット
+        upto = 0
+        state.clear()
+
+    def total(items):
+        return sum(message_tokens(m, model_id) for m in items)
+
+    recent = _usable(messages[upto:])
+    fixed_tokens = total(system_messages)
+    summary_tokens = count_tokens(state.get("text", ""), model_id) if state.get("text") else 0
+
+    if fixed_tokens + summary_tokens + total(recent) > budget:
+        # 目標サイズまで古いターンを要約へ移す（毎ターンの再要約を避けるため余裕を持たせる）
+        target = max(int(budget * SUMMARY_TARGET_RATIO) - fixed_tokens, 0)
+        keep_from = len(messages)
+        kept_tokens = 0
+        for i in range(len(messages) - 1, upto - 1, -1):
+            m = messages[i]
+            if m.get("role") == "system" or is_error_message(m) or m.get("compare_alternate"):
+                continue
+            tokens = message_tokens(m, model_id)
+            # 最新のメッセージ（今回の入力）は必ず残す
+            if kept_tokens + tokens > target and keep_from < len(messages):
+                break
+            kept_tokens += tokens
+            keep_from = i
+
+        folded = _usable(messages[upto:keep_from])
+        if folded:
+            state["text"] = summarize(state.get("text", ""), folded)
+        state["upto"] = keep_from
+        recent = _usable(messages[keep_from:])
+
+    payload = [{"role": m["role"], "content": m["content"]} for m in system_messages]
+    if state.get("text"):
+        payload.append({"role": summary_role, "content": SUMMARY_PREFIX + state["text"]})
+    payload.extend({"role": m["role"], "content": m["content"]} for m in recent)
+    return payload
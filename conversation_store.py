@@ -0,0 +1,163 @@
+import streamlit as st
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from llm_cache import CACHE_DIR
+
+# ==========================
+#  会話ストア設定
+# ==========================
+STORE_PATH = os.path.join(CACHE_DIR, "conversations.sqlite3")
+TITLE_CHARS = 40                        # 会話一覧に表示するタイトルの文字数
+TRANSIENT_KEYS = ("token_counts",)      # 保存しないキャッシュ用のキー
+
+
+class ConversationStore:
+    """会話を追記専用で保存するSQLiteストア
+
+    メッセージは生成されるたびに1件ずつ追記し、会話一覧（インデックス）を
+    別テーブルで管理する。セッション側は直近のメッセージのみをメモリに保持し、
+    古いメッセージは必要になったときにこのストアから読み込む。
+
+    Args:
+        path: SQLiteファイルのパス
+    """
+
+    def __init__(self, path=STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, owner TEXT NOT NULL DEFAULT '', title TEXT NOT NULL DEFAULT '', created REAL NOT NULL, "
+            "updated REAL NOT NULL, message_count INTEGER NOT NULL DEFAULT 0, "
+            "summary_upto INTEGER NOT NULL DEFAULT 0, summary TEXT NOT NULL DEFAULT '')"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+        if "owner" not in columns:
+            # 所有者の列が無い以前のストア（既存の会話は誰の一覧にも表示しない）
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_owner ON conversations(owner, updated)")
+        self._conn.commit()
+
+    def create_conversation(self, owner=""):
+        """新しい会話を作成し、そのIDを返す
+
+        Args:
+            owner: 会話の所有者（会話一覧はこの所有者ごとに表示する）
+        """
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversations (id, owner, created, updated) VALUES (?, ?, ?, ?)",
+                (conversation_id, owner, now, now)
+            )
+            self._conn.commit()
+        return conversation_id
+
+    def append(self, conversation_id, message):
+        """メッセージを追記し、会話内の通し番号を返す"""
+        data = json.dumps(
+            {k: v for k, v in message.items() if k not in TRANSIENT_KEYS},
+            ensure_ascii=False
+        )
+        with self._lock:
+            seq = self._conn.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO messages (conversation_id, seq, data) VALUES (?, ?, ?)",
+                (conversation_id, seq, data)
+            )
+            # 最初のユーザー発言を会話のタイトルにする
+            title = message.get("content", "").replace("\n", " ")[:TITLE_CHARS] if message.get("role") == "user" else ""
+            self._conn.execute(
+                "UPDATE conversations SET message_count = ?, updated = ?, "
+                "title = CASE WHEN title = '' THEN ? ELSE title END WHERE id = ?",
+                (seq + 1, time.time(), title, conversation_id)
+            )
+            self._conn.commit()
+        return seq
+
+    def count(self, conversation_id):
+        """会話のメッセージ数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load_range(self, conversation_id, start, end):
+        """通し番号が start 以上 end 未満のメッセージを返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, max(start, 0), end)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_messages(self, conversation_id, batch_size=500):
+        """会話の全メッセージを一定件数ずつ読み込みながら返す"""
+        start = 0
+        while True:
+            batch = self.load_range(conversation_id, start, start + batch_size)
+            if not batch:
+                return
+            yield from batch
+            start += batch_size
+
+    def list_conversations(self, owner, limit=50):
+        """所有者の会話一覧を更新が新しい順に返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, updated, message_count FROM conversations "
+                "WHERE owner = ? AND message_count > 0 ORDER BY updated DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+        return [
+            {"id": row[0], "title": row[1], "updated": row[2], "message_count": row[3]}
+            for row in rows
+        ]
+
+    def owner_of(self, conversation_id):
+        """会話の所有者（会話が無ければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_summary(self, conversation_id, upto, summary):
+        """要約済みの位置（通し番号）と要約を保存する"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversations SET summary_upto = ?, summary = ? WHERE id = ?",
+                (upto, summary, conversation_id)
+            )
+            self._conn.commit()
+
+    def load_summary(self, conversation_id):
+        """保存された (要約済みの位置, 要約) を返す"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary_upto, summary FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, "")
+
+
+@st.cache_resource
+def get_conversation_store():
+    """プロセス全体で共有する会話ストア"""
+    return ConversationStore()
@@ -1,13 +1,10 @@
 import streamlit as st
-import pandas as pd
 import io
-from openai import OpenAI
 import time
-
-# ==========================
-#  OpenAI APIキーの設定
-# ==========================
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from llm_cache import get_response_cache, complete
+from openai_client import get_client
+from telemetry import metrics_params, render_diagnostics
+from cancellation import CancelToken, run_cancellable, status_heartbeat
 
 # ==========================
 #  モデル設定
@@ -61,6 +58,9 @@ def load_csv(uploaded_file, encoding='utf-8', delimiter=',', nrows=None, use_chu
         use_chunks: チャンク読み込みを使用するか
         chunk_size: チャンクサイズ
     """
+    # pandasは読み込みに時間がかかるため、CSVを扱うときに初めて読み込む
+    import pandas as pd
+
     try:
         read_params = {
             'encoding': encoding,
@@ -128,6 +128,7 @@ def load_csv(uploaded_file, encoding='utf-8', delimiter=',', nrows=None, use_chu
 
 def display_statistics(df):
     """データフレームの統計情報を表示"""
+    import pandas as pd
     st.subheader("📊 統計情報")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -173,6 +174,7 @@ def display_statistics(df):
 
 def filter_dataframe(df):
     """データフレームのフィルタリング機能"""
+    import pandas as pd
     st.subheader("🔍 データフィルタリング")
     
     # 列選択によるフィルタリング
@@ -222,8 +224,14 @@ def filter_dataframe(df):
         st.warning("少なくとも1つの列を選択してください")
         return df
 
-def analyze_with_ai(df, model_id, user_query, temperature=0.7, max_tokens=2000):
-    """AIを使用してCSVデータを分析"""
+def analyze_with_ai(df, model_id, user_query, temperature=0.7, max_tokens=2000, use_cache=True, stats=None,
+                    cancel=None):
+    """AIを使用してCSVデータを分析
+
+    同じデータ・質問・設定での再実行は応答キャッシュから返す。
+    statsに辞書を渡すと、レイテンシやトークン数などの計測値を書き込む。
+    cancelにCancelTokenを渡すと、中断時に接続を閉じて生成を止める。
+    """
     try:
         # データフレームの基本情報を取得
         df_info = {
@@ -281,10 +289,11 @@ def analyze_with_ai(df, model_id, user_query, temperature=0.7, max_tokens=2000):
             api_params["temperature"] = temperature
             api_params["max_tokens"] = max_tokens
         
-        # API呼び出し
-        response = client.chat.completions.create(**api_params)
+        # API呼び出し（キャッシュがあればそれを使用）
+        result = complete(get_client(), api_params, get_response_cache() if use_cache else None,
+                          stats=stats, kind="analysis", cancel=cancel)
         
-        return response.choices[0].message.content, None
+        return result, None
     except Exception as e:
         return None, str(e)
 
@@ -327,6 +336,19 @@ def main():
             temperature = st.slider("創造性 (Temperature)", 0.0, 2.0, 0.7, 0.1)
         
         max_tokens = st.slider("最大トークン数", 100, 4000, 2000, 100)
+
+        # 同一の分析を再実行しないための応答キャッシュ
+        use_cache = st.checkbox("🗂️ 応答キャッシュを使用", value=True, help="同じデータ・質問・設定での分析はAPIを呼ばずに保存済みの結果を返します")
+        if use_cache:
+            cache = get_response_cache()
+            stats = cache.stats
+            st.caption(
+                f"キャッシュ: ヒット {stats['memory_hits'] + stats['disk_hits']} / "
+                f"ミス {stats['misses']}（ヒット率 {cache.hit_rate():.0%}）"
+            )
+
+        # API呼び出しの計測値（モデルごとのp50/p95）
+        render_diagnostics()
     
     # ファイルアップロード
     st.subheader("📁 CSVファイルのアップロード")
@@ -555,13 +577,28 @@ def main():
                     if analysis_query:
                         st.session_state.analysis_query_saved = analysis_query
                         with st.spinner("AIがデータを分析中..."):
-                            result, error = analyze_with_ai(
-                                df, 
-                                selected_model["id"], 
-                                analysis_query,
-                                temperature=temperature,
-                                max_tokens=max_tokens
+                            analysis_stats = {}
+                            # 停止ボタンで再実行されたら接続を閉じて分析を打ち切る
+                            cancel = CancelToken()
+                            stop_placeholder = st.empty()
+                            stop_placeholder.button("⏹️ 分析を停止", key="stop_analysis")
+                            status_placeholder = st.empty()
+                            result, error = run_cancellable(
+                                lambda: analyze_with_ai(
+                                    df,
+                                    selected_model["id"],
+                                    analysis_query,
+                                    temperature=temperature,
+                                    max_tokens=max_tokens,
+                                    use_cache=use_cache,
+                                    stats=analysis_stats,
+                                    cancel=cancel
+                                ),
+                                cancel,
+                                heartbeat=status_heartbeat(status_placeholder, "分析中")
                             )
+                            stop_placeholder.empty()
+                            status_placeholder.empty()
                             if error:
                                 st.session_state.analysis_result = None
                                 st.session_state.analysis_error = error
@@ -581,6 +618,7 @@ def main():
                             else:
                                 st.session_state.analysis_result = result
                                 st.session_state.analysis_error = None
+                                st.session_state.analysis_metrics = metrics_params(analysis_stats)
                                 st.success("✅ 分析が完了しました！")
                     else:
                         st.warning("分析したい内容を入力してください")
@@ -592,6 +630,13 @@ def main():
                     if st.session_state.analysis_query_saved:
                         st.caption(f"質問: {st.session_state.analysis_query_saved}")
                     st.markdown(st.session_state.analysis_result)
+                    metrics = st.session_state.get("analysis_metrics") or {}
+                    if metrics.get("latency_sec") is not None:
+                        st.caption(
+                            f"⏱️ 合計 {metrics['latency_sec']:.2f}s / "
+                            f"トークン 入力 {metrics.get('prompt_tokens') or '-'}・出力 {metrics.get('completion_tokens') or '-'}"
+                            + (" / キャッシュ" if metrics.get("cached") else "")
+                        )
                     
                     # 結果をクリアするボタン
                     if st.button("🗑️ 結果をクリア", key="clear_result"):
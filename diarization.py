@@ -0,0 +1,162 @@
+import streamlit as st
+import gc
+import time
+import threading
+from concurrent.futures import Future
+from app_settings import get_setting
+from cancellation import with_script_context
+
+# ==========================
+#  話者分離モデル設定
+# ==========================
+PIPELINE_NAME = "pyannote/speaker-diarization-3.1"
+# st.secrets または環境変数で上書き可能
+DEFAULT_SETTINGS = {
+    "DIARIZATION_WARMUP": False,            # サーバー起動後の最初の実行時にバックグラウンドで読み込むか
+    "DIARIZATION_IDLE_RELEASE_SEC": 1800,   # この秒数使われなかったらモデルを解放する（0で解放しない）
+}
+IDLE_CHECK_SEC = 60  # アイドル状態を確認する間隔
+
+
+def _setting(name):
+    """設定を st.secrets → 環境変数 → 既定値 の順で取得する"""
+    return get_setting(name, DEFAULT_SETTINGS[name])
+
+
+def load_pipeline():
+    """pyannoteの話者分離パイプラインを読み込む（数百MBあるため必要になるまで呼ばない）"""
+    from pyannote.audio import Pipeline
+
+    return Pipeline.from_pretrained(PIPELINE_NAME, use_auth_token=st.secrets["HUGGING_FACE_TOKEN"])
+
+
+def _free_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+class PipelineHolder:
+    """話者分離パイプラインを遅延読み込みし、プロセス内で共有する
+
+    最初の話者分離で読み込み、以降は全セッションで同じパイプラインを使う。
+    パイプラインはスレッドセーフではないため実行は1つずつ行う。
+    一定時間使われなかった場合は解放し、次の利用時に読み込み直す。
+
+    Args:
+        loader: パイプラインを作成する関数
+        idle_release_sec: この秒数使われなかったら解放する（0またはNoneで解放しない）
+        clock: 現在時刻を返す関数（テスト用）
+    """
+
+    def __init__(self, loader=load_pipeline, idle_release_sec=None, clock=time.monotonic):
+        self.loader = loader
+        self.idle_release_sec = idle_release_sec
+        self.clock = clock
+        self._pipeline = None
+        self._last_used = None
+        self._load_lock = threading.Lock()  # 読み込みを1回にまとめる
+        self._run_lock = threading.Lock()   # 実行を1つずつにする（実行中は解放しない）
+        self._watcher = None
+
+    @property
+    def loaded(self):
+        return self._pipeline is not None
+
+    def get(self):
+        """パイプラインを返す（未読み込みならここで読み込む）"""
+        with self._load_lock:
+            if self._pipeline is None:
+                self._pipeline = self.loader()
+                self._start_watcher()
+            self._last_used = self.clock()
+            return self._pipeline
+
+    def run(self, audio_path, **kwargs):
+        """音声ファイルの話者分離を実行する"""
+        with self._run_lock:
+            result = self.get()(audio_path, **kwargs)
+            self._last_used = self.clock()
+            return result
+
+    def warm_up(self):
+        """バックグラウンドで読み込みを始める（読み込み済みなら何もしない）"""
+        if self.loaded:
+            return None
+        thread = threading.Thread(target=self.get, daemon=True)
+        thread.start()
+        return thread
+
+    def release_if_idle(self):
+        """一定時間使われていなければパイプラインを解放する（解放した場合はTrue）"""
+        if not self.idle_release_sec or self._pipeline is None:
+            return False
+        if not self._run_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._load_lock:
+                if self._pipeline is None or self.clock() - self._last_used < self.idle_release_sec:
+                    return False
+                self._pipeline = None
+        finally:
+            self._run_lock.release()
+        _free_memory()
+        return True
+
+    def _start_watcher(self):
+        if not self.idle_release_sec or (self._watcher is not None and self._watcher.is_alive()):
+            return
+
+        def watch():
+            while self._pipeline is not None:
+                time.sleep(min(IDLE_CHECK_SEC, self.idle_release_sec))
+                self.release_if_idle()
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
+
+
+@st.cache_resource
+def get_pipeline_holder():
+    """プロセス全体で共有する話者分離パイプラインの保持先"""
+    return PipelineHolder(idle_release_sec=_setting("DIARIZATION_IDLE_RELEASE_SEC"))
+
+
+def diarize(audio_path, num_speakers=None):
+    """共有パイプラインで話者分離を実行する（num_speakersがNoneなら人数を自動検出）"""
+    kwargs = {"num_speakers": int(num_speakers)} if num_speakers is not None else {}
+    return get_pipeline_holder().run(audio_path, **kwargs)
+
+
+def diarize_in_background(audio_path, num_speakers=None):
+    """話者分離を別スレッドで開始し、結果を受け取るFutureを返す（文字起こしと並行に実行するため）"""
+    future = Future()
+
+    @with_script_context
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(diarize(audio_path, num_speakers))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+@st.cache_resource
+def _warm_up_once():
+    # プロセスで1回だけ読み込みを始める（解放後の再実行で読み込み直さないため）
+    get_pipeline_holder().warm_up()
+    return True
+
+
+def warm_up_if_enabled():
+    """設定が有効な場合、サーバー起動後の最初の実行時に話者分離パイプラインをバックグラウンドで読み込んでおく"""
+    if _setting("DIARIZATION_WARMUP"):
+        _warm_up_once()
@@ -0,0 +1,297 @@
+import streamlit as st
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from streaming import iter_stream_text
+from context_window import count_tokens
+from rate_limiter import scheduled
+from telemetry import get_metrics, finalize_stats
+from cancellation import GenerationCancelled
+
+# ==========================
+#  キャッシュ設定
+# ==========================
+CACHE_DIR = os.environ.get("APP_CACHE_DIR", ".cache")
+CACHE_DB_PATH = os.path.join(CACHE_DIR, "llm_responses.sqlite3")
+MEMORY_ITEMS = 256                  # メモリ層に保持する件数
+TTL_SEC = 7 * 24 * 60 * 60          # ディスク層の有効期限（7日）
+MAX_DISK_BYTES = 100 * 1024 * 1024  # ディスク層の最大サイズ（100MB）
+REPLAY_CHUNK_CHARS = 32             # キャッシュヒットをストリームとして再生する際の分割文字数
+
+
+def make_cache_key(api_params):
+    """APIパラメータからキャッシュキーを作成する
+
+    モデルID・メッセージ・temperature・最大トークン数のみをキーに含め、
+    streamなど応答内容に影響しないパラメータは無視する。
+    """
+    key_source = {
+        "model": api_params.get("model"),
+        "messages": api_params.get("messages"),
+        "temperature": api_params.get("temperature"),
+        "max_tokens": api_params.get("max_tokens", api_params.get("max_completion_tokens")),
+    }
+    encoded = json.dumps(key_source, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LLM応答のキャッシュ（メモリ上のLRU層 + SQLiteのディスク層）
+
+    Args:
+        path: SQLiteファイルのパス
+        memory_items: メモリ層に保持する件数
+        ttl_sec: ディスク層の有効期限（秒）
+        max_disk_bytes: ディスク層の最大サイズ（超えたら古いアクセス順に削除）
+    """
+
+    def __init__(self, path=CACHE_DB_PATH, memory_items=MEMORY_ITEMS, ttl_sec=TTL_SEC,
+                 max_disk_bytes=MAX_DISK_BYTES):
+        self.memory_items = memory_items
+        self.ttl_sec = ttl_sec
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+            "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """キャッシュされた応答を返す（無ければNone）"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_sec:
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, row[0])
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, value):
+        """応答を保存し、期限切れ・容量超過分を削除する"""
+        with self._lock:
+            now = time.time()
+            self._remember(key, value)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value.encode("utf-8")))
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_sec,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        # アクセスが古い順に削除して上限以下に収める
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+
+    def clear(self):
+        """全てのキャッシュを削除する"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def hit_rate(self):
+        """ヒット率（0.0〜1.0）"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+def estimate_request_tokens(api_params):
+    """レート制限(tpm)の見積もりに使うトークン数（入力 + 最大出力）"""
+    model_id = api_params.get("model", "")
+    prompt_tokens = sum(count_tokens(m.get("content") or "", model_id) for m in api_params.get("messages", []))
+    return prompt_tokens + (api_params.get("max_tokens") or api_params.get("max_completion_tokens") or 0)
+
+
+def create_completion(client, api_params, fail_fast_status=()):
+    """共有スケジューラの流量制御・再試行を通してChat Completionsを呼び出す
+
+    fail_fast_status に含まれるHTTPステータスのエラーは再試行せずに送出する。
+    """
+    return scheduled(
+        api_params["model"],
+        estimate_request_tokens(api_params),
+        lambda: client.chat.completions.create(**api_params),
+        fail_fast_status=fail_fast_status
+    )
+
+
+@st.cache_resource
+def get_response_cache():
+    """プロセス全体で共有する応答キャッシュ"""
+    return ResponseCache()
+
+
+def record_error(kind, model_id, stats, error):
+    """失敗した呼び出しをエラー率の計算用に記録する（レイテンシには含めない）"""
+    stats["error"] = type(error).__name__
+    get_metrics().record(kind, model_id, {"error": stats["error"], "cached": False})
+
+
+def complete(client, api_params, cache=None, stats=None, kind="chat", cancel=None):
+    """非ストリーミングでChat Completionsを呼び出し、応答テキストを返す
+
+    Args:
+        client: OpenAIクライアント
+        api_params: Chat Completionsのパラメータ
+        cache: ResponseCache（Noneの場合はキャッシュしない）
+        stats: 指定した場合、計測値（latency_sec, prompt_tokens, completion_tokens,
+            tokens_per_sec, cached）を書き込む辞書
+        kind: 計測ログ上の呼び出しの種類
+        cancel: 指定した場合、中断に使うCancelToken（中断時はGenerationCancelledを送出）
+    """
+    if cancel is not None:
+        # 接続を閉じれば生成も止まるよう、中断可能な呼び出しはストリーミングで受信する
+        streamed = dict(api_params, stream=True, stream_options={"include_usage": True})
+        return "".join(stream_completion(client, streamed, cache, stats, kind, cancel))
+
+    stats = {} if stats is None else stats
+    started = time.perf_counter()
+    stats["cached"] = False
+
+    key = make_cache_key(api_params) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            stats.update({"cached": True, "latency_sec": time.perf_counter() - started})
+            get_metrics().record(kind, api_params["model"], stats)
+            return cached
+
+    try:
+        response = create_completion(client, api_params)
+    except Exception as e:
+        record_error(kind, api_params["model"], stats, e)
+        raise
+    text = response.choices[0].message.content
+    stats["latency_sec"] = time.perf_counter() - started
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        stats["prompt_tokens"] = usage.prompt_tokens
+        stats["completion_tokens"] = usage.completion_tokens
+    finalize_stats(stats)
+    get_metrics().record(kind, api_params["model"], stats)
+
+    if key is not None and text:
+        cache.set(key, text)
+    return text
+
+
+def stream_completion(client, api_params, cache=None, stats=None, kind="chat", cancel=None, fail_fast_status=()):
+    """ストリーミングでChat Completionsを呼び出し、テキスト差分を順に返す
+
+    キャッシュヒット時は保存済みの応答を分割してストリームとして再生する。
+    ストリームを最後まで受信できた場合のみキャッシュに保存する。
+
+    Args:
+        client: OpenAIクライアント
+        api_params: Chat Completionsのパラメータ（stream=Trueを含む）
+        cache: ResponseCache（Noneの場合はキャッシュしない）
+        stats: 指定した場合、計測値（ttft_sec, latency_sec, chunks, tokens_per_sec,
+            prompt_tokens, completion_tokens, cached）を書き込む辞書
+        kind: 計測ログ上の呼び出しの種類
+        cancel: 指定した場合、中断に使うCancelToken。中断されるとストリームと
+            HTTP接続を閉じ、途中までのテキストを持つGenerationCancelledを送出する
+        fail_fast_status: 再試行せずにすぐ送出するHTTPステータス（別のモデルに切り替える場合）
+    """
+    stats = {} if stats is None else stats
+    started = time.perf_counter()
+    stats.update({"cached": False, "chunks": 0, "ttft_sec": None})
+
+    def record(delta):
+        if stats["ttft_sec"] is None:
+            stats["ttft_sec"] = time.perf_counter() - started
+        stats["chunks"] += 1
+
+    def finish(text):
+        stats["latency_sec"] = time.perf_counter() - started
+        # usageが返らない場合（キャッシュ再生など）は出力トークン数を概算
+        if stats.get("completion_tokens") is None:
+            stats["completion_tokens"] = count_tokens(text, api_params["model"])
+        finalize_stats(stats)
+        get_metrics().record(kind, api_params["model"], stats)
+
+    key = make_cache_key(api_params) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            stats["cached"] = True
+            for i in range(0, len(cached), REPLAY_CHUNK_CHARS):
+                record(cached[i:i + REPLAY_CHUNK_CHARS])
+                yield cached[i:i + REPLAY_CHUNK_CHARS]
+            finish(cached)
+            return
+
+    parts = []
+    usage = {}
+    response = None
+    completed = False
+    try:
+        response = create_completion(client, api_params, fail_fast_status)
+        if cancel is not None and hasattr(response, "close"):
+            # 別スレッドから中断されたら、読み込み待ちの接続ごと閉じる
+            cancel.on_cancel(response.close)
+        for delta in iter_stream_text(response, usage=usage):
+            if cancel is not None and cancel.cancelled:
+                break
+            record(delta)
+            parts.append(delta)
+            yield delta
+        completed = cancel is None or not cancel.cancelled
+    except Exception as e:
+        if cancel is None or not cancel.cancelled:
+            record_error(kind, api_params["model"], stats, e)
+            raise
+    finally:
+        # 途中で読むのをやめた場合も接続を閉じて、サーバー側の生成を止める
+        if not completed and hasattr(response, "close"):
+            response.close()
+    stats.update(usage)
+    if not completed:
+        stats["truncated"] = True
+        finish("".join(parts))
+        raise GenerationCancelled("".join(parts))
+    finish("".join(parts))
+
+    if key is not None and parts:
+        cache.set(key, "".join(parts))
@@ -1,4 +1,5 @@
 import streamlit as st
+from startup_profile import import_timer, render_import_profile
 
 st.set_page_config(
     page_title="最新AIチャットアプリ",
@@ -7,15 +8,27 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 設定が有効な場合は、話者分離モデルを初回アクセス時にバックグラウンドで読み込んでおく
+from diarization import warm_up_if_enabled
+warm_up_if_enabled()
+
 # サイドバーにナビゲーションを追加
 page = st.sidebar.radio("ページを選択", ["チャットアプリ", "MP3音声データ処理アプリ", "CSV解析アプリ"])
 
-# 選択されたページに基づいてスクリプトを実行
+# 選択されたページのモジュールだけを読み込んで実行（重いライブラリは各ページ内で必要になったときに読み込む）
 if page == "チャットアプリ":
-    from chat import main as chat_main
+    with import_timer(page):
+        from chat import main as chat_main
     chat_main()
 elif page == "MP3音声データ処理アプリ":
-    exec(open("transcriber.py", encoding='utf-8').read())
+    with import_timer(page):
+        from transcriber import main as transcriber_main
+    transcriber_main()
 elif page == "CSV解析アプリ":
-    from csv_analyzer import main as csv_main
+    with import_timer(page):
+        from csv_analyzer import main as csv_main
     csv_main()
+
+# APP_PROFILE_IMPORTS=1 のときは各ページの読み込み時間を表示
+with st.sidebar:
+    render_import_profile()
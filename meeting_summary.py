@@ -0,0 +1,151 @@
+import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from context_window import count_tokens
+from cancellation import with_script_context
+
+# ==========================
+#  長い文字起こしの要約設定
+# ==========================
+SINGLE_PASS_TOKENS = 12000  # これ以下の文字起こしは1回の呼び出しで要約する
+CHUNK_TOKENS = 6000         # 分割要約する際の1チャンクの上限
+MAX_WORKERS = 4             # 同時に要約するチャンク数
+CHUNK_SYSTEM_PROMPT = (
+    "会議の文字起こしの一部を要約してください。発言者、議題、決定事項、課題、"
+    "担当者、期限、数値は省略せず、箇条書きで簡潔にまとめてください。"
+)
+REDUCE_PROMPT = "以下は会議の文字起こしを時系列順に区切って要約したものです。これらを統合して要約してください。"
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\n])")
+
+
+def split_sentences(text):
+    """文字起こしを文ごとに分割する（話者の区切りが無い場合の分割単位）"""
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def split_units(units, model_id, budget=CHUNK_TOKENS):
+    """発言（または文）のリストを、トークン数がbudget以下のチャンクにまとめる
+
+    発言の途中では区切らない。1つの発言がbudgetを超える場合だけ文字数で分割する。
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        tokens = count_tokens(unit, model_id)
+        if tokens > budget:
+            # 長すぎる発言はトークン数の比率から求めた文字数で分割する
+            step = max(len(unit) * budget // tokens, 1)
+            pieces = [unit[i:i + step] for i in range(0, len(unit), step)]
+        else:
+            pieces = [unit]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece, model_id)
+            if current and current_tokens + piece_tokens > budget:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def chunk_params(model_id, chunk):
+    """チャンクを要約するChat Completionsのパラメータ"""
+    return {
+        "model": model_id,
+        "messages": [{"role": "system", "content": CHUNK_SYSTEM_PROMPT}, {"role": "user", "content": chunk}],
+    }
+
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkSummarizer:
+    """チャンクごとの要約を並行に作成し、結果をキャッシュする
+
+    要約はチャンクの内容とモデルをキーに保存する。同じモデルの要約が無い場合でも、
+    他のモデルで作成済みの要約があればそれを使い、別のモデルで要約し直すときは
+    最後の統合だけを行う。
+
+    Args:
+        run: Chat Completionsのパラメータを受け取り応答テキストを返す関数（ワーカースレッドで呼ばれる）
+        cache: ResultCache（Noneの場合はキャッシュしない）
+        max_workers: 同時に要約するチャンク数
+    """
+
+    def __init__(self, run, cache=None, max_workers=MAX_WORKERS):
+        self.run = run
+        self.cache = cache
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def _cached(self, key, model_id):
+        if self.cache is None:
+            return None
+        exact = self.cache.get("chunk_summary", key, model=model_id, prompt=CHUNK_SYSTEM_PROMPT)
+        if exact is not None:
+            return exact
+        return self.cache.get("chunk_summary", key, model=None, prompt=CHUNK_SYSTEM_PROMPT)
+
+    def _store(self, key, model_id, summary):
+        if self.cache is None:
+            return
+        self.cache.set("chunk_summary", key, summary, model=model_id, prompt=CHUNK_SYSTEM_PROMPT)
+        # モデルを問わず再利用できるよう、最後に作成した要約も保存する
+        self.cache.set("chunk_summary", key, summary, model=None, prompt=CHUNK_SYSTEM_PROMPT)
+
+    def summarize(self, chunks, model_id, progress=None):
+        """各チャンクの要約を元の順序で返す
+
+        Args:
+            chunks: チャンクのテキストのリスト
+            model_id: 要約に使うモデル
+            progress: 指定した場合、{"done": 完了数, "total": チャンク数} を更新する辞書
+                （別スレッドから進捗を表示するため）
+        """
+        summaries = [None] * len(chunks)
+        pending = []
+        for index, chunk in enumerate(chunks):
+            summaries[index] = self._cached(_content_hash(chunk), model_id)
+            if summaries[index] is None:
+                pending.append(index)
+        if progress is not None:
+            progress.update(done=len(chunks) - len(pending), total=len(chunks))
+        if not pending:
+            return summaries
+
+        @with_script_context
+        def work(index):
+            summary = self.run(chunk_params(model_id, chunks[index]))
+            self._store(_content_hash(chunks[index]), model_id, summary)
+            with self._lock:
+                summaries[index] = summary
+                if progress is not None:
+                    progress["done"] += 1
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending)))) as executor:
+            futures = [executor.submit(work, index) for index in pending]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # 失敗・中断時は未開始のチャンクを送らない
+                for future in futures:
+                    future.cancel()
+                raise
+        return summaries
+
+
+def reduce_input(summaries, model_id, summarizer, budget=SINGLE_PASS_TOKENS, progress=None):
+    """チャンクの要約を、最後の統合に渡せる長さ（budget以下）まで段階的にまとめる"""
+    while len(summaries) > 1 and count_tokens("\n\n".join(summaries), model_id) > budget:
+        groups = split_units(summaries, model_id)
+        if len(groups) >= len(summaries):
+            # これ以上まとめられない場合はそのまま統合に渡す
+            break
+        summaries = summarizer.summarize(groups, model_id, progress)
+    return "\n\n".join(f"【パート{index}】\n{summary}" for index, summary in enumerate(summaries, start=1))
@@ -0,0 +1,114 @@
+import streamlit as st
+import time
+import threading
+from context_window import count_tokens
+from rate_limiter import get_scheduler
+from telemetry import get_metrics
+
+# ==========================
+#  自動選択設定
+# ==========================
+AUTO_MODEL_ID = "auto"
+# 候補モデル（軽い順）。扱える入力・出力の目安と、観測値が無い間に使う既定のTTFT・速度
+ROUTE_CANDIDATES = [
+    {"id": "gpt-3.5-turbo", "max_prompt_tokens": 2000, "max_output_tokens": 500,
+     "ttft_sec": 0.5, "tokens_per_sec": 90},
+    {"id": "gpt-5-mini", "max_prompt_tokens": 8000, "max_output_tokens": 2000,
+     "ttft_sec": 1.0, "tokens_per_sec": 80},
+    {"id": "gpt-4o", "max_prompt_tokens": 30000, "max_output_tokens": 4000,
+     "ttft_sec": 0.8, "tokens_per_sec": 60},
+    {"id": "gpt-5", "max_prompt_tokens": None, "max_output_tokens": None,
+     "ttft_sec": 2.0, "tokens_per_sec": 50},
+]
+MIN_SAMPLES = 3                 # 観測値を使うのに必要な直近の件数
+ERROR_PENALTY_SEC = 10.0        # エラー率1.0あたりに上乗せする秒数（失敗時の再送コストの目安）
+UNAVAILABLE_SEC = 10 * 60       # モデルが存在しない場合に候補から外す秒数
+RATE_LIMIT_COOLDOWN_SEC = 30    # レート制限にかかったモデルを後回しにする秒数
+FALLBACK_STATUS_CODES = (404, 429)  # 再試行せずに次の候補へ切り替えるHTTPステータス（モデル不在・レート制限）
+BASE_OUTPUT_TOKENS = 150        # 短い質問への応答の出力トークン数の目安
+LONG_OUTPUT_TOKENS = 800        # 長い出力が求められる場合の目安
+LONG_OUTPUT_HINTS = ("詳しく", "詳細", "説明して", "コード", "実装", "書いて", "作成して", "一覧",
+                     "翻訳", "要約", "比較", "explain", "write", "code", "implement", "list")
+
+
+def estimate_output_tokens(prompt, max_tokens):
+    """入力から出力トークン数を見積もる（長い出力を求める語や長い入力なら多めにする）"""
+    lowered = prompt.lower()
+    estimate = LONG_OUTPUT_TOKENS if any(hint in lowered for hint in LONG_OUTPUT_HINTS) else BASE_OUTPUT_TOKENS
+    estimate = max(estimate, count_tokens(prompt, "gpt-4o") // 2)
+    return min(estimate, max_tokens)
+
+
+def is_fallback_error(error):
+    """別のモデルで再送すべきエラー（モデルが存在しない・レート制限）かどうか"""
+    message = str(error).lower()
+    if "model_not_found" in message or "does not exist" in message or "rate_limit" in message:
+        return True
+    return getattr(error, "status_code", None) in FALLBACK_STATUS_CODES
+
+
+class ModelRouter:
+    """入力の長さ・出力量の見積もり・直近の実測値からモデルを選ぶ
+
+    扱える入力・出力の目安を満たす候補のうち、予想応答時間
+    （TTFT + 出力トークン数 / tokens/s + 流量制御の待ち時間 + エラー率のペナルティ）
+    が短い順に並べる。TTFTとtokens/sは計測値が十分にあれば直近の中央値、
+    無ければ既定値を使う。失敗したモデルは一定時間後回しにする。
+
+    Args:
+        candidates: 候補モデルの設定（軽い順）
+        metrics: model_stats() を持つ計測値の記録先（Noneの場合は共有の記録先）
+        wait_estimate: (model_id, tokens) から流量制御の待ち秒数を返す関数
+        clock: 現在時刻を返す関数（テスト用）
+    """
+
+    def __init__(self, candidates=ROUTE_CANDIDATES, metrics=None, wait_estimate=None, clock=time.monotonic):
+        self.candidates = candidates
+        self.metrics = metrics
+        self.wait_estimate = wait_estimate
+        self.clock = clock
+        self._blocked = {}  # model_id -> 後回しを解除する時刻
+        self._lock = threading.Lock()
+
+    def expected_latency(self, candidate, prompt_tokens, output_tokens):
+        """候補モデルの予想応答時間（秒）"""
+        metrics = self.metrics or get_metrics()
+        observed = metrics.model_stats(candidate["id"])
+        ttft, speed = candidate["ttft_sec"], candidate["tokens_per_sec"]
+        if observed["count"] >= MIN_SAMPLES:
+            ttft = observed["ttft_sec"] if observed["ttft_sec"] is not None else ttft
+            speed = observed["tokens_per_sec"] or speed
+        wait_estimate = self.wait_estimate or get_scheduler().estimated_wait
+        return (ttft + output_tokens / speed
+                + wait_estimate(candidate["id"], prompt_tokens + output_tokens)
+                + observed["error_rate"] * ERROR_PENALTY_SEC)
+
+    def route(self, prompt_tokens, output_tokens):
+        """送信するモデルIDを優先順に返す（先頭で失敗した場合は次を使う）"""
+        now = self.clock()
+        with self._lock:
+            blocked = {model_id for model_id, until in self._blocked.items() if until > now}
+        fits = [
+            c for c in self.candidates
+            if (c["max_prompt_tokens"] is None or prompt_tokens <= c["max_prompt_tokens"])
+            and (c["max_output_tokens"] is None or output_tokens <= c["max_output_tokens"])
+        ]
+        ranked = sorted(fits, key=lambda c: self.expected_latency(c, prompt_tokens, output_tokens))
+        # 後回し中のモデルは最後の手段としてのみ残す
+        return [c["id"] for c in ranked if c["id"] not in blocked] + [c["id"] for c in ranked if c["id"] in blocked]
+
+    def mark_failure(self, model_id, error):
+        """モデルが存在しない・レート制限の場合に一定時間後回しにする"""
+        message = str(error).lower()
+        if "model_not_found" in message or "does not exist" in message or getattr(error, "status_code", None) == 404:
+            duration = UNAVAILABLE_SEC
+        else:
+            duration = RATE_LIMIT_COOLDOWN_SEC
+        with self._lock:
+            self._blocked[model_id] = self.clock() + duration
+
+
+@st.cache_resource
+def get_router():
+    """プロセス全体で共有するモデルルーター"""
+    return ModelRouter()
@@ -0,0 +1,76 @@
+import streamlit as st
+import logging
+import importlib
+from app_settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+#  HTTP接続設定
+# ==========================
+# st.secrets または環境変数で上書き可能
+DEFAULT_SETTINGS = {
+    "OPENAI_MAX_CONNECTIONS": 20,       # 接続プールの最大接続数
+    "OPENAI_MAX_KEEPALIVE": 10,         # キープアライブで保持する接続数
+    "OPENAI_KEEPALIVE_EXPIRY_SEC": 60,  # アイドル接続を保持する秒数
+    "OPENAI_CONNECT_TIMEOUT_SEC": 10,   # 接続タイムアウト
+    "OPENAI_READ_TIMEOUT_SEC": 600,     # 読み込みタイムアウト（長い文字起こし・生成向け）
+    "OPENAI_HTTP2": False,              # HTTP/2を使用するか（h2パッケージが必要）
+    "OPENAI_BASE_URL": "",              # 互換サーバーのURL（ベンチマーク用スタブなど。空なら既定）
+}
+
+
+def _setting(name):
+    """接続設定を st.secrets → 環境変数 → 既定値 の順で取得する"""
+    return get_setting(name, DEFAULT_SETTINGS[name])
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@st.cache_resource
+def get_client():
+    """全ページ・全セッションで共有するOpenAIクライアントを返す
+
+    初回呼び出し時に作成し、以降は同じ接続プールを再利用する。
+    ページごと・再実行ごとにクライアントを作ると、その都度TLSハンドシェイクが発生し
+    キープアライブが効かないため、プロセスで1つだけ保持する。
+    """
+    from openai import OpenAI
+
+    api_key = st.secrets["OPENAI_API_KEY"]
+    base_url = _setting("OPENAI_BASE_URL") or None
+    try:
+        http_client = _pooled_http_client()
+    except (ImportError, AttributeError, TypeError) as e:
+        # openaiのHTTPライブラリが想定と異なる場合は、既定の接続プールのまま使う（設定が効かないため警告する）
+        logger.warning("接続数・タイムアウトの設定を適用できないため、openaiの既定の接続設定を使います: %s", e)
+        http_client = None
+    # 再試行は rate_limiter のスケジューラで行うため、クライアント側では再試行しない
+    if http_client is None:
+        return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def _pooled_http_client():
+    """接続数・タイムアウトを設定したHTTPクライアント
+
+    openaiのバージョンによって内部のHTTPライブラリ（httpx / httpx2）が異なるため、
+    DefaultHttpxClientの基底クラスのライブラリが公開しているLimitsで接続数の設定を作る。
+    """
+    from openai import DefaultHttpxClient, Timeout
+
+    http_library = importlib.import_module(DefaultHttpxClient.__mro__[1].__module__.split(".")[0])
+    limits = http_library.Limits(
+        max_connections=_setting("OPENAI_MAX_CONNECTIONS"),
+        max_keepalive_connections=_setting("OPENAI_MAX_KEEPALIVE"),
+        keepalive_expiry=_setting("OPENAI_KEEPALIVE_EXPIRY_SEC"),
+    )
+    timeout = Timeout(_setting("OPENAI_READ_TIMEOUT_SEC"), connect=_setting("OPENAI_CONNECT_TIMEOUT_SEC"))
+    http2 = _setting("OPENAI_HTTP2") and _http2_available()
+    return DefaultHttpxClient(limits=limits, timeout=timeout, http2=http2)
@@ -0,0 +1,229 @@
+import streamlit as st
+import io
+import json
+import hashlib
+import re
+import html as html_entities
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+# ==========================
+#  PDFレポート設定
+# ==========================
+FONT_NAME = "NotoSansJP"
+FONT_PATH = "NotoSansJP-Regular.ttf"
+BLOCK_LINES = 40              # 文字起こしを1つの段落にまとめる行数（段落数を減らして生成を速くする）
+REPORT_CACHE_ENTRIES = 16     # メモリに保持するPDFの件数
+MARKDOWN_EXTENSIONS = ["tables", "sane_lists"]
+
+# Markdownのインライン要素とReportLabの段落内タグの対応（Noneはタグを付けずに中身だけ出力）
+_INLINE_TAGS = {"strong": "b", "b": "b", "em": "i", "i": "i", "u": "u", "del": "strike", "s": "strike",
+                "code": None, "a": None, "span": None}
+_XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+_NAMED_ENTITY = re.compile(r"&([A-Za-z][A-Za-z0-9]*);")
+
+
+def _resolve_entity(match):
+    # XMLで定義されていない実体参照（&nbsp; など）は文字に置き換える
+    if match.group(1) in _XML_ENTITIES:
+        return match.group(0)
+    resolved = html_entities.unescape(match.group(0))
+    return escape(resolved) if resolved != match.group(0) else "&amp;" + match.group(0)[1:]
+
+
+@st.cache_resource
+def register_fonts():
+    """日本語フォントを登録する（TTFの解析に時間がかかるため、プロセスで1回だけ行う）"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.lib.fonts import addMapping
+
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+    # 太字・斜体のフォントは無いため、<b>・<i>でも同じフォントを使う
+    for bold in (0, 1):
+        for italic in (0, 1):
+            addMapping(FONT_NAME, bold, italic, FONT_NAME)
+    return FONT_NAME
+
+
+def report_styles(font_name):
+    """レポートで使う段落スタイル"""
+    from reportlab.lib.styles import ParagraphStyle
+
+    body = ParagraphStyle(name="Japanese", fontName=font_name, fontSize=10, leading=14, wordWrap="CJK")
+    styles = {"body": body}
+    for level, size in enumerate((18, 15, 13, 12, 11, 10), start=1):
+        styles[f"h{level}"] = ParagraphStyle(
+            name=f"JapaneseHeading{level}", parent=body, fontSize=size, leading=size * 1.4,
+            spaceBefore=size * 0.6, spaceAfter=size * 0.3
+        )
+    styles["quote"] = ParagraphStyle(name="JapaneseQuote", parent=body, leftIndent=14, textColor="#555555")
+    styles["code"] = ParagraphStyle(name="JapaneseCode", parent=body, fontSize=9, leading=12, leftIndent=8)
+    return styles
+
+
+def _inline(element):
+    """要素の中身をReportLabの段落内マークアップにする"""
+    parts = [escape(element.text or "")]
+    for child in element:
+        if child.tag == "br":
+            parts.append("<br/>")
+        else:
+            tag = _INLINE_TAGS.get(child.tag)
+            inner = _inline(child)
+            parts.append(f"<{tag}>{inner}</{tag}>" if tag else inner)
+        parts.append(escape(child.tail or ""))
+    return "".join(parts)
+
+
+def _list_flowable(element, styles):
+    from reportlab.platypus import ListFlowable, ListItem
+
+    items = []
+    for item in element.findall("li"):
+        nested = [child for child in item if child.tag in ("ul", "ol", "p")]
+        if nested:
+            flowables = _block_flowables(item, styles)
+        else:
+            flowables = [_paragraph(_inline(item), styles["body"])]
+        items.append(ListItem(flowables, leftIndent=14))
+    ordered = element.tag == "ol"
+    return ListFlowable(
+        items, bulletType="1" if ordered else "bullet", start=None if ordered else "•",
+        bulletFontName=styles["body"].fontName, bulletFontSize=styles["body"].fontSize, leftIndent=14
+    )
+
+
+def _table_flowable(element, styles):
+    from reportlab.platypus import Table, TableStyle
+
+    rows = [[_paragraph(_inline(cell), styles["body"]) for cell in row] for row in element.iter("tr")]
+    table = Table(rows, repeatRows=1 if element.find("thead") is not None else 0)
+    table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, "#999999"),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("BACKGROUND", (0, 0), (-1, 0), "#eeeeee"),
+    ]))
+    return table
+
+
+def _paragraph(markup, style):
+    from reportlab.platypus import Paragraph
+
+    return Paragraph(markup, style)
+
+
+def _block_flowables(element, styles):
+    """ブロック要素を順にフローアブルへ変換する"""
+    from reportlab.platypus import Spacer, HRFlowable, XPreformatted
+
+    flowables = []
+    if (element.text or "").strip():
+        flowables.append(_paragraph(escape(element.text.strip()), styles["body"]))
+    for child in element:
+        if child.tag in styles and child.tag.startswith("h"):
+            flowables.append(_paragraph(_inline(child), styles[child.tag]))
+        elif child.tag == "p":
+            flowables.append(_paragraph(_inline(child), styles["body"]))
+            flowables.append(Spacer(1, 4))
+        elif child.tag in ("ul", "ol"):
+            flowables.append(_list_flowable(child, styles))
+            flowables.append(Spacer(1, 4))
+        elif child.tag == "blockquote":
+            for quoted in child:
+                flowables.append(_paragraph(_inline(quoted), styles["quote"]))
+        elif child.tag == "pre":
+            flowables.append(XPreformatted(escape("".join(child.itertext())), styles["code"]))
+        elif child.tag == "table":
+            flowables.append(_table_flowable(child, styles))
+            flowables.append(Spacer(1, 6))
+        elif child.tag == "hr":
+            flowables.append(HRFlowable(width="100%", color="#999999", spaceBefore=4, spaceAfter=4))
+        else:
+            flowables.append(_paragraph(_inline(child), styles["body"]))
+        if (child.tail or "").strip():
+            flowables.append(_paragraph(escape(child.tail.strip()), styles["body"]))
+    return flowables
+
+
+def markdown_flowables(text, styles):
+    """Markdownの要約を見出し・箇条書き・表などのフローアブルに変換する"""
+    import markdown
+
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, output_format="xhtml")
+    # 要約中のHTMLタグはそのまま文字として出力する（XMLとして解釈できなくなるため）
+    md.preprocessors.deregister("html_block")
+    md.inlinePatterns.deregister("html")
+    html = _NAMED_ENTITY.sub(_resolve_entity, md.convert(text))
+    try:
+        root = ET.fromstring(f"<div>{html}</div>")
+    except ET.ParseError:
+        # 想定外の理由でXMLとして解釈できない場合はテキストとして出力する
+        return text_flowables(text, styles)
+    return _block_flowables(root, styles)
+
+
+def text_flowables(text, styles, block_lines=BLOCK_LINES):
+    """プレーンテキストを、空行で区切られた段落ごと・最大block_lines行ずつの段落にまとめる"""
+    flowables = []
+    block = []
+
+    def flush():
+        if block:
+            flowables.append(_paragraph("<br/>".join(escape(line) for line in block), styles["body"]))
+            block.clear()
+
+    for line in text.split("\n"):
+        if not line.strip():
+            # 空行は段落の区切りとして扱い、その位置で改行が続かないようにする
+            if len(block) >= block_lines:
+                flush()
+            elif block:
+                block.append("")
+            continue
+        block.append(line)
+        if len(block) >= block_lines:
+            flush()
+    while block and block[-1] == "":
+        block.pop()
+    flush()
+    return flowables
+
+
+def build_pdf(sections, font_name=None):
+    """レポートのPDFを作成し、バイト列で返す
+
+    Args:
+        sections: (見出し, 本文, 本文がMarkdownならTrue) のリスト
+        font_name: 使用するフォント（Noneの場合は日本語フォントを登録して使う）
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+
+    styles = report_styles(font_name or register_fonts())
+    story = []
+    for title, body, is_markdown in sections:
+        if title:
+            story.append(_paragraph(escape(title), styles["h2"]))
+        story.extend(markdown_flowables(body, styles) if is_markdown else text_flowables(body, styles))
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter).build(story)
+    return buffer.getvalue()
+
+
+def report_hash(sections):
+    """レポートの内容のハッシュ（PDFのキャッシュキー）"""
+    encoded = json.dumps(sections, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+@st.cache_data(max_entries=REPORT_CACHE_ENTRIES, show_spinner=False)
+def _cached_pdf(key, _sections):
+    # 内容のハッシュだけをキーにする（_で始まる引数はStreamlitがハッシュ計算しない）
+    return build_pdf(_sections)
+
+
+def render_report(sections):
+    """レポートのPDFを返す（同じ内容のPDFは再実行のたびに作り直さない）"""
+    return _cached_pdf(report_hash(sections), sections)
@@ -0,0 +1,256 @@
+import streamlit as st
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+
+# ==========================
+#  レート制限設定
+# ==========================
+# モデルごとの1分あたりのリクエスト数(rpm)・トークン数(tpm)の上限
+MODEL_LIMITS = {
+    "gpt-5": {"rpm": 500, "tpm": 500000},
+    "gpt-5-mini": {"rpm": 500, "tpm": 500000},
+    "gpt-5-chat": {"rpm": 500, "tpm": 500000},
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "o1-mini": {"rpm": 500, "tpm": 200000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 30000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+    "whisper-1": {"rpm": 50, "tpm": None},
+}
+DEFAULT_LIMITS = {"rpm": 500, "tpm": 30000}
+MAX_QUEUE = 64          # 待機できるリクエスト数の上限（全セッション合計）
+MAX_RETRIES = 5         # 再試行の最大回数
+BASE_DELAY_SEC = 1.0    # 指数バックオフの初期待ち時間
+MAX_DELAY_SEC = 60.0    # 指数バックオフの最大待ち時間
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+RETRY_ERROR_NAMES = ("APITimeoutError", "APIConnectionError")
+
+
+class QueueFullError(Exception):
+    """待機中のリクエストが上限に達した場合のエラー"""
+
+    def __init__(self):
+        super().__init__("リクエストが混雑しています（rate_limit）。しばらく待ってから再試行してください。")
+
+
+class _Ticket:
+    """待機中のリクエスト（同一性で比較するためクラスにしている）"""
+    __slots__ = ("session", "model", "tokens")
+
+    def __init__(self, session, model, tokens):
+        self.session = session
+        self.model = model
+        self.tokens = tokens
+
+
+class TokenBucket:
+    """1分あたりの上限から補充量を決めるトークンバケット
+
+    Args:
+        per_minute: 1分あたりの上限（バケットの容量）
+        clock: 現在時刻を返す関数（テスト用）
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """amountを消費できるまでの待ち時間（秒）。容量を超える量は容量として扱う"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+def is_retryable(error):
+    """再試行すべきエラーかどうか（クォータ不足は再試行しても解決しないため除外）"""
+    if "insufficient_quota" in str(error):
+        return False
+    if getattr(error, "status_code", None) in RETRY_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRY_ERROR_NAMES
+
+
+def retry_after_seconds(error):
+    """エラー応答の Retry-After / retry-after-ms ヘッダーから待ち時間を取得する"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class RequestScheduler:
+    """OpenAI APIへのリクエストを流量制御するプロセス共通のスケジューラ
+
+    モデルごとにrpm・tpmのトークンバケットを持ち、上限内でのみリクエストを送る。
+    待機中のリクエストはセッションごとのキューに入れ、セッション間で順番に
+    （ラウンドロビンで）送信するため、1つのセッションが大量に送っても他のセッションが
+    待たされ続けることはない。429や一時的なエラーは Retry-After を優先しつつ
+    ジッター付きの指数バックオフで再試行する。
+
+    Args:
+        limits: モデルIDごとの {"rpm", "tpm"}
+        max_queue: 待機できるリクエスト数の上限
+        max_retries: 再試行の最大回数
+        clock: 現在時刻を返す関数（テスト用）
+        sleep: 待機に使う関数（テスト用）
+    """
+
+    def __init__(self, limits=MODEL_LIMITS, max_queue=MAX_QUEUE, max_retries=MAX_RETRIES,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.limits = limits
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {"requests": 0, "retries": 0, "rejected": 0}
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._queues = OrderedDict()  # session_id -> deque[_Ticket]（順番はラウンドロビンの巡回順）
+        self._waiting = 0
+
+    def _bucket_pair(self, model_id):
+        if model_id not in self._buckets:
+            limits = self.limits.get(model_id, DEFAULT_LIMITS)
+            self._buckets[model_id] = (
+                TokenBucket(limits["rpm"], self.clock),
+                TokenBucket(limits["tpm"], self.clock) if limits.get("tpm") else None,
+            )
+        return self._buckets[model_id]
+
+    def _wait_time(self, ticket):
+        requests, tokens = self._bucket_pair(ticket.model)
+        wait = requests.wait_time(1)
+        if tokens is not None:
+            wait = max(wait, tokens.wait_time(ticket.tokens))
+        return wait
+
+    def _next_ticket(self):
+        """巡回順に各セッションの先頭を見て、今送信できるものを返す"""
+        shortest = None
+        for queue in self._queues.values():
+            ticket = queue[0]
+            wait = self._wait_time(ticket)
+            if wait <= 0:
+                return ticket, 0.0
+            shortest = wait if shortest is None else min(shortest, wait)
+        return None, shortest
+
+    def _acquire(self, session_id, model_id, tokens):
+        with self._cond:
+            if self._waiting >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise QueueFullError()
+            ticket = _Ticket(session_id, model_id, tokens)
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._waiting += 1
+            try:
+                while True:
+                    chosen, wait = self._next_ticket()
+                    if chosen is ticket:
+                        break
+                    # 他のリクエストの完了通知か、バケットの補充を待つ
+                    self._cond.wait(timeout=min(wait, 1.0) if wait else 1.0)
+            except BaseException:
+                self._remove(ticket)
+                raise
+
+            requests, token_bucket = self._bucket_pair(model_id)
+            requests.consume(1)
+            if token_bucket is not None:
+                token_bucket.consume(tokens)
+            self._remove(ticket)
+            # 送信したセッションを巡回順の最後に回す
+            if session_id in self._queues:
+                self._queues.move_to_end(session_id)
+            self.stats["requests"] += 1
+
+    def _remove(self, ticket):
+        queue = self._queues.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[ticket.session]
+        self._cond.notify_all()
+
+    def estimated_wait(self, model_id, estimated_tokens):
+        """今送信した場合にバケットの補充を待つ秒数の見込み（待機中のリクエストは考慮しない）"""
+        with self._cond:
+            return self._wait_time(_Ticket(None, model_id, estimated_tokens))
+
+    def call(self, session_id, model_id, estimated_tokens, fn, fail_fast_status=()):
+        """流量制御の順番を待ってfnを呼び出し、一時的なエラーは再試行する
+
+        Args:
+            session_id: 公平に順番を回すためのセッションID
+            model_id: 送信先のモデルID
+            estimated_tokens: tpmとして消費する見込みのトークン数
+            fn: 実際にAPIを呼び出す関数
+            fail_fast_status: 再試行せずにすぐ送出するHTTPステータス
+                （呼び出し側が別のモデルに切り替える場合など）
+        """
+        attempt = 0
+        while True:
+            self._acquire(session_id, model_id, estimated_tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                if getattr(e, "status_code", None) in fail_fast_status:
+                    raise
+                delay = random.uniform(0, min(MAX_DELAY_SEC, BASE_DELAY_SEC * (2 ** attempt)))
+                retry_after = retry_after_seconds(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                attempt += 1
+                self.stats["retries"] += 1
+                self.sleep(delay)
+
+
+@st.cache_resource
+def get_scheduler():
+    """プロセス全体で共有するリクエストスケジューラ"""
+    return RequestScheduler()
+
+
+def current_session_id():
+    """現在のStreamlitセッションのID（スクリプト外から呼ばれた場合は共通のID）"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+    return ctx.session_id if ctx is not None else "default"
+
+
+def scheduled(model_id, estimated_tokens, fn, session_id=None, fail_fast_status=()):
+    """共有スケジューラを通してAPIを呼び出す"""
+    return get_scheduler().call(
+        session_id or current_session_id(), model_id, estimated_tokens, fn, fail_fast_status=fail_fast_status
+    )
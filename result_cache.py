@@ -0,0 +1,99 @@
+import streamlit as st
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ==========================
+#  処理結果キャッシュ設定
+# ==========================
+CACHE_DIR = os.environ.get("APP_CACHE_DIR", ".cache")
+RESULT_DB_PATH = os.path.join(CACHE_DIR, "audio_results.sqlite3")
+MAX_RESULT_BYTES = 200 * 1024 * 1024  # 最大サイズ（200MB、超えたら古いアクセス順に削除）
+
+
+def make_result_key(stage, audio_hash, params):
+    """処理段階・音声のハッシュ・処理のパラメータからキャッシュキーを作成する"""
+    encoded = json.dumps({"stage": stage, "audio": audio_hash, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """音声処理の結果（話者分離・文字起こし・要約）のディスクキャッシュ
+
+    同じ音声を同じパラメータで処理した結果を、音声内容のハッシュをキーに保存する。
+    再実行やダウンロードボタンによる再描画、同じファイルの再アップロードでは
+    話者分離やAPI呼び出しを行わずに結果を返す。
+    値はJSONで保存し、合計サイズが上限を超えたらアクセスが古い順に削除する。
+
+    Args:
+        path: SQLiteファイルのパス
+        max_bytes: 最大サイズ
+    """
+
+    def __init__(self, path=RESULT_DB_PATH, max_bytes=MAX_RESULT_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, stage TEXT NOT NULL, value TEXT NOT NULL, "
+            "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed)")
+        self._conn.commit()
+
+    def get(self, stage, audio_hash, **params):
+        """キャッシュされた結果を返す（無ければNone）"""
+        key = make_result_key(stage, audio_hash, params)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return json.loads(row[0])
+
+    def set(self, stage, audio_hash, value, **params):
+        """結果を保存し、容量超過分を削除する"""
+        key = make_result_key(stage, audio_hash, params)
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, stage, value, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, encoded, time.time(), len(encoded.encode("utf-8")))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # アクセスが古い順に削除して上限以下に収める
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        """全てのキャッシュを削除する"""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+@st.cache_resource
+def get_result_cache():
+    """プロセス全体で共有する処理結果キャッシュ"""
+    return ResultCache()
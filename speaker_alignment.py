@@ -0,0 +1,116 @@
+import bisect
+
+# ==========================
+#  話者の割り当て設定
+# ==========================
+MAX_GAP_SEC = 1.0  # 話者の区間と重ならないセグメントは、この秒数以内の最も近い話者に割り当てる
+UNKNOWN_SPEAKER = "不明"
+
+
+class SpeakerTimeline:
+    """話者分離の区間を開始時刻順に並べ、時刻の範囲と重なる区間を二分探索で求める
+
+    区間は重なることがあるため、開始時刻の配列に加えて
+    「その位置までの区間の終了時刻の最大値」の配列を持つ。
+    これにより、範囲の終わりより前に始まる区間を後ろからたどり、
+    それ以前に範囲と重なる区間が無いと分かった時点で打ち切れる。
+
+    Args:
+        turns: (開始秒, 終了秒, 話者) のリスト
+    """
+
+    def __init__(self, turns):
+        self.turns = sorted(turns)
+        self.starts = [start for start, _, _ in self.turns]
+        self.ends = [end for _, end, _ in self.turns]
+        self.max_ends = []    # その位置までの区間の終了時刻の最大値
+        self._latest = []     # その位置までで最も遅く終わる区間の位置
+        latest = None
+        for index, end in enumerate(self.ends):
+            if latest is None or end > self.ends[latest]:
+                latest = index
+            self.max_ends.append(self.ends[latest])
+            self._latest.append(latest)
+
+    @classmethod
+    def from_diarization(cls, diarization):
+        """pyannoteの話者分離結果から作成する"""
+        return cls([(turn.start, turn.end, speaker) for turn, _, speaker in diarization.itertracks(yield_label=True)])
+
+    def __len__(self):
+        return len(self.turns)
+
+    def overlaps(self, start, end):
+        """範囲 [start, end) と重なる区間の (重なりの秒数, 話者) を返す"""
+        found = []
+        index = bisect.bisect_left(self.starts, end) - 1
+        while index >= 0 and self.max_ends[index] > start:
+            overlap = min(end, self.ends[index]) - max(start, self.starts[index])
+            if overlap > 0:
+                found.append((overlap, self.turns[index][2]))
+            index -= 1
+        return found
+
+    def nearest(self, time):
+        """時刻に最も近い区間の (距離の秒数, 話者) を返す（区間が無ければNone）"""
+        if not self.turns:
+            return None
+        index = bisect.bisect_right(self.starts, time)
+        candidates = []
+        if index < len(self.turns):
+            candidates.append((self.starts[index] - time, self.turns[index][2]))
+        if index > 0:
+            # 手前に始まる区間のうち最も遅く終わるもの
+            previous = self._latest[index - 1]
+            candidates.append((max(time - self.ends[previous], 0.0), self.turns[previous][2]))
+        return min(candidates)
+
+    def speaker_at(self, start, end, max_gap=MAX_GAP_SEC):
+        """範囲と最も長く重なる話者（重なる区間が無ければ近くの話者）を返す"""
+        totals = {}
+        for overlap, speaker in self.overlaps(start, end):
+            totals[speaker] = totals.get(speaker, 0.0) + overlap
+        if totals:
+            return max(totals, key=totals.get)
+        nearest = self.nearest((start + end) / 2)
+        if nearest is not None and nearest[0] <= max_gap:
+            return nearest[1]
+        return UNKNOWN_SPEAKER
+
+
+def _join(left, right):
+    # 英数字どうしの間にだけ空白を入れる（日本語は空白なしでつなげる）
+    if left and right and left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return left + " " + right
+    return left + right
+
+
+def align_segments(segments, timeline, max_gap=MAX_GAP_SEC):
+    """文字起こしのセグメントに話者を割り当て、同じ話者の連続するセグメントをまとめる
+
+    Args:
+        segments: {"start", "end", "text"} のリスト（時刻は音声全体の先頭から）
+        timeline: 話者分離の区間（SpeakerTimeline）
+        max_gap: 話者の区間と重ならないセグメントを近くの話者に割り当てる最大の距離
+
+    Returns:
+        {"speaker", "start", "end", "text"} の時刻順のリスト
+    """
+    utterances = []
+    for segment in sorted(segments, key=lambda s: s["start"]):
+        text = segment["text"].strip()
+        if not text:
+            continue
+        speaker = timeline.speaker_at(segment["start"], segment["end"], max_gap)
+        if utterances and utterances[-1]["speaker"] == speaker:
+            last = utterances[-1]
+            last["end"] = max(last["end"], segment["end"])
+            last["text"] = _join(last["text"], text)
+        else:
+            utterances.append({"speaker": speaker, "start": segment["start"], "end": segment["end"], "text": text})
+    return utterances
+
+
+def format_utterances(utterances):
+    """話者ごとの発言を「話者: 発言」の形式のテキストにする"""
+    return "".join(f"{u['speaker']}: {u['text']}\n\n" for u in utterances)
@@ -0,0 +1,120 @@
+"""起動時間の計測
+
+アプリ内では APP_PROFILE_IMPORTS=1 のとき、各ページのモジュールを初めて読み込んだ時間と
+そのとき新たに読み込まれたモジュール数をサイドバーに表示する。
+
+コマンドラインでは、各ページを新しいPythonプロセスで読み込んだときの時間を
+`python -X importtime` で計測し、時間のかかったモジュールと予算の超過を表示する。
+
+    python startup_profile.py [--top 15]
+"""
+import streamlit as st
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+# ==========================
+#  起動時間の予算
+# ==========================
+# ページのモジュールを新しいプロセスで読み込むときの上限（秒、streamlit自体の読み込みを含む）
+STARTUP_BUDGET_SEC = {
+    "chat": 1.0,
+    "csv_analyzer": 1.0,
+    "transcriber": 1.0,
+}
+# ページ表示の時点では読み込まないモジュール（実際に使うときに読み込む）
+DEFERRED_MODULES = ("pandas", "openai", "httpx", "reportlab", "pyannote", "torch", "tiktoken")
+PROFILE_ENV = "APP_PROFILE_IMPORTS"
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profiling_enabled():
+    return os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+@st.cache_resource
+def get_import_records():
+    """プロセス内で各ページを初めて読み込んだときの記録"""
+    return {}
+
+
+@contextmanager
+def import_timer(page):
+    """ページの読み込み時間を記録する（読み込み済みの場合は記録しない）"""
+    records = get_import_records()
+    before = len(sys.modules)
+    started = time.perf_counter()
+    yield
+    if page not in records:
+        records[page] = {
+            "seconds": time.perf_counter() - started,
+            "new_modules": len(sys.modules) - before,
+            "deferred_loaded": [name for name in DEFERRED_MODULES if name in sys.modules],
+        }
+
+
+def render_import_profile():
+    """読み込み時間の記録をサイドバー向けに表示する（計測モードのときのみ）"""
+    if not profiling_enabled():
+        return
+    with st.expander("⏱️ 起動時間（モジュールの読み込み）", expanded=False):
+        for page, record in get_import_records().items():
+            st.caption(
+                f"{page}: {record['seconds'] * 1000:.0f} ms・新規モジュール {record['new_modules']} 件"
+            )
+            if record["deferred_loaded"]:
+                st.caption("　読み込み済みの重いモジュール: " + ", ".join(record["deferred_loaded"]))
+        st.caption("詳細は `python startup_profile.py` で確認できます")
+
+
+def profile_module(module, python=sys.executable):
+    """新しいプロセスでmoduleを読み込み、(合計秒, [(モジュール名, 自身の秒, 累計秒), ...]) を返す"""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    rows = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        rows.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+        # インデントの無い行が最上位のimport
+        if len(indent) <= 1:
+            total += int(cumulative_us) / 1e6
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else module)
+    return total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各ページの起動時間（import時間）を計測する")
+    parser.add_argument("--top", type=int, default=15, help="表示する時間のかかったモジュール数")
+    parser.add_argument("modules", nargs="*", default=list(STARTUP_BUDGET_SEC))
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        total, rows = profile_module(module)
+        budget = STARTUP_BUDGET_SEC.get(module)
+        status = "" if budget is None else ("OK" if total <= budget else "予算超過")
+        over_budget = over_budget or (budget is not None and total > budget)
+        print(f"## {module}: {total * 1000:.0f} ms（予算 {budget * 1000:.0f} ms）{status}" if budget
+              else f"## {module}: {total * 1000:.0f} ms")
+        loaded = {name.split(".")[0] for name, _, _ in rows}
+        deferred = [name for name in DEFERRED_MODULES if name in loaded]
+        if deferred:
+            print(f"   起動時に読み込まれた重いモジュール: {', '.join(deferred)}")
+        for name, self_sec, cumulative_sec in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+            print(f"   {cumulative_sec * 1000:8.1f} ms（自身 {self_sec * 1000:6.1f} ms）  {name}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import time
+
+# ==========================
+#  ストリーミング描画設定
+# ==========================
+FLUSH_INTERVAL_SEC = 0.05  # 最短の再描画間隔（秒）
+FLUSH_MIN_CHARS = 200      # この文字数が溜まったら間隔に関係なく再描画
+CURSOR = "▌"
+
+
+def iter_stream_text(response_stream, usage=None):
+    """Chat Completionsのストリームからテキスト差分のみを取り出す
+
+    usageのみのチャンクなど、choicesが空のチャンクは読み飛ばす。
+    usageに辞書を渡すと、stream_options={"include_usage": True} で返される
+    トークン数（prompt_tokens, completion_tokens）を書き込む。
+    """
+    for chunk in response_stream:
+        chunk_usage = getattr(chunk, "usage", None)
+        if usage is not None and chunk_usage:
+            usage["prompt_tokens"] = chunk_usage.prompt_tokens
+            usage["completion_tokens"] = chunk_usage.completion_tokens
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+class ThrottledRenderer:
+    """ストリーミング応答をプレースホルダーへ間引いて描画する
+
+    チャンクごとにMarkdownを再描画すると長い応答で描画コストが二乗的に増えるため、
+    一定時間または一定文字数が溜まった時点でのみ描画する。
+    最初のチャンクは即座に描画し、体感の初回表示を早くする。
+
+    Args:
+        placeholder: st.empty() などの描画先
+        interval: 最短の再描画間隔（秒）
+        min_chars: 間隔に関係なく再描画する未描画文字数
+        cursor: 生成中に末尾へ表示するカーソル
+        clock: 経過時間の計測に使う関数（テスト用）
+    """
+
+    def __init__(self, placeholder, interval=FLUSH_INTERVAL_SEC, min_chars=FLUSH_MIN_CHARS,
+                 cursor=CURSOR, clock=time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.min_chars = min_chars
+        self.cursor = cursor
+        self.clock = clock
+        self.flush_count = 0
+        self.render_sec = 0.0  # 描画に費やした時間の合計（計測用）
+        self._parts = []
+        self._text = ""
+        self._pending_chars = 0
+        self._unflushed_chars = 0
+        self._last_flush = None
+
+    @property
+    def text(self):
+        """これまでに受信した全テキスト"""
+        if self._pending_chars:
+            self._text += "".join(self._parts)
+            self._parts = []
+            self._pending_chars = 0
+        return self._text
+
+    def append(self, delta):
+        """差分を追加し、必要であれば描画する"""
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._pending_chars += len(delta)
+        self._unflushed_chars += len(delta)
+
+        now = self.clock()
+        if (self._last_flush is None
+                or self._unflushed_chars >= self.min_chars
+                or now - self._last_flush >= self.interval):
+            self.flush(now=now)
+
+    def tick(self):
+        """未描画の内容があり、描画間隔が経過していれば描画する"""
+        if self._unflushed_chars and self.clock() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self, final=False, now=None):
+        """未描画の内容を描画する（final=Trueでカーソルを外して確定表示）"""
+        text = self.text
+        started = time.perf_counter()
+        self.placeholder.markdown(text if final else text + self.cursor)
+        self.render_sec += time.perf_counter() - started
+        self._last_flush = self.clock() if now is None else now
+        self._unflushed_chars = 0
+        self.flush_count += 1
+
+    def consume(self, deltas):
+        """差分のイテラブルを最後まで描画し、全文を返す"""
+        for delta in deltas:
+            self.append(delta)
+        self.flush(final=True)
+        return self.text
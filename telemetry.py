@@ -0,0 +1,145 @@
+import streamlit as st
+import os
+import json
+import math
+import time
+import threading
+from collections import defaultdict, deque
+
+# ==========================
+#  計測設定
+# ==========================
+METRICS_PATH = os.environ.get(
+    "APP_METRICS_PATH", os.path.join(os.environ.get("APP_CACHE_DIR", ".cache"), "metrics.jsonl")
+)
+MAX_METRICS_BYTES = 10 * 1024 * 1024  # 計測ログの最大サイズ（超えたら .1 に退避して新しいファイルに書く）
+ROLLING_WINDOW = 200  # p50/p95の計算に使う直近の件数（モデルごと）
+PARAM_KEYS = ("ttft_sec", "latency_sec", "chunks", "tokens_per_sec", "prompt_tokens",
+              "completion_tokens", "cached", "render_sec")
+
+
+def percentile(values, q):
+    """最近傍順位法によるパーセンタイル（値が無ければNone）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(q / 100.0 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def finalize_stats(stats):
+    """計測値からtokens/sを計算する（ストリームはTTFT以降の生成時間で割る）"""
+    latency = stats.get("latency_sec")
+    completion_tokens = stats.get("completion_tokens")
+    if latency and completion_tokens:
+        generation = latency - (stats.get("ttft_sec") or 0)
+        stats["tokens_per_sec"] = completion_tokens / generation if generation > 0 else None
+    return stats
+
+
+def metrics_params(stats):
+    """メッセージのparamsに保存する計測値を取り出す"""
+    return {key: stats.get(key) for key in PARAM_KEYS if key in stats}
+
+
+class MetricsRecorder:
+    """API呼び出しの計測値を記録する
+
+    モデルごとに直近の計測値を保持してp50/p95を計算し、
+    外部から収集できるようJSON Lines形式のファイルにも追記する。
+    ファイルが max_bytes を超えたら1世代前（path + ".1"）に退避する。
+
+    Args:
+        path: 計測値を追記するJSONLファイル（Noneの場合は書き出さない）
+        window: モデルごとに保持する直近の件数
+        max_bytes: ファイルの最大サイズ
+    """
+
+    def __init__(self, path=METRICS_PATH, window=ROLLING_WINDOW, max_bytes=MAX_METRICS_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._records = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, kind, model_id, stats):
+        """1回の呼び出しの計測値を記録する"""
+        entry = {"ts": time.time(), "kind": kind, "model": model_id}
+        entry.update(finalize_stats(dict(stats)))
+        with self._lock:
+            self._records[(kind, model_id)].append(entry)
+            if self.path:
+                self._append(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def _append(self, line):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(line.encode("utf-8")) > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def model_stats(self, model_id, kind="chat"):
+        """ルーティング用に、直近の件数・エラー率・TTFTとtokens/sの中央値を返す"""
+        with self._lock:
+            records = list(self._records.get((kind, model_id), ()))
+        completed = [r for r in records if not r.get("error") and not r.get("cached")]
+        return {
+            "count": len(records),
+            "error_rate": sum(1 for r in records if r.get("error")) / len(records) if records else 0.0,
+            "ttft_sec": percentile([r["ttft_sec"] for r in completed if r.get("ttft_sec") is not None], 50),
+            "tokens_per_sec": percentile([r["tokens_per_sec"] for r in completed if r.get("tokens_per_sec")], 50),
+        }
+
+    def summary(self):
+        """種類・モデルごとの件数とp50/p95を返す"""
+        with self._lock:
+            groups = {key: list(records) for key, records in self._records.items()}
+        rows = []
+        for (kind, model_id), records in sorted(groups.items()):
+            latencies = [r["latency_sec"] for r in records if r.get("latency_sec") is not None]
+            ttfts = [r["ttft_sec"] for r in records if r.get("ttft_sec") is not None]
+            speeds = [r["tokens_per_sec"] for r in records if r.get("tokens_per_sec")]
+            errors = sum(1 for r in records if r.get("error"))
+            rows.append({
+                "種類": kind,
+                "モデル": model_id,
+                "件数": len(records),
+                "レイテンシ p50 (s)": percentile(latencies, 50),
+                "レイテンシ p95 (s)": percentile(latencies, 95),
+                "TTFT p50 (s)": percentile(ttfts, 50),
+                "TTFT p95 (s)": percentile(ttfts, 95),
+                "tokens/s p50": percentile(speeds, 50),
+                "エラー率": errors / len(records),
+            })
+        return rows
+
+
+@st.cache_resource
+def get_metrics():
+    """プロセス全体で共有する計測値の記録先"""
+    return MetricsRecorder()
+
+
+def measure(kind, model_id, fn, **fields):
+    """fnの実行時間を計測して記録し、fnの戻り値を返す"""
+    started = time.perf_counter()
+    result = fn()
+    stats = dict(fields, latency_sec=time.perf_counter() - started)
+    get_metrics().record(kind, model_id, stats)
+    return result
+
+
+def render_diagnostics():
+    """モデルごとのp50/p95をサイドバー向けに表示する"""
+    with st.expander("📈 API診断（直近のレイテンシ）", expanded=False):
+        rows = get_metrics().summary()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("まだAPI呼び出しの記録はありません")
+        st.caption(f"計測ログ: {METRICS_PATH}")
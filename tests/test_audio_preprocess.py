@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import wave
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from audio_preprocess import normalize_audio, normalized_paths, evict, detect_silences_in_wav
+
+
+def fake_ffmpeg(command, **kwargs):
+    # 出力先（-c:a の後に続くパス）に空のファイルを書き出す
+    with open(command[command.index("pcm_s16le") + 1], "wb") as f:
+        f.write(b"pcm")
+    with open(command[-1], "wb") as f:
+        f.write(b"mp3")
+    return MagicMock(returncode=0)
+
+
+class TestAudioPreprocess(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, "normalized")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_decodes_once_into_both_outputs_and_reuses_them(self):
+        with patch("audio_preprocess.subprocess.run", side_effect=fake_ffmpeg) as run:
+            paths = normalize_audio("in.mp3", "abc", self.directory, ffmpeg="ffmpeg")
+            self.assertEqual(paths, normalized_paths("abc", self.directory))
+            self.assertEqual(normalize_audio("in.mp3", "abc", self.directory, ffmpeg="ffmpeg"), paths)
+        self.assertEqual(run.call_count, 1)
+        command = run.call_args.args[0]
+        self.assertEqual(command.count("-i"), 1)
+        self.assertEqual(command.count("16000"), 2)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["abc.mp3", "abc.wav"])
+
+    def test_returns_none_without_ffmpeg_or_on_failure(self):
+        with patch("audio_preprocess.ffmpeg_path", return_value=None):
+            self.assertIsNone(normalize_audio("in.mp3", "abc", self.directory))
+        with patch("audio_preprocess.subprocess.run", return_value=MagicMock(returncode=1)):
+            self.assertIsNone(normalize_audio("in.mp3", "abc", self.directory, ffmpeg="ffmpeg"))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_evicts_least_recently_used(self):
+        os.makedirs(self.directory)
+        for index, audio_hash in enumerate(["old", "new", "current"]):
+            for path in normalized_paths(audio_hash, self.directory).values():
+                with open(path, "wb") as f:
+                    f.write(b"x" * 100)
+                os.utime(path, (index, index))
+        evict(self.directory, max_bytes=400, keep="current")
+        self.assertEqual(sorted(os.listdir(self.directory)), ["current.mp3", "current.wav", "new.mp3", "new.wav"])
+
+    def test_recently_used_audio_is_not_evicted(self):
+        # 他のセッションの処理中の音声は、上限を超えていても削除しない
+        os.makedirs(self.directory)
+        for audio_hash in ["other_job", "current"]:
+            for path in normalized_paths(audio_hash, self.directory).values():
+                with open(path, "wb") as f:
+                    f.write(b"x" * 100)
+        evict(self.directory, max_bytes=100, keep="current", in_use_sec=60)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_detect_silences_in_wav(self):
+        import numpy as np
+        path = os.path.join(self.tmpdir.name, "a.wav")
+        tone = (np.sin(np.arange(16000) / 5) * 10000).astype("<i2")
+        samples = np.concatenate([tone, np.zeros(16000, dtype="<i2"), tone])
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(samples.tobytes())
+        with patch("audio_preprocess.PCM_BLOCK_SEC", 0.5):
+            self.assertEqual(detect_silences_in_wav(path), [1.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import subprocess
+import unittest
+from bench_chat import BUDGETS, check_budgets, parse_budgets
+
+BENCH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bench_chat.py'))
+
+
+class TestBenchChat(unittest.TestCase):
+    def row(self, **values):
+        row = {"history": 0, "errors": 0, **{metric: limit / 2 for metric, limit in BUDGETS.items()}}
+        row.update(values)
+        return row
+
+    def test_check_budgets_reports_exceeded_metrics_errors_and_nan(self):
+        self.assertEqual(check_budgets([self.row()], BUDGETS), [])
+        violations = check_budgets([self.row(idle_rerun_ms=1e6, overhead_ms=float("nan"), errors=2)], BUDGETS)
+        self.assertEqual(len(violations), 3)
+        self.assertTrue(any("idle_rerun_ms" in v for v in violations))
+        self.assertTrue(any("overhead_ms" in v for v in violations))
+        self.assertTrue(any("errors=2" in v for v in violations))
+
+    def test_parse_budgets_overrides_known_metrics_only(self):
+        self.assertEqual(parse_budgets(["idle_rerun_ms=10"])["idle_rerun_ms"], 10.0)
+        with self.assertRaises(SystemExit):
+            parse_budgets(["unknown=1"])
+
+    def test_smallest_configuration_runs_within_budgets(self):
+        # アプリのキャッシュ等の設定を汚さないよう、別プロセスで実行する
+        result = subprocess.run(
+            [sys.executable, BENCH_PATH, "--chunks", "50", "--history", "0", "--iterations", "1", "--output", ""],
+            capture_output=True, text=True, timeout=300
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertIn("render_us_per_chunk", result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
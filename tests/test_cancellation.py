@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import unittest
+from unittest.mock import patch
+from cancellation import CancelToken, iter_cancellable, run_cancellable, with_script_context
+
+
+class TestCancellation(unittest.TestCase):
+    def test_callbacks_run_once_and_late_registration_runs_immediately(self):
+        calls = []
+        token = CancelToken()
+        token.on_cancel(lambda: calls.append("close"))
+        token.cancel()
+        token.cancel()
+        token.on_cancel(lambda: calls.append("late"))
+        self.assertTrue(token.cancelled)
+        self.assertEqual(calls, ["close", "late"])
+
+    def test_iter_cancellable_cancels_when_consumer_stops(self):
+        token = CancelToken()
+        released = threading.Event()
+        token.on_cancel(released.set)
+
+        def produce():
+            yield "a"
+            # 中断されるまで次のチャンクが届かない（接続待ちの状態）
+            released.wait(5)
+            yield "b"
+
+        items = iter_cancellable(produce, token, interval=0.01)
+        self.assertEqual(next(items), "a")
+        items.close()
+        self.assertTrue(token.cancelled)
+
+    def test_run_cancellable_propagates_interrupt_from_heartbeat(self):
+        token = CancelToken()
+        finished = threading.Event()
+        token.on_cancel(finished.set)
+
+        class Interrupted(BaseException):
+            pass
+
+        def heartbeat():
+            raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            run_cancellable(lambda: finished.wait(5), token, heartbeat=heartbeat, interval=0.01)
+        self.assertTrue(token.cancelled)
+
+    def test_run_cancellable_returns_result_and_raises_errors(self):
+        token = CancelToken()
+        self.assertEqual(run_cancellable(lambda: 42, token), 42)
+        with self.assertRaises(ValueError):
+            run_cancellable(lambda: int("x"), token)
+        self.assertFalse(token.cancelled)
+
+    def test_with_script_context_passes_caller_context_to_worker(self):
+        ctx = object()
+        attached = []
+        with patch('cancellation.get_script_run_ctx', return_value=ctx), \
+                patch('cancellation.add_script_run_ctx', side_effect=lambda thread, c: attached.append((thread, c))):
+            work = with_script_context(lambda x: x * 2)
+            thread = threading.Thread(target=lambda: attached.append(work(21)))
+            thread.start()
+            thread.join()
+        self.assertEqual(attached, [(thread, ctx), 42])
+
+    def test_with_script_context_without_context_runs_as_is(self):
+        with patch('cancellation.get_script_run_ctx', return_value=None), \
+                patch('cancellation.add_script_run_ctx') as mock_add:
+            self.assertEqual(with_script_context(lambda: "ok")(), "ok")
+        mock_add.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,35 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
-from chat import main as chat_main
+from conversation_store import ConversationStore
+from telemetry import MetricsRecorder
+from streaming import CURSOR
+from chat import (main as chat_main, run_comparison, history_window_start, start_conversation, conversation_owner,
+                  jump_to_message, render_focused_messages, back_to_latest)
 
 class TestChat(unittest.TestCase):
+    def setUp(self):
+        # 計測値はアプリの計測ログに書き出さない
+        metrics = MetricsRecorder(path=None)
+        for target in ('llm_cache.get_metrics', 'telemetry.get_metrics'):
+            patcher = patch(target, return_value=metrics)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # アプリの会話ストアに書き込まないよう、一時ディレクトリのストアを使う
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ConversationStore(os.path.join(self.tmpdir.name, "conversations.sqlite3"))
+        patcher = patch('chat.get_conversation_store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
     @patch('chat.st')
-    @patch('chat.OpenAI')
-    def test_chat_functionality(self, mock_openai, mock_st):
+    @patch('chat.get_client')
+    def test_chat_functionality(self, mock_get_client, mock_st):
         # Streamlitのセッション状態をモック
         mock_st.session_state = MagicMock()
         mock_st.session_state.messages = []
@@ -17,23 +38,282 @@ class TestChat(unittest.TestCase):
         
         # OpenAIのクライアントをモック
         mock_client = MagicMock()
-        mock_openai.return_value = mock_client
-        mock_client.chat.completions.create.return_value = MagicMock(
-            choices=[MagicMock(message=MagicMock(content="こんにちは！何かお手伝いできることがあれば教えてください。"))]
-        )
+        mock_get_client.return_value = mock_client
+        mock_client.chat.completions.create.return_value = [
+            MagicMock(choices=[MagicMock(delta=MagicMock(content="こんにちは！何かお手伝いできることがあれば教えてください。"))], usage=None)
+        ]
+        
+        # st.columnsは指定した数のカラムを返す
+        mock_st.columns.side_effect = lambda spec, **kwargs: [MagicMock() for _ in range(spec if isinstance(spec, int) else len(spec))]
+        # 応答キャッシュを使わずに毎回APIを呼び出す
+        mock_st.checkbox.return_value = False
+        # スライダーは既定値を返す
+        mock_st.slider.side_effect = lambda label, min_value, max_value, value, step: value
+        # 履歴クリア等のボタンは押されていない
+        mock_st.button.return_value = False
+        # 履歴検索は使わない
+        mock_st.text_input.return_value = ""
         
         # ユーザーの入力をシミュレート
         mock_st.chat_input.return_value = "こんにちは"
         
         # Streamlitのselectboxの戻り値を設定
-        mock_st.selectbox.return_value = "gpt-4o"
+        mock_st.selectbox.return_value = "GPT-4o (マルチモーダル)"
 
         chat_main()
         
         # メッセージが正しく追加されたか確認
         self.assertEqual(len(mock_st.session_state.messages), 2)
         self.assertEqual(mock_st.session_state.messages[0]['content'], "こんにちは")
-        self.assertTrue(len(mock_st.session_state.messages[1]['content']) > 0)
+        self.assertEqual(mock_st.session_state.messages[1]['content'], "こんにちは！何かお手伝いできることがあれば教えてください。")
+
+    @patch('chat.st')
+    @patch('chat.get_client')
+    def test_run_comparison_streams_each_model(self, mock_get_client, mock_st):
+        mock_st.columns.side_effect = lambda spec, **kwargs: [MagicMock() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+        def fake_create(**params):
+            if params["model"] == "gpt-3.5-turbo":
+                raise Exception("rate_limit_exceeded")
+            usage_chunk = MagicMock(choices=[], usage=MagicMock(prompt_tokens=5, completion_tokens=2))
+            return [MagicMock(choices=[MagicMock(delta=MagicMock(content=params["model"]))], usage=None), usage_chunk]
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = fake_create
+        mock_get_client.return_value = mock_client
+
+        results = run_comparison(
+            ["GPT-4o (マルチモーダル)", "GPT-3.5-turbo (従来型)"],
+            [{"role": "user", "content": "こんにちは"}],
+            0.7,
+            1000
+        )
+
+        text, stats, error = results[0]
+        self.assertEqual(text, "gpt-4o")
+        self.assertIsNone(error)
+        self.assertEqual(stats["completion_tokens"], 2)
+        self.assertIsNotNone(stats["ttft_sec"])
+        self.assertIsNotNone(results[1][2])
+
+    @patch('chat.append_message')
+    @patch('chat.st')
+    @patch('chat.get_client')
+    def test_stopped_comparison_keeps_partial_responses(self, mock_get_client, mock_st, mock_append):
+        mock_st.columns.side_effect = lambda spec, **kwargs: [MagicMock() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+        class Stop(BaseException):
+            pass
+
+        first_done = threading.Event()
+        released = threading.Event()
+
+        def show_first(text):
+            # カーソルの無い描画は応答の確定表示
+            if not text.endswith(CURSOR):
+                first_done.set()
+
+        def stop_second(text):
+            # 2つ目のモデルの途中経過が描画された時点で停止ボタンが押されたことにする
+            released.set()
+            raise Stop()
+
+        placeholders = [MagicMock(), MagicMock(), MagicMock()]
+        placeholders[0].markdown.side_effect = show_first
+        placeholders[1].markdown.side_effect = stop_second
+        mock_st.empty.side_effect = placeholders
+
+        def slow_stream(model):
+            first_done.wait(5)
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=f"{model} 途中"))], usage=None)
+            released.wait(5)
+
+        def fake_create(**params):
+            if params["model"] == "gpt-4o":
+                return [MagicMock(choices=[MagicMock(delta=MagicMock(content="gpt-4o 完了"))], usage=None)]
+            return slow_stream(params["model"])
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = fake_create
+        mock_get_client.return_value = mock_client
+
+        with self.assertRaises(Stop):
+            run_comparison(
+                ["GPT-4o (マルチモーダル)", "GPT-3.5-turbo (従来型)"],
+                [{"role": "user", "content": "こんにちは"}],
+                0.7,
+                1000
+            )
+
+        saved = [call.args[0] for call in mock_append.call_args_list]
+        self.assertEqual([m["content"] for m in saved], ["gpt-4o 完了", "gpt-3.5-turbo 途中"])
+        self.assertFalse(saved[0].get("truncated", False))
+        self.assertTrue(saved[1]["truncated"])
+        self.assertEqual(saved[0]["compare_group"], saved[1]["compare_group"])
+        self.assertTrue(saved[1]["compare_alternate"])
+
+    @patch('chat.st')
+    @patch('chat.get_router')
+    @patch('chat.get_client')
+    def test_auto_model_falls_back_and_records_served_model(self, mock_get_client, mock_get_router, mock_st):
+        mock_st.session_state = MagicMock()
+        mock_st.session_state.messages = []
+        mock_st.columns.side_effect = lambda spec, **kwargs: [MagicMock() for _ in range(spec if isinstance(spec, int) else len(spec))]
+        mock_st.checkbox.return_value = False
+        mock_st.slider.side_effect = lambda label, min_value, max_value, value, step: value
+        mock_st.button.return_value = False
+        # 履歴検索は使わない
+        mock_st.text_input.return_value = ""
+        mock_st.chat_input.return_value = "こんにちは"
+        mock_st.selectbox.return_value = "自動選択 (応答速度優先)"
+
+        def fake_create(**params):
+            if params["model"] == "gpt-3.5-turbo":
+                raise Exception("Error code: 404 - model_not_found")
+            return [MagicMock(choices=[MagicMock(delta=MagicMock(content="応答"))], usage=None)]
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = fake_create
+        mock_get_client.return_value = mock_client
+        router = mock_get_router.return_value
+        router.route.return_value = ["gpt-3.5-turbo", "gpt-4o"]
+
+        chat_main()
+
+        reply = mock_st.session_state.messages[1]
+        self.assertEqual(reply['content'], "応答")
+        self.assertEqual(reply['model_info'], "GPT-4o (マルチモーダル)")
+        self.assertEqual(reply['params']['model'], "gpt-4o")
+        router.mark_failure.assert_called_once()
+
+    @patch('chat.st')
+    @patch('chat.get_router')
+    @patch('chat.get_client')
+    def test_auto_model_rate_limit_switches_without_retry(self, mock_get_client, mock_get_router, mock_st):
+        mock_st.session_state = MagicMock()
+        mock_st.session_state.messages = []
+        mock_st.columns.side_effect = lambda spec, **kwargs: [MagicMock() for _ in range(spec if isinstance(spec, int) else len(spec))]
+        mock_st.checkbox.return_value = False
+        mock_st.slider.side_effect = lambda label, min_value, max_value, value, step: value
+        mock_st.button.return_value = False
+        mock_st.text_input.return_value = ""
+        mock_st.chat_input.return_value = "こんにちは"
+        mock_st.selectbox.return_value = "自動選択 (応答速度優先)"
+
+        class RateLimitError(Exception):
+            status_code = 429
+
+        calls = []
+
+        def fake_create(**params):
+            calls.append(params["model"])
+            if params["model"] == "gpt-3.5-turbo":
+                raise RateLimitError("rate_limit_exceeded")
+            return [MagicMock(choices=[MagicMock(delta=MagicMock(content="応答"))], usage=None)]
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = fake_create
+        mock_get_client.return_value = mock_client
+        mock_get_router.return_value.route.return_value = ["gpt-3.5-turbo", "gpt-4o"]
+
+        chat_main()
+
+        # レート制限は再試行せず、すぐに次の候補へ切り替える
+        self.assertEqual(calls, ["gpt-3.5-turbo", "gpt-4o"])
+        self.assertEqual(mock_st.session_state.messages[1]['params']['model'], "gpt-4o")
+
+    @patch('chat.st')
+    def test_resume_keeps_unsummarized_messages_and_checks_owner(self, mock_st):
+        mock_st.session_state = MagicMock()
+        mock_st.session_state.conversation_owner = "user:a"
+        mock_st.session_state.history_version = 0
+        mock_st.session_state.__contains__.side_effect = lambda key: key == "conversation_owner"
+
+        conversation_id = self.store.create_conversation("user:a")
+        for i in range(150):
+            self.store.append(conversation_id, {"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"})
+
+        # 要約が無ければ、古いメッセージも文脈から外さずに読み込む
+        start_conversation(conversation_id)
+        self.assertEqual(mock_st.session_state.message_offset, 0)
+        self.assertEqual(len(mock_st.session_state.messages), 150)
+
+        # 要約済みの範囲だけを読み飛ばす
+        self.store.save_summary(conversation_id, 60, "要約")
+        start_conversation(conversation_id)
+        self.assertEqual(mock_st.session_state.message_offset, 60)
+        self.assertEqual(mock_st.session_state.context_summary, {"upto": 0, "text": "要約"})
+
+        # 他の所有者の会話は再開せず、新しい会話を始める
+        other_id = self.store.create_conversation("user:b")
+        self.store.append(other_id, {"role": "user", "content": "秘密"})
+        start_conversation(other_id)
+        self.assertNotEqual(mock_st.session_state.conversation_id, other_id)
+        self.assertEqual(mock_st.session_state.messages, [])
+        # 新しい会話は最初のメッセージを保存するまでストアに作成しない
+        self.assertIsNone(mock_st.session_state.conversation_id)
+
+    @patch('chat.st')
+    def test_anonymous_owner_survives_reload(self, mock_st):
+        mock_st.user.is_logged_in = False
+        mock_st.query_params = {}
+
+        class SessionState(dict):
+            __getattr__ = dict.__getitem__
+            __setattr__ = dict.__setitem__
+
+        def fresh_session():
+            # 再読み込み・サーバー再起動後はセッション状態が空になり、URLパラメータだけが残る
+            mock_st.session_state = SessionState(history_version=0)
+
+        fresh_session()
+        owner = conversation_owner()
+        self.assertTrue(owner.startswith("session:"))
+        self.assertEqual(mock_st.query_params["owner"], owner.split(":", 1)[1])
+        conversation_id = self.store.create_conversation(owner)
+        self.store.append(conversation_id, {"role": "user", "content": "前回の会話"})
+
+        # 同じトークンを持つ新しいセッションから再開できる
+        fresh_session()
+        self.assertEqual([c["id"] for c in self.store.list_conversations(conversation_owner())], [conversation_id])
+        start_conversation(conversation_id)
+        self.assertEqual(mock_st.session_state.conversation_id, conversation_id)
+        self.assertEqual(mock_st.session_state.messages[0]["content"], "前回の会話")
+
+        # 不正なトークンは使わずに作り直す
+        mock_st.query_params = {"owner": "../other"}
+        fresh_session()
+        self.assertNotEqual(conversation_owner(), owner)
+
+    @patch('chat.render_message')
+    @patch('chat.st')
+    def test_jump_to_old_hit_renders_only_messages_around_it(self, mock_st, mock_render):
+        mock_st.session_state = MagicMock()
+        mock_st.session_state.history_window = 20
+        conversation_id = self.store.create_conversation("user:a")
+        for i in range(1000):
+            self.store.append(conversation_id, {"role": "user", "content": f"m{i}"})
+        mock_st.session_state.conversation_id = conversation_id
+
+        jump_to_message(100)
+        # 直近の表示範囲は広げない
+        self.assertEqual(mock_st.session_state.history_window, 20)
+        self.assertEqual(mock_st.session_state.history_focus, 100)
+
+        render_focused_messages(100, 980)
+        rendered = [call.args[1] for call in mock_render.call_args_list]
+        self.assertEqual(rendered, list(range(95, 106)))
+        self.assertEqual([call.args[0]["content"] for call in mock_render.call_args_list][5], "m100")
+
+        back_to_latest()
+        self.assertIsNone(mock_st.session_state.history_focus)
+
+    def test_history_window_does_not_split_compare_group(self):
+        messages = [{"role": "user", "content": str(i)} for i in range(10)]
+        messages += [{"role": "assistant", "content": "a", "compare_group": 1} for _ in range(3)]
+        self.assertEqual(history_window_start(messages, 2), 10)
+        self.assertEqual(history_window_start(messages, 5), 8)
+        self.assertEqual(history_window_start(messages, 100), 0)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import csv
+import gzip
+import json
+import unittest
+from chat_export import build_export, export_file_info, get_cached_export, cache_export
+
+MESSAGES = [
+    {"role": "user", "content": "こんにちは\n元気？", "ts": 1},
+    {"role": "assistant", "content": "はい", "model_info": "GPT-4o (マルチモーダル)",
+     "params": {"model": "gpt-4o", "temperature": 0.7, "max_tokens": 1000}, "ts": 2},
+]
+
+
+class TestChatExport(unittest.TestCase):
+    def test_csv_export(self):
+        rows = list(csv.reader(build_export(MESSAGES, "CSV").decode("utf-8").splitlines()))
+        self.assertEqual(rows[0][0], "index")
+        self.assertEqual(rows[1][-1], "こんにちは 元気？")
+        self.assertEqual(rows[2][3], "gpt-4o")
+
+    def test_gzip_jsonl_export(self):
+        data = gzip.decompress(build_export(MESSAGES, "JSONL", compress=True)).decode("utf-8")
+        records = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[1]["params"]["model"], "gpt-4o")
+        self.assertEqual(export_file_info("JSONL", True, 0), ("chat_history_0.jsonl.gz", "application/gzip"))
+
+    def test_cache_is_tied_to_history_version(self):
+        cache = {}
+        cache_export(cache, 3, "CSV", False, b"data")
+        self.assertEqual(get_cached_export(cache, 3, "CSV", False), b"data")
+        self.assertIsNone(get_cached_export(cache, 4, "CSV", False))
+        self.assertIsNone(get_cached_export(cache, 3, "CSV", True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from chat_search import SearchIndex, ngrams, normalize, snippet
+
+
+class TestChatSearch(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(0, "東京の天気を教えてください")
+        self.index.add(1, "大阪の天気は晴れです。東京は雨です。")
+        self.index.add(2, "Pythonで議事録を要約するコードを書いて")
+
+    def test_ngrams_skip_spaces(self):
+        self.assertEqual(ngrams(normalize("ＡＢ c")), ["ab", "c"])
+        self.assertEqual(ngrams("東京都"), ["東京", "京都"])
+
+    def test_japanese_query_matches_without_word_segmentation(self):
+        hits = [position for position, _ in self.index.search("天気")]
+        self.assertEqual(sorted(hits), [0, 1])
+        self.assertEqual([p for p, _ in self.index.search("議事録")], [2])
+        self.assertEqual(self.index.search("名古屋"), [])
+
+    def test_case_width_and_single_character_queries(self):
+        self.assertEqual([p for p, _ in self.index.search("ｐｙｔｈｏｎ")], [2])
+        self.assertEqual(sorted(p for p, _ in self.index.search("雨")), [1])
+
+    def test_incremental_add_and_replace(self):
+        self.index.add(3, "東京タワーの高さ")
+        self.assertIn(3, [p for p, _ in self.index.search("東京")])
+        self.index.add(3, "スカイツリーの高さ")
+        self.assertNotIn(3, [p for p, _ in self.index.search("東京")])
+        self.assertEqual(len(self.index), 4)
+
+    def test_remove_drops_all_postings(self):
+        self.index.remove(1)
+        self.assertEqual([p for p, _ in self.index.search("天気")], [0])
+        self.assertEqual(self.index.search("大阪"), [])
+        self.assertFalse(any(1 in postings for postings in self.index._postings.values()))
+
+    def test_snippet_centres_on_match(self):
+        excerpt = snippet("あ" * 100 + "目印" + "い" * 100, "目印", width=20)
+        self.assertIn("目印", excerpt)
+        self.assertTrue(excerpt.startswith("…") and excerpt.endswith("…"))
+
+
+if __name__ == '__main__':
+    unittest.main()
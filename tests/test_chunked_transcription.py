@@ -0,0 +1,146 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import tempfile
+import threading
+import unittest
+from chunked_transcription import (
+    parse_mp3_frames, plan_chunks, stitch, transcribe_chunks, boundaries_from_turns, detect_silences,
+    merge_segments
+)
+
+# MPEG1 Layer III・128kbps・44.1kHz・パディングなしのフレーム（417バイト、1152サンプル）
+FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+FRAME_SEC = 1152 / 44100
+
+
+def make_mp3(frame_count, id3=True):
+    tag = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10 if id3 else b""
+    return tag + FRAME * frame_count
+
+
+class TestMp3Frames(unittest.TestCase):
+    def test_parse_frames_after_id3_tag(self):
+        frames = parse_mp3_frames(make_mp3(100))
+        self.assertEqual(len(frames.offsets), 101)
+        self.assertEqual(frames.offsets[0], 20)
+        self.assertEqual(frames.offsets[1] - frames.offsets[0], 417)
+        self.assertAlmostEqual(frames.duration, 100 * FRAME_SEC)
+
+    def test_resyncs_after_garbage(self):
+        frames = parse_mp3_frames(FRAME * 3 + b"garbage" + FRAME * 2)
+        self.assertEqual(len(frames.offsets), 6)
+        self.assertEqual(frames.offsets[3], 3 * 417 + 7)
+
+    def test_byte_range_covers_time_range(self):
+        frames = parse_mp3_frames(make_mp3(100, id3=False))
+        start, end = frames.byte_range(10 * FRAME_SEC + 0.001, 20 * FRAME_SEC - 0.001)
+        self.assertEqual((start, end), (10 * 417, 20 * 417))
+
+
+class TestPlanChunks(unittest.TestCase):
+    def test_short_audio_is_single_chunk(self):
+        self.assertEqual(plan_chunks(100, target_sec=300), [(0.0, 100)])
+
+    def test_cuts_at_nearest_boundary_with_overlap(self):
+        chunks = plan_chunks(700, boundaries=[150, 290, 320, 610], target_sec=300, window_sec=30, overlap_sec=2)
+        self.assertEqual(chunks, [(0.0, 292), (288, 612), (608, 700)])
+
+    def test_hard_cut_without_boundaries(self):
+        chunks = plan_chunks(1000, target_sec=300, window_sec=30, overlap_sec=0)
+        self.assertEqual(chunks, [(0.0, 300), (300, 600), (600, 900), (900, 1000)])
+
+    def test_boundaries_from_turns(self):
+        # キャッシュから読んだ区間はリストになっている
+        turns = [[21, 30, "B"], [0, 10, "A"], [10, 20, "B"], [30, 31, "B"]]
+        self.assertEqual(boundaries_from_turns(turns), [10, 20.5])
+
+    def test_detect_silences(self):
+        import numpy as np
+        rate = 1000
+        samples = np.concatenate([np.full(1000, 0.5), np.zeros(1000), np.full(1000, 0.5)])
+        self.assertEqual(detect_silences(samples, rate), [1.5])
+
+
+class TestStitch(unittest.TestCase):
+    def test_removes_duplicated_overlap(self):
+        texts = ["今日は会議の議題について話します。まず予算の件です。", "まず予算の件です。次に日程を決めます。"]
+        self.assertEqual(stitch(texts), "今日は会議の議題について話します。まず予算の件です。次に日程を決めます。")
+
+    def test_ignores_match_away_from_chunk_edges(self):
+        first = "予算の件について確認します。" + "あ" * 30
+        second = "い" * 30 + "予算の件について確認します。"
+        self.assertEqual(stitch([first, second]), first + "\n" + second)
+
+    def test_keeps_text_without_overlap(self):
+        self.assertEqual(stitch(["こんにちは。", "さようなら。", ""]), "こんにちは。\nさようなら。")
+
+
+class TestMergeSegments(unittest.TestCase):
+    def test_overlapping_segments_are_taken_from_one_chunk(self):
+        chunk_segments = [
+            [{"start": 0, "end": 4, "text": "a"}, {"start": 4, "end": 6, "text": "b"}, {"start": 9, "end": 12, "text": "c"}],
+            [{"start": 0, "end": 1, "text": "b'"}, {"start": 1, "end": 4, "text": "c'"}, {"start": 4, "end": 6, "text": "d"}],
+        ]
+        # 区切り位置10秒より前はチャンク1、後はチャンク2のセグメントを使う
+        merged = merge_segments(chunk_segments, offsets=[0, 8], cuts=[10])
+        self.assertEqual([s["text"] for s in merged], ["a", "b", "c'", "d"])
+        self.assertEqual((merged[-1]["start"], merged[-1]["end"]), (12, 14))
+
+
+class TestTranscribeChunks(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".mp3")
+        with os.fdopen(fd, "wb") as f:
+            # 約26秒の音声
+            f.write(make_mp3(1000))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_chunks_are_transcribed_in_parallel_and_kept_in_order(self):
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+        sizes = []
+
+        def transcribe(name, data):
+            with lock:
+                active.append(name)
+                peak[0] = max(peak[0], len(active))
+                sizes.append(len(data))
+            time.sleep(0.05)
+            with lock:
+                active.remove(name)
+            index = int(name[6:10])
+            return {"text": f"{index}.", "segments": [{"start": 0.0, "end": 1.0, "text": f"{index}."}]}
+
+        progress = []
+        result = transcribe_chunks(self.path, transcribe, target_sec=5, overlap_sec=0, max_workers=3,
+                                   on_progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(result["text"].split("\n"), [f"{i}." for i in range(len(progress) - 1)])
+        # セグメントの時刻はチャンクの先頭の時刻だけずらされる
+        starts = [segment["start"] for segment in result["segments"]]
+        self.assertEqual(len(starts), len(progress) - 1)
+        self.assertEqual(starts, sorted(starts))
+        self.assertAlmostEqual(starts[1], 5.0, delta=FRAME_SEC)
+        self.assertGreater(peak[0], 1)
+        self.assertLessEqual(peak[0], 3)
+        # 区切り位置を含むフレームは両方のチャンクに入る
+        self.assertGreaterEqual(sum(sizes), 1000 * 417)
+        self.assertLessEqual(sum(sizes), (1000 + len(sizes)) * 417)
+        self.assertEqual(progress[0][0], 0)
+        self.assertEqual(progress[-1][0], progress[-1][1])
+
+    def test_error_is_propagated(self):
+        def transcribe(name, data):
+            raise RuntimeError("API error")
+
+        with self.assertRaises(RuntimeError):
+            transcribe_chunks(self.path, transcribe, target_sec=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
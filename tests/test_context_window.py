@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from context_window import build_context, context_tokens, count_tokens, message_tokens
+
+
+class TestContextWindow(unittest.TestCase):
+    def test_error_messages_are_dropped(self):
+        messages = [
+            {"role": "user", "content": "こんにちは"},
+            {"role": "assistant", "content": "❌ エラーが発生しました: timeout"},
+            {"role": "user", "content": "もう一度"},
+        ]
+        payload = build_context(messages, "gpt-4o", 10000, {}, MagicMock())
+        self.assertEqual([m["content"] for m in payload], ["こんにちは", "もう一度"])
+
+    def test_token_counts_are_cached_on_message(self):
+        message = {"role": "user", "content": "hello world"}
+        count = message_tokens(message, "gpt-4o")
+        self.assertEqual(message["token_counts"]["gpt-4o"], count)
+
+    def test_old_turns_are_folded_into_reused_summary(self):
+        messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": "あ" * 100} for i in range(20)]
+        summarize = MagicMock(return_value="要約")
+        state = {}
+
+        payload = build_context(messages, "gpt-4o", 1000, state, summarize)
+        self.assertEqual(summarize.call_count, 1)
+        self.assertEqual(payload[0]["role"], "system")
+        self.assertIn("要約", payload[0]["content"])
+        self.assertLessEqual(sum(message_tokens(m, "gpt-4o") for m in messages[state["upto"]:]), 1000)
+
+        # 予算内に収まっている間は要約を再計算しない
+        messages.append({"role": "user", "content": "続き"})
+        build_context(messages, "gpt-4o", 1000, state, summarize)
+        self.assertEqual(summarize.call_count, 1)
+
+    def test_context_tokens_counts_summary_and_history(self):
+        messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": "あ" * 100} for i in range(20)]
+        messages.append({"role": "assistant", "content": "❌ エラーが発生しました: x"})
+        state = {"upto": 10, "text": "要約"}
+        expected = count_tokens("要約", "gpt-4o") + sum(message_tokens(m, "gpt-4o") for m in messages[10:20])
+        self.assertEqual(context_tokens(messages, "gpt-4o", state), expected)
+        # 予算を超える分は要約されるため予算で頭打ちにする
+        self.assertEqual(context_tokens(messages, "gpt-4o", state, budget=100), 100)
+        # 直近の入力だけよりはるかに長い
+        self.assertGreater(expected, 5 * message_tokens(messages[19], "gpt-4o"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tempfile
+import unittest
+from conversation_store import ConversationStore
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "conversations.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_and_page_in(self):
+        store = ConversationStore(self.path)
+        conversation_id = store.create_conversation()
+        for i in range(10):
+            store.append(conversation_id, {"role": "user", "content": f"メッセージ{i}", "token_counts": {"gpt-4o": 3}})
+
+        self.assertEqual(store.count(conversation_id), 10)
+        page = store.load_range(conversation_id, 7, 10)
+        self.assertEqual([m["content"] for m in page], ["メッセージ7", "メッセージ8", "メッセージ9"])
+        # キャッシュ用のキーは保存しない
+        self.assertNotIn("token_counts", page[0])
+        self.assertEqual(len(list(store.iter_messages(conversation_id, batch_size=3))), 10)
+
+    def test_conversation_index_and_summary_survive_reopen(self):
+        store = ConversationStore(self.path)
+        conversation_id = store.create_conversation("user:a")
+        store.create_conversation("user:a")  # メッセージの無い会話は一覧に出ない
+        other_id = store.create_conversation("user:b")
+        store.append(other_id, {"role": "user", "content": "他の利用者の会話"})
+        store.append(conversation_id, {"role": "user", "content": "議事録の書き方\nについて"})
+        store.append(conversation_id, {"role": "assistant", "content": "はい"})
+        store.save_summary(conversation_id, 1, "要約")
+
+        reopened = ConversationStore(self.path)
+        conversations = reopened.list_conversations("user:a")
+        self.assertEqual(len(conversations), 1)
+        self.assertEqual(conversations[0]["title"], "議事録の書き方 について")
+        self.assertEqual(conversations[0]["message_count"], 2)
+        self.assertEqual(reopened.load_summary(conversation_id), (1, "要約"))
+        self.assertEqual(reopened.owner_of(other_id), "user:b")
+        self.assertEqual([c["id"] for c in reopened.list_conversations("user:b")], [other_id])
+
+    def test_adds_owner_column_to_existing_store(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT '', created REAL NOT NULL, "
+            "updated REAL NOT NULL, message_count INTEGER NOT NULL DEFAULT 0, "
+            "summary_upto INTEGER NOT NULL DEFAULT 0, summary TEXT NOT NULL DEFAULT '')"
+        )
+        conn.execute("INSERT INTO conversations (id, created, updated, message_count) VALUES ('old', 0, 0, 1)")
+        conn.commit()
+        conn.close()
+
+        store = ConversationStore(self.path)
+        # 所有者の無い以前の会話は誰の一覧にも表示しない
+        self.assertEqual(store.owner_of("old"), "")
+        self.assertEqual(store.list_conversations("user:a"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
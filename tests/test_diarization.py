@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock, patch
+import diarization
+from diarization import PipelineHolder, diarize_in_background, warm_up_if_enabled
+
+
+class TestDiarization(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.loader = MagicMock(side_effect=lambda: MagicMock(return_value="diarization"))
+        self.holder = PipelineHolder(loader=self.loader, idle_release_sec=None, clock=lambda: self.now[0])
+
+    def test_pipeline_is_loaded_lazily_once(self):
+        self.assertFalse(self.holder.loaded)
+        self.assertEqual(self.holder.run("a.mp3", num_speakers=2), "diarization")
+        self.holder.run("b.mp3")
+        self.assertEqual(self.loader.call_count, 1)
+        self.holder.get().assert_called_with("b.mp3")
+
+    def test_idle_pipeline_is_released_and_reloaded(self):
+        # 監視スレッドは使わず、解放処理を直接呼び出す
+        self.holder.run("a.mp3")
+        self.holder.idle_release_sec = 100
+        self.now[0] = 50
+        self.assertFalse(self.holder.release_if_idle())
+        self.now[0] = 200
+        self.assertTrue(self.holder.release_if_idle())
+        self.assertFalse(self.holder.loaded)
+        self.holder.run("b.mp3")
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_warm_up_loads_in_background(self):
+        self.holder.warm_up().join(5)
+        self.assertTrue(self.holder.loaded)
+        self.assertIsNone(self.holder.warm_up())
+
+    def test_warm_up_runs_once_per_process(self):
+        holder = MagicMock()
+        diarization._warm_up_once.clear()
+        self.addCleanup(diarization._warm_up_once.clear)
+        with patch("diarization.get_pipeline_holder", return_value=holder), \
+                patch("diarization._setting", return_value=True):
+            # 解放後の再実行では読み込み直さない
+            warm_up_if_enabled()
+            warm_up_if_enabled()
+        holder.warm_up.assert_called_once_with()
+
+    def test_diarize_in_background(self):
+        with patch("diarization.get_pipeline_holder", return_value=self.holder):
+            future = diarize_in_background("a.mp3", "2")
+            self.assertEqual(future.result(5), "diarization")
+        self.holder.get().assert_called_with("a.mp3", num_speakers=2)
+
+    def test_diarize_in_background_propagates_error(self):
+        self.holder.loader = MagicMock(side_effect=RuntimeError("token"))
+        with patch("diarization.get_pipeline_holder", return_value=self.holder):
+            with self.assertRaises(RuntimeError):
+                diarize_in_background("a.mp3").result(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
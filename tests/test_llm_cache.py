@@ -0,0 +1,108 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from llm_cache import ResponseCache, make_cache_key, complete, stream_completion
+from telemetry import MetricsRecorder
+from cancellation import CancelToken, GenerationCancelled
+
+
+def make_chunk(content):
+    chunk = MagicMock()
+    chunk.choices = [MagicMock(delta=MagicMock(content=content))]
+    chunk.usage = None
+    return chunk
+
+
+class TestLlmCache(unittest.TestCase):
+    def setUp(self):
+        # 計測値はアプリの計測ログに書き出さない
+        metrics = MetricsRecorder(path=None)
+        for target in ('llm_cache.get_metrics', 'telemetry.get_metrics'):
+            patcher = patch(target, return_value=metrics)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+        self.api_params = {
+            "model": "gpt-4o",
+            "messages": [{"role": "user", "content": "こんにちは"}],
+            "temperature": 0.7,
+            "max_tokens": 1000,
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache_key_ignores_stream_flag(self):
+        streamed = dict(self.api_params, stream=True)
+        self.assertEqual(make_cache_key(self.api_params), make_cache_key(streamed))
+        changed = dict(self.api_params, temperature=0.2)
+        self.assertNotEqual(make_cache_key(self.api_params), make_cache_key(changed))
+
+    def test_disk_tier_survives_new_instance(self):
+        ResponseCache(self.path).set("k", "保存済み")
+        cache = ResponseCache(self.path)
+        self.assertEqual(cache.get("k"), "保存済み")
+        self.assertEqual(cache.get("k"), "保存済み")
+        self.assertEqual(cache.stats, {"memory_hits": 1, "disk_hits": 1, "misses": 0})
+
+    def test_size_based_eviction(self):
+        cache = ResponseCache(self.path, max_disk_bytes=10)
+        cache.set("old", "a" * 8)
+        cache.set("new", "b" * 8)
+        cache._memory.clear()
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.get("new"), "b" * 8)
+
+    def test_complete_uses_cache(self):
+        cache = ResponseCache(self.path)
+        client = MagicMock()
+        client.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="分析結果"))],
+            usage=MagicMock(prompt_tokens=100, completion_tokens=20)
+        )
+        stats = {}
+        self.assertEqual(complete(client, self.api_params, cache, stats=stats), "分析結果")
+        self.assertEqual(stats["completion_tokens"], 20)
+        self.assertIsNotNone(stats["latency_sec"])
+        self.assertEqual(complete(client, self.api_params, cache), "分析結果")
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+
+    def test_stream_completion_replays_cached_response(self):
+        cache = ResponseCache(self.path)
+        client = MagicMock()
+        client.chat.completions.create.return_value = [make_chunk("こんにちは"), make_chunk("！")]
+        params = dict(self.api_params, stream=True)
+
+        self.assertEqual("".join(stream_completion(client, params, cache)), "こんにちは！")
+        self.assertEqual("".join(stream_completion(client, params, cache)), "こんにちは！")
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+
+    def test_cancel_closes_stream_and_keeps_partial_text(self):
+        cache = ResponseCache(self.path)
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([make_chunk("途中"), make_chunk("まで"), make_chunk("の応答")])
+        client = MagicMock()
+        client.chat.completions.create.return_value = stream
+        params = dict(self.api_params, stream=True)
+        token = CancelToken()
+        stats = {}
+
+        deltas = stream_completion(client, params, cache, stats=stats, cancel=token)
+        received = [next(deltas), next(deltas)]
+        token.cancel()
+        with self.assertRaises(GenerationCancelled) as raised:
+            next(deltas)
+        self.assertEqual(raised.exception.partial, "".join(received))
+        self.assertTrue(stats["truncated"])
+        stream.close.assert_called()
+        # 打ち切った応答はキャッシュしない
+        self.assertIsNone(cache.get(make_cache_key(params)))
+
+
+if __name__ == '__main__':
+    unittest.main()
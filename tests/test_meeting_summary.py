@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from result_cache import ResultCache
+from meeting_summary import ChunkSummarizer, split_units, split_sentences, reduce_input
+
+# tiktokenを使わず、1文字1トークンとして数える
+count_chars = patch("meeting_summary.count_tokens", side_effect=lambda text, model_id: len(text))
+
+
+class TestSplitting(unittest.TestCase):
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("はい。そうです！\n次へ"), ["はい。", "そうです！", "次へ"])
+
+    @count_chars
+    def test_units_are_packed_without_splitting(self, _):
+        units = ["A: " + "あ" * 40, "B: " + "い" * 40, "A: " + "う" * 40]
+        self.assertEqual(split_units(units, "gpt-4o", budget=90), [units[0] + "\n" + units[1], units[2]])
+
+    @count_chars
+    def test_long_unit_is_split(self, _):
+        chunks = split_units(["あ" * 250], "gpt-4o", budget=100)
+        self.assertEqual([len(chunk) for chunk in chunks], [100, 100, 50])
+
+
+class TestChunkSummarizer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmpdir.name, "results.sqlite3"))
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_summary(self, api_params):
+        with self.lock:
+            self.calls.append(api_params["model"])
+        time.sleep(0.02)
+        return api_params["model"] + ":" + api_params["messages"][1]["content"][:2]
+
+    def test_summaries_keep_order_and_report_progress(self):
+        progress = {}
+        summaries = ChunkSummarizer(self.run_summary).summarize(["c1", "c2", "c3"], "gpt-4o", progress)
+        self.assertEqual(summaries, ["gpt-4o:c1", "gpt-4o:c2", "gpt-4o:c3"])
+        self.assertEqual(progress, {"done": 3, "total": 3})
+
+    def test_cached_chunks_are_reused_by_other_models(self):
+        summarizer = ChunkSummarizer(self.run_summary, self.cache)
+        summarizer.summarize(["c1", "c2"], "gpt-4o-mini")
+        summaries = summarizer.summarize(["c1", "c2", "c3"], "gpt-4o")
+        self.assertEqual(summaries, ["gpt-4o-mini:c1", "gpt-4o-mini:c2", "gpt-4o:c3"])
+        self.assertEqual(self.calls, ["gpt-4o-mini", "gpt-4o-mini", "gpt-4o"])
+
+    def test_error_is_propagated(self):
+        def fail(api_params):
+            raise RuntimeError("API error")
+
+        with self.assertRaises(RuntimeError):
+            ChunkSummarizer(fail).summarize(["c1", "c2"], "gpt-4o")
+
+    @count_chars
+    def test_reduce_input_summarizes_until_within_budget(self, _):
+        summarizer = ChunkSummarizer(lambda api_params: "要約")
+        summaries = ["あ" * 40] * 10
+        reduced = reduce_input(summaries, "gpt-4o", summarizer, budget=200)
+        self.assertLessEqual(len(reduced), 200)
+        self.assertIn("【パート1】\n要約", reduced)
+        self.assertEqual(reduce_input(["短い"], "gpt-4o", summarizer), "【パート1】\n短い")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from model_router import ModelRouter, ROUTE_CANDIDATES, estimate_output_tokens, is_fallback_error
+from telemetry import MetricsRecorder
+
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRecorder(path=None)
+        self.now = [0.0]
+        self.router = ModelRouter(metrics=self.metrics, wait_estimate=lambda model_id, tokens: 0.0,
+                                  clock=lambda: self.now[0])
+
+    def test_short_question_goes_to_fast_model(self):
+        order = self.router.route(prompt_tokens=20, output_tokens=150)
+        self.assertEqual(order[0], "gpt-3.5-turbo")
+        self.assertEqual(len(order), len(ROUTE_CANDIDATES))
+
+    def test_long_prompt_excludes_small_models(self):
+        order = self.router.route(prompt_tokens=20000, output_tokens=150)
+        self.assertNotIn("gpt-3.5-turbo", order)
+        self.assertNotIn("gpt-5-mini", order)
+
+    def test_observed_latency_and_errors_change_order(self):
+        for _ in range(5):
+            self.metrics.record("chat", "gpt-3.5-turbo", {"error": "APIError"})
+        order = self.router.route(prompt_tokens=20, output_tokens=150)
+        self.assertNotEqual(order[0], "gpt-3.5-turbo")
+
+    def test_failed_model_is_moved_to_the_end_until_cooldown(self):
+        self.router.mark_failure("gpt-3.5-turbo", Exception("Error code: 404 - model_not_found"))
+        self.assertEqual(self.router.route(20, 150)[-1], "gpt-3.5-turbo")
+        self.now[0] = 10 * 60 + 1
+        self.assertEqual(self.router.route(20, 150)[0], "gpt-3.5-turbo")
+
+    def test_estimates_and_fallback_errors(self):
+        self.assertEqual(estimate_output_tokens("こんにちは", 1000), 150)
+        self.assertEqual(estimate_output_tokens("Pythonのコードを書いて", 500), 500)
+        self.assertTrue(is_fallback_error(Exception("rate_limit_exceeded")))
+        self.assertFalse(is_fallback_error(Exception("insufficient_quota")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch
+import openai_client
+
+
+class TestOpenAIClient(unittest.TestCase):
+    @patch.dict(os.environ, {"OPENAI_MAX_CONNECTIONS": "50", "OPENAI_HTTP2": "true"})
+    @patch('app_settings.st')
+    def test_settings_from_environment(self, mock_st):
+        mock_st.secrets = {}
+        self.assertEqual(openai_client._setting("OPENAI_MAX_CONNECTIONS"), 50)
+        self.assertIs(openai_client._setting("OPENAI_HTTP2"), True)
+
+    @patch('app_settings.st')
+    def test_settings_default(self, mock_st):
+        mock_st.secrets = {}
+        self.assertEqual(openai_client._setting("OPENAI_MAX_KEEPALIVE"), 10)
+
+    @patch('openai_client.st')
+    def test_get_client_builds_pooled_client(self, mock_st):
+        mock_st.secrets = {"OPENAI_API_KEY": "sk-test"}
+        openai_client.get_client.clear()
+        try:
+            client = openai_client.get_client()
+            self.assertEqual(client.max_retries, 0)
+            self.assertEqual(client.api_key, "sk-test")
+            self.assertEqual(client.timeout.connect, 10)
+        finally:
+            openai_client.get_client.clear()
+
+    @patch('openai_client._pooled_http_client', side_effect=ImportError("no http library"))
+    @patch('openai_client.st')
+    def test_get_client_falls_back_without_pool(self, mock_st, _):
+        mock_st.secrets = {"OPENAI_API_KEY": "sk-test"}
+        openai_client.get_client.clear()
+        try:
+            with self.assertLogs('openai_client', level='WARNING'):
+                client = openai_client.get_client()
+            self.assertEqual(client.max_retries, 0)
+        finally:
+            openai_client.get_client.clear()
+
+    @patch('openai_client._pooled_http_client', side_effect=ValueError("bad setting"))
+    @patch('openai_client.st')
+    def test_get_client_does_not_hide_other_errors(self, mock_st, _):
+        mock_st.secrets = {"OPENAI_API_KEY": "sk-test"}
+        openai_client.get_client.clear()
+        try:
+            with self.assertRaises(ValueError):
+                openai_client.get_client()
+        finally:
+            openai_client.get_client.clear()
+
+    def test_pooled_http_client_applies_connection_limits(self):
+        with patch('app_settings.st') as mock_st:
+            mock_st.secrets = {"OPENAI_MAX_CONNECTIONS": 7}
+            http_client = openai_client._pooled_http_client()
+        self.assertEqual(http_client.timeout.read, 600)
+        # 接続プールの設定はHTTPライブラリの内部にしか無いため、見つかる場合だけ確認する
+        pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+        if pool is not None:
+            self.assertEqual(pool._max_connections, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
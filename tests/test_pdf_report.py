@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from reportlab.platypus import Paragraph, ListFlowable, Table, XPreformatted
+from pdf_report import report_styles, markdown_flowables, text_flowables, build_pdf, report_hash
+
+class TestPdfReport(unittest.TestCase):
+    def setUp(self):
+        # 日本語フォントを使わずに組み込みフォントで確認する
+        self.styles = report_styles("Helvetica")
+
+    def test_markdown_is_rendered_as_flowables(self):
+        text = (
+            "## Agenda\n\n"
+            "Decided **budget** and *schedule* <x>.\n\n"
+            "- item one\n- item two\n    - nested\n\n"
+            "1. first\n2. second\n\n"
+            "| Owner | Due |\n| --- | --- |\n| Sato | 10/1 |\n\n"
+            "    code block\n"
+        )
+        flowables = markdown_flowables(text, self.styles)
+
+        headings = [f for f in flowables if isinstance(f, Paragraph) and f.style is self.styles["h2"]]
+        self.assertEqual(len(headings), 1)
+        self.assertEqual(sum(isinstance(f, ListFlowable) for f in flowables), 2)
+        self.assertEqual(sum(isinstance(f, Table) for f in flowables), 1)
+        self.assertEqual(sum(isinstance(f, XPreformatted) for f in flowables), 1)
+        body = [f for f in flowables if isinstance(f, Paragraph) and "budget" in f.text][0]
+        self.assertIn(("budget", "Helvetica-Bold"), [(frag.text, frag.fontName) for frag in body.frags])
+        self.assertNotIn("**", body.text)
+        self.assertIn("&lt;x&gt;", body.text)
+
+    def test_transcript_lines_are_batched(self):
+        text = "\n".join(f"speaker: line {i}" for i in range(100))
+        flowables = text_flowables(text, self.styles, block_lines=40)
+
+        self.assertEqual(len(flowables), 3)
+        self.assertIn("line 0", flowables[0].text)
+        self.assertIn("line 99", flowables[-1].text)
+
+    def test_markup_characters_are_escaped(self):
+        flowables = text_flowables("a < b & c > d", self.styles)
+        self.assertEqual(flowables[0].text, "a &lt; b &amp; c &gt; d")
+        self.assertEqual("".join(frag.text for frag in flowables[0].frags), "a < b & c > d")
+
+    def test_build_pdf_returns_bytes(self):
+        sections = [("Transcript", "hello\nworld", False), ("Summary", "# Title\n\n- point", True)]
+        pdf = build_pdf(sections, font_name="Helvetica")
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+    def test_report_hash_depends_on_content(self):
+        sections = [("Summary", "a", True)]
+        self.assertEqual(report_hash(sections), report_hash([("Summary", "a", True)]))
+        self.assertNotEqual(report_hash(sections), report_hash([("Summary", "b", True)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from collections import deque
+from unittest.mock import MagicMock
+from rate_limiter import RequestScheduler, TokenBucket, QueueFullError, _Ticket
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate_limit_exceeded")
+        self.response = MagicMock(headers={"retry-after": str(retry_after)})
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_token_bucket_refills_over_time(self):
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.wait_time(1), 1.0)
+        now[0] = 1.0
+        self.assertEqual(bucket.wait_time(1), 0.0)
+
+    def test_retry_honours_retry_after(self):
+        sleeps = []
+        scheduler = RequestScheduler(sleep=sleeps.append)
+        fn = MagicMock(side_effect=[FakeRateLimitError(7), "ok"])
+        self.assertEqual(scheduler.call("s1", "gpt-4o", 100, fn), "ok")
+        self.assertEqual(fn.call_count, 2)
+        self.assertGreaterEqual(sleeps[0], 7.0)
+        self.assertEqual(scheduler.stats["retries"], 1)
+
+    def test_insufficient_quota_is_not_retried(self):
+        scheduler = RequestScheduler(sleep=lambda _: None)
+        error = FakeRateLimitError(1)
+        error.args = ("insufficient_quota",)
+        fn = MagicMock(side_effect=error)
+        with self.assertRaises(FakeRateLimitError):
+            scheduler.call("s1", "gpt-4o", 100, fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_fail_fast_status_is_not_retried(self):
+        sleeps = []
+        scheduler = RequestScheduler(sleep=sleeps.append)
+        fn = MagicMock(side_effect=FakeRateLimitError(7))
+        with self.assertRaises(FakeRateLimitError):
+            scheduler.call("s1", "gpt-4o", 100, fn, fail_fast_status=(429,))
+        self.assertEqual(fn.call_count, 1)
+        self.assertEqual(sleeps, [])
+
+    def test_next_ticket_skips_session_waiting_on_other_model(self):
+        now = [0.0]
+        scheduler = RequestScheduler(limits={"slow": {"rpm": 1, "tpm": None}, "fast": {"rpm": 100, "tpm": None}},
+                                     clock=lambda: now[0])
+        scheduler._bucket_pair("slow")[0].consume(1)
+        blocked = _Ticket("A", "slow", 0)
+        ready = _Ticket("B", "fast", 0)
+        scheduler._queues["A"] = deque([blocked])
+        scheduler._queues["B"] = deque([ready])
+        chosen, _ = scheduler._next_ticket()
+        self.assertIs(chosen, ready)
+
+    def test_queue_full_is_rejected(self):
+        scheduler = RequestScheduler(max_queue=0)
+        with self.assertRaises(QueueFullError):
+            scheduler.call("s1", "gpt-4o", 1, MagicMock())
+
+
+if __name__ == '__main__':
+    unittest.main()
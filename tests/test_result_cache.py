@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import tempfile
+import unittest
+from result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "results.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_results_are_keyed_by_stage_and_params(self):
+        cache = ResultCache(self.path)
+        turns = [[0.0, 1.5, "SPEAKER_00"], [1.5, 3.0, "SPEAKER_01"]]
+        cache.set("diarization", "abc", turns, num_speakers=2)
+        self.assertEqual(cache.get("diarization", "abc", num_speakers=2), turns)
+        self.assertIsNone(cache.get("diarization", "abc", num_speakers=None))
+        self.assertIsNone(cache.get("transcription", "abc", num_speakers=2))
+        self.assertIsNone(cache.get("diarization", "def", num_speakers=2))
+        self.assertEqual(cache.stats, {"hits": 1, "misses": 3})
+
+    def test_results_survive_new_instance(self):
+        ResultCache(self.path).set("summary", "abc", "議事録", model="gpt-4o", language="ja")
+        self.assertEqual(ResultCache(self.path).get("summary", "abc", model="gpt-4o", language="ja"), "議事録")
+
+    def test_least_recently_used_results_are_evicted(self):
+        cache = ResultCache(self.path, max_bytes=250)
+        cache.set("transcription", "a", "あ" * 30)
+        time.sleep(0.01)
+        cache.set("transcription", "b", "い" * 30)
+        time.sleep(0.01)
+        cache.get("transcription", "a")
+        time.sleep(0.01)
+        cache.set("transcription", "c", "う" * 30)
+        self.assertIsNotNone(cache.get("transcription", "a"))
+        self.assertIsNone(cache.get("transcription", "b"))
+        self.assertIsNotNone(cache.get("transcription", "c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
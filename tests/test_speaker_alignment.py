@@ -0,0 +1,64 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import unittest
+from speaker_alignment import SpeakerTimeline, align_segments, format_utterances, UNKNOWN_SPEAKER
+
+
+def segment(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+
+class TestSpeakerTimeline(unittest.TestCase):
+    def setUp(self):
+        # 話者Bの区間は話者Aの長い区間と重なっている
+        self.timeline = SpeakerTimeline([(0, 30, "A"), (5, 8, "B"), (31, 40, "C")])
+
+    def test_overlaps_include_turns_started_earlier(self):
+        self.assertEqual(sorted(self.timeline.overlaps(6, 10)), [(2, "B"), (4, "A")])
+        self.assertEqual(self.timeline.overlaps(30, 31), [])
+
+    def test_speaker_with_longest_overlap(self):
+        self.assertEqual(self.timeline.speaker_at(4, 6), "A")
+        self.assertEqual(self.timeline.speaker_at(29, 35), "C")
+
+    def test_nearby_speaker_for_gaps(self):
+        self.assertEqual(self.timeline.speaker_at(30.1, 30.3), "A")
+        self.assertEqual(self.timeline.speaker_at(30.7, 30.9), "C")
+        self.assertEqual(self.timeline.speaker_at(50, 52), UNKNOWN_SPEAKER)
+        self.assertEqual(SpeakerTimeline([]).speaker_at(0, 1), UNKNOWN_SPEAKER)
+
+
+class TestAlignSegments(unittest.TestCase):
+    def test_adjacent_segments_of_same_speaker_are_merged(self):
+        timeline = SpeakerTimeline([(0, 10, "SPEAKER_00"), (10, 20, "SPEAKER_01")])
+        segments = [
+            segment(0, 4, "おはようございます。"), segment(4, 9, " 会議を始めます。"),
+            segment(10, 15, "よろしくお願いします。"), segment(15, 19, " "),
+        ]
+        utterances = align_segments(segments, timeline)
+        self.assertEqual(
+            format_utterances(utterances),
+            "SPEAKER_00: おはようございます。会議を始めます。\n\nSPEAKER_01: よろしくお願いします。\n\n"
+        )
+        self.assertEqual((utterances[0]["start"], utterances[0]["end"]), (0, 9))
+
+    def test_english_words_keep_spaces(self):
+        timeline = SpeakerTimeline([(0, 10, "A")])
+        utterances = align_segments([segment(0, 1, " Hello"), segment(1, 2, " world")], timeline)
+        self.assertEqual(utterances[0]["text"], "Hello world")
+
+    def test_long_meeting_is_aligned_quickly(self):
+        # 約3時間・5000区間・20000セグメント
+        turns = [(i * 2.0, i * 2.0 + 1.8, f"S{i % 4}") for i in range(5000)]
+        segments = [segment(i * 0.5, i * 0.5 + 0.45, "あ") for i in range(20000)]
+        started = time.perf_counter()
+        utterances = align_segments(segments, SpeakerTimeline(turns))
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(utterances), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
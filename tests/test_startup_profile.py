@@ -0,0 +1,20 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from startup_profile import STARTUP_BUDGET_SEC, DEFERRED_MODULES, profile_module
+
+
+class TestStartupProfile(unittest.TestCase):
+    def test_pages_do_not_import_heavy_modules(self):
+        # 各ページはimportしただけでは重いライブラリを読み込まない
+        for module in STARTUP_BUDGET_SEC:
+            total, rows = profile_module(module)
+            loaded = {name.split(".")[0] for name, _, _ in rows}
+            self.assertEqual([name for name in DEFERRED_MODULES if name in loaded], [], module)
+            self.assertGreater(total, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from streaming import ThrottledRenderer, iter_stream_text
+
+
+def make_chunk(content):
+    chunk = MagicMock()
+    chunk.choices = [MagicMock(delta=MagicMock(content=content))]
+    chunk.usage = None
+    return chunk
+
+
+class TestStreaming(unittest.TestCase):
+    def test_iter_stream_text_skips_empty_chunks(self):
+        usage_chunk = MagicMock()
+        usage_chunk.choices = []
+        usage_chunk.usage = MagicMock(prompt_tokens=10, completion_tokens=3)
+        stream = [make_chunk("こん"), make_chunk(None), usage_chunk, make_chunk("にちは")]
+        usage = {}
+        self.assertEqual(list(iter_stream_text(stream, usage=usage)), ["こん", "にちは"])
+        self.assertEqual(usage, {"prompt_tokens": 10, "completion_tokens": 3})
+
+    def test_renderer_throttles_flushes(self):
+        placeholder = MagicMock()
+        now = [0.0]
+        renderer = ThrottledRenderer(placeholder, interval=0.05, min_chars=200, clock=lambda: now[0])
+
+        # 最初のチャンクは即座に描画される
+        renderer.append("a")
+        self.assertEqual(renderer.flush_count, 1)
+
+        # 間隔内・文字数未満のチャンクは描画されない
+        for _ in range(10):
+            renderer.append("b")
+        self.assertEqual(renderer.flush_count, 1)
+
+        # 文字数しきい値を超えると描画される
+        renderer.append("c" * 200)
+        self.assertEqual(renderer.flush_count, 2)
+
+        # 間隔が経過すると描画される
+        now[0] = 0.1
+        renderer.append("d")
+        self.assertEqual(renderer.flush_count, 3)
+        placeholder.markdown.assert_called_with("a" + "b" * 10 + "c" * 200 + "d" + "▌")
+
+    def test_consume_returns_full_text_without_cursor(self):
+        placeholder = MagicMock()
+        renderer = ThrottledRenderer(placeholder, clock=lambda: 0.0)
+        text = renderer.consume(["こんにちは", "、", "世界"])
+        self.assertEqual(text, "こんにちは、世界")
+        placeholder.markdown.assert_called_with("こんにちは、世界")
+
+
+if __name__ == '__main__':
+    unittest.main()
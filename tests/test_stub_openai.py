@@ -0,0 +1,43 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import json
+import threading
+import unittest
+import urllib.request
+from stub_openai import make_server
+
+
+class TestStubOpenAI(unittest.TestCase):
+    def setUp(self):
+        self.server = make_server(chunks=3, chunk_text="あ")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, payload):
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return response.read().decode("utf-8")
+
+    def test_stream_replays_configured_chunks_with_usage(self):
+        body = self.post({"model": "gpt-4o", "stream": True, "stream_options": {"include_usage": True}})
+        events = [line[len("data: "):] for line in body.splitlines() if line.startswith("data: ")]
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = [json.loads(e) for e in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content") or "" for c in chunks if c["choices"])
+        self.assertEqual(text, "あああ")
+        self.assertEqual(chunks[-1]["usage"]["completion_tokens"], 3)
+
+    def test_non_stream_returns_full_completion(self):
+        body = json.loads(self.post({"model": "gpt-4o"}))
+        self.assertEqual(body["choices"][0]["message"]["content"], "あああ")
+
+
+if __name__ == '__main__':
+    unittest.main()
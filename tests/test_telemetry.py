@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import unittest
+from telemetry import MetricsRecorder, percentile, metrics_params
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertIsNone(percentile([], 50))
+
+    def test_record_writes_jsonl_and_summarises_per_model(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.jsonl")
+            recorder = MetricsRecorder(path)
+            for latency in (1.0, 2.0, 3.0):
+                recorder.record("chat", "gpt-4o", {"latency_sec": latency, "ttft_sec": 0.5, "completion_tokens": 100})
+            recorder.record("chat", "gpt-5", {"latency_sec": 9.0})
+
+            with open(path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f]
+            self.assertEqual(len(entries), 4)
+            # tokens/sはTTFT以降の生成時間で計算される
+            self.assertAlmostEqual(entries[0]["tokens_per_sec"], 200.0)
+
+            rows = {row["モデル"]: row for row in recorder.summary()}
+            self.assertEqual(rows["gpt-4o"]["件数"], 3)
+            self.assertEqual(rows["gpt-4o"]["レイテンシ p50 (s)"], 2.0)
+            self.assertEqual(rows["gpt-5"]["レイテンシ p95 (s)"], 9.0)
+
+    def test_jsonl_is_rotated_when_it_exceeds_max_bytes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.jsonl")
+            recorder = MetricsRecorder(path, max_bytes=300)
+            for _ in range(10):
+                recorder.record("chat", "gpt-4o", {"latency_sec": 1.0})
+
+            self.assertLessEqual(os.path.getsize(path), 300)
+            self.assertLessEqual(os.path.getsize(path + ".1"), 300)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["metrics.jsonl", "metrics.jsonl.1"])
+
+    def test_metrics_params_only_keeps_measurements(self):
+        params = metrics_params({"latency_sec": 1.0, "cached": False, "other": 1})
+        self.assertEqual(params, {"latency_sec": 1.0, "cached": False})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,13 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import io
+import hashlib
+import tempfile
 import unittest
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
-from transcriber import create_pdf
+from transcriber import create_pdf, save_upload, open_upload, transcribe_and_summarize, process_audio_file
 
 class TestTranscriber(unittest.TestCase):
     @patch('transcriber.st')
@@ -32,5 +36,84 @@ class TestTranscriber(unittest.TestCase):
         # PDFの内容を確認するために、バッファのサイズを確認
         self.assertGreater(len(pdf_buffer.getvalue()), 0, "PDFが生成されていません。")
 
+    def test_save_upload_copies_in_blocks(self):
+        data = os.urandom(10000)
+        uploaded_file = io.BytesIO(data)
+        uploaded_file.read()  # 読み込み済みでも先頭から保存する
+        with patch.object(uploaded_file, 'read', wraps=uploaded_file.read) as read:
+            path, digest = save_upload(uploaded_file, block_size=4096)
+        try:
+            self.assertTrue(all(call.args == (4096,) for call in read.call_args_list))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        finally:
+            os.remove(path)
+
+    @patch('transcriber.st')
+    def test_open_upload_remembers_hash_per_file(self, mock_st):
+        mock_st.session_state = {}
+        uploaded_file = io.BytesIO(b"audio")
+        uploaded_file.file_id = "file-1"
+        path, digest = open_upload(uploaded_file)
+        os.remove(path)
+        self.assertEqual(mock_st.session_state["upload_hashes"], {"file-1": digest})
+
+    @patch('transcriber.summarize_transcript', return_value="要約")
+    @patch('transcriber.cached_transcription', return_value={"text": "こんにちは。", "segments": []})
+    @patch('transcriber.save_upload')
+    @patch('transcriber.st')
+    def test_rerun_with_cached_result_does_not_copy_upload(self, mock_st, mock_save_upload, mock_cached, _):
+        # ダウンロードボタン等による再実行では、ファイルの保存・ハッシュ計算を行わない
+        mock_st.session_state = {"upload_hashes": {"file-1": "abc"}}
+        uploaded_file = MagicMock(file_id="file-1")
+        transcribe_and_summarize(uploaded_file, "GPT-4o (マルチモーダル)", "TXT")
+        mock_save_upload.assert_not_called()
+        mock_cached.assert_called_with("abc")
+        mock_st.error.assert_not_called()
+
+    @patch('transcriber.summarize_transcript', side_effect=Exception("queue full"))
+    @patch('transcriber.cached_transcription', return_value={"text": "こんにちは。", "segments": []})
+    @patch('transcriber.st')
+    def test_failed_summary_still_offers_transcript_download(self, mock_st, *_):
+        mock_st.session_state = {"upload_hashes": {"file-1": "abc"}}
+        transcribe_and_summarize(MagicMock(file_id="file-1"), "GPT-4o (マルチモーダル)", "TXT")
+        mock_st.error.assert_called_once()
+        self.assertIn("要約中に", mock_st.error.call_args.args[0])
+        data = mock_st.download_button.call_args.kwargs["data"]
+        self.assertIn("こんにちは。", data)
+        self.assertIn("要約を生成できませんでした", data)
+
+    @patch('transcriber.get_result_cache')
+    @patch('transcriber.transcribe_audio', side_effect=Exception("API error"))
+    @patch('transcriber.diarize_in_background')
+    @patch('transcriber.prepare_audio')
+    @patch('transcriber.open_upload')
+    @patch('transcriber.st')
+    def test_failed_run_does_not_wait_for_diarization(self, mock_st, mock_open, mock_prepare, mock_diarize, _, mock_cache):
+        mock_st.session_state = {}
+        mock_cache.return_value.get.return_value = None
+        for converted in (True, False):
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                path = tmp.name
+            mock_open.return_value = (path, "abc")
+            pcm = path + ".wav" if converted else path
+            mock_prepare.return_value = {"pcm": pcm, "upload": path, "boundaries": ()}
+            future = Future()
+            mock_diarize.return_value = future
+
+            # 話者分離が終わっていなくても、エラー時はすぐに戻る
+            process_audio_file(MagicMock(file_id="file-1"), "未設定", "GPT-4o (マルチモーダル)", "TXT")
+            mock_st.error.assert_called()
+            mock_diarize.assert_called_with(pcm, None)
+            if converted:
+                # 話者分離は変換済みのPCMを読むため、一時ファイルはすぐに削除する
+                self.assertFalse(os.path.exists(path))
+            else:
+                # 話者分離が一時ファイルを読んでいる間は残し、終わってから削除する
+                self.assertTrue(os.path.exists(path))
+                future.set_result(None)
+                self.assertFalse(os.path.exists(path))
+
 if __name__ == '__main__':
     unittest.main()
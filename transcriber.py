@@ -1,89 +1,302 @@
 import streamlit as st
 import os
-import tempfile
-from openai import OpenAI
-from pyannote.audio import Pipeline
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 import io
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import fonts
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.enums import TA_JUSTIFY
-import re
-import markdown
-from reportlab.platypus import Paragraph, Spacer, ListFlowable, ListItem
-from xml.etree import ElementTree as ET
-
-# PyAnnoteの設定
-pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1",
-                                    use_auth_token=st.secrets["HUGGING_FACE_TOKEN"])
-
-def register_fonts():
-    pdfmetrics.registerFont(TTFont('NotoSansJP', 'NotoSansJP-Regular.ttf'))
+import hashlib
+import tempfile
+from openai_client import get_client
+from llm_cache import complete, stream_completion
+from streaming import ThrottledRenderer
+from rate_limiter import scheduled
+from telemetry import measure, render_diagnostics
+from cancellation import CancelToken, run_cancellable, iter_cancellable, status_heartbeat
+from diarization import diarize_in_background
+from chunked_transcription import transcribe_chunks, as_upload, boundaries_from_turns
+from speaker_alignment import SpeakerTimeline, align_segments, format_utterances
+from result_cache import get_result_cache
+from audio_preprocess import normalize_audio, detect_silences_in_wav
+from meeting_summary import (
+    SINGLE_PASS_TOKENS, REDUCE_PROMPT, ChunkSummarizer, split_units, split_sentences, reduce_input
+)
+from context_window import count_tokens
+from pdf_report import build_pdf, render_report
+
+# ==========================
+#  音声処理の設定
+# ==========================
+TRANSCRIPTION_MODEL = "whisper-1"
+LANGUAGE = "ja"
+UPLOAD_BLOCK_BYTES = 1024 * 1024  # アップロードを一時ファイルに書き出す単位
+
+def summary_cache_params(model_id, system_prompt):
+    """要約のキャッシュキーに含めるパラメータ"""
+    return {"model": model_id, "language": LANGUAGE, "prompt": system_prompt}
+
+def summarize(api_params, stop_key, audio_hash=None, output=None):
+    """停止ボタン付きで要約を生成し、受信しながら表示する（停止されたら接続を閉じて生成を打ち切る）
+
+    Args:
+        api_params: Chat Completionsのパラメータ
+        stop_key: 停止ボタンのキー
+        audio_hash: 指定した場合、同じ音声・モデル・プロンプトの要約をキャッシュから返す
+        output: 要約を表示するプレースホルダー（Noneの場合はここで作成する）
+    """
+    output = st.empty() if output is None else output
+    cache_params = summary_cache_params(api_params["model"], api_params["messages"][0]["content"])
+    if audio_hash is not None:
+        cached = get_result_cache().get("summary", audio_hash, **cache_params)
+        if cached is not None:
+            output.markdown(cached)
+            return cached
+
+    cancel = CancelToken()
+    stop_placeholder = st.empty()
+    stop_placeholder.button("⏹️ 要約を停止", key=stop_key)
+    status_placeholder = st.empty()
+    # 受信した要約は一定間隔・一定文字数ごとに間引いて描画する
+    renderer = ThrottledRenderer(output)
+    show_waiting = status_heartbeat(status_placeholder, "要約を生成中")
+
+    def heartbeat():
+        renderer.tick()
+        if renderer.text:
+            status_placeholder.empty()
+        else:
+            show_waiting()
+
+    streamed = dict(api_params, stream=True, stream_options={"include_usage": True})
+    try:
+        summary = renderer.consume(iter_cancellable(
+            lambda: stream_completion(get_client(), streamed, kind="summary", cancel=cancel),
+            cancel,
+            heartbeat=heartbeat,
+            interval=renderer.interval
+        ))
+    finally:
+        stop_placeholder.empty()
+        status_placeholder.empty()
+    if audio_hash is not None:
+        get_result_cache().set("summary", audio_hash, summary, **cache_params)
+    return summary
+
+def summarize_transcript(transcript_text, units, select_model, system_prompt, instruction, stop_key, audio_hash,
+                         output=None):
+    """文字起こしを議事録の形式で要約する
+
+    短い文字起こしは1回の呼び出しで要約する。長い場合は発言（または文）の単位で
+    チャンクに分けて並行に要約し（チャンクの要約はキャッシュ）、最後に統合する。
+
+    Args:
+        transcript_text: 文字起こし全体
+        units: 分割の単位（話者ごとの発言、または文）のリスト
+        select_model: 要約に使うモデル
+        system_prompt: 議事録の形式を指示するシステムプロンプト
+        instruction: 1回で要約する場合にユーザープロンプトの冒頭に付ける指示
+        stop_key: 停止ボタンのキー
+        audio_hash: 音声のSHA-256（要約のキャッシュキー）
+        output: 要約を表示するプレースホルダー
+    """
+    if count_tokens(transcript_text, select_model) <= SINGLE_PASS_TOKENS:
+        return summarize({
+            "model": select_model,
+            "messages": [{"role": "system", "content": system_prompt},
+                         {"role": "user", "content": f"{instruction}\n\n{transcript_text}"}]
+        }, stop_key, audio_hash, output)
+
+    # 統合済みの要約があれば、チャンクの要約もせずに返す
+    output = st.empty() if output is None else output
+    cached = get_result_cache().get("summary", audio_hash, **summary_cache_params(select_model, system_prompt))
+    if cached is not None:
+        output.markdown(cached)
+        return cached
+
+    chunks = split_units(units, select_model)
+    cancel = CancelToken()
+    stop_placeholder = st.empty()
+    stop_placeholder.button("⏹️ 要約を停止", key=f"{stop_key}_chunks")
+    progress_bar = st.progress(0.0, text="要約中…")
+    progress = {"done": 0, "total": len(chunks)}
+
+    def heartbeat():
+        progress_bar.progress(
+            progress["done"] / max(progress["total"], 1),
+            text=f"パートごとに要約中… {progress['done']}/{progress['total']}"
+        )
+
+    summarizer = ChunkSummarizer(
+        lambda api_params: complete(get_client(), api_params, kind="summary", cancel=cancel),
+        get_result_cache()
+    )
+    try:
+        reduced = run_cancellable(
+            lambda: reduce_input(summarizer.summarize(chunks, select_model, progress), select_model, summarizer,
+                                 progress=progress),
+            cancel,
+            heartbeat=heartbeat
+        )
+    finally:
+        stop_placeholder.empty()
+        progress_bar.empty()
+    return summarize({
+        "model": select_model,
+        "messages": [{"role": "system", "content": system_prompt},
+                     {"role": "user", "content": f"{REDUCE_PROMPT}\n\n{reduced}"}]
+    }, stop_key, audio_hash, output)
+
+def save_upload(uploaded_file, block_size=UPLOAD_BLOCK_BYTES):
+    """アップロードされたファイルを一定サイズずつ一時ファイルに書き出し、(パス, SHA-256) を返す
+
+    ファイル全体を一度にread()しないため、大きな音声でもメモリ上に複製を作らない。
+    キャッシュキーに使うハッシュも書き出しと同時に計算する。
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
+        for block in iter(lambda: uploaded_file.read(block_size), b""):
+            digest.update(block)
+            tmp_file.write(block)
+    return tmp_file.name, digest.hexdigest()
+
+def open_upload(uploaded_file):
+    """アップロードを一時ファイルに保存して (パス, SHA-256) を返し、ハッシュをファイルIDごとに記憶する"""
+    path, audio_hash = save_upload(uploaded_file)
+    st.session_state.setdefault("upload_hashes", {})[uploaded_file.file_id] = audio_hash
+    return path, audio_hash
+
+def remove_file(path):
+    """一時ファイルを削除する（既に無い場合は何もしない）"""
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+
+def remembered_hash(uploaded_file):
+    """このセッションで計算済みのアップロードのハッシュ（未計算ならNone）
+
+    再実行のたびにファイル全体を書き出してハッシュを計算し直さないよう、
+    処理結果のキャッシュはまずこのハッシュで確認する。
+    """
+    return st.session_state.get("upload_hashes", {}).get(uploaded_file.file_id)
+
+def cached_transcription(audio_hash):
+    """キャッシュされた文字起こし（無ければNone）"""
+    return get_result_cache().get("transcription", audio_hash, model=TRANSCRIPTION_MODEL, language=LANGUAGE)
+
+def prepare_audio(audio_path, audio_hash):
+    """話者分離・文字起こしに使う音声を用意する
+
+    16kHzモノラルに一度だけ変換し（変換結果は音声ごとに保存）、話者分離には
+    PCMを、文字起こしには小さなMP3を使う。ffmpegが無い場合は元のファイルを使う。
+
+    Returns:
+        {"pcm": 話者分離の入力, "upload": 文字起こしに送るファイル, "boundaries": 区切り候補を返す関数}
+    """
+    with st.spinner("音声を変換中..."):
+        normalized = normalize_audio(audio_path, audio_hash)
+    if normalized is None:
+        return {"pcm": audio_path, "upload": audio_path, "boundaries": ()}
+    # 変換済みのPCMから無音の位置を求め、チャンクの区切りに使う
+    return dict(normalized, boundaries=lambda: detect_silences_in_wav(normalized["pcm"]))
+
+def transcribe_audio(audio_path, audio_hash=None, boundaries=()):
+    """音声をチャンクに分けて並行に文字起こしする（チャンクごとの進捗を表示）
+
+    {"text": テキスト, "segments": タイムスタンプ付きのセグメント} を返す。
+
+    Args:
+        audio_path: MP3ファイルのパス
+        audio_hash: 指定した場合、同じ音声の文字起こしをキャッシュから返す
+        boundaries: チャンクの区切り候補の時刻（無音・話者の交代位置）、
+            またはそれを返す関数（キャッシュに無く、文字起こしする場合にだけ呼ぶ）
+    """
+    if audio_hash is not None:
+        cached = cached_transcription(audio_hash)
+        if cached is not None:
+            return cached
+    if callable(boundaries):
+        boundaries = boundaries()
+
+    progress = st.progress(0.0, text="文字起こし中…")
+
+    def transcribe(name, data):
+        def call():
+            # 話者の割り当てに使うため、セグメントごとのタイムスタンプも受け取る
+            transcription = get_client().audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL,
+                file=as_upload(name, data),  # 再試行時も新しいファイルオブジェクトで送り直す
+                language=LANGUAGE,
+                response_format="verbose_json"
+            )
+            segments = [
+                {"start": segment.start, "end": segment.end, "text": segment.text}
+                for segment in transcription.segments or []
+            ]
+            return {"text": transcription.text, "segments": segments}
+        return measure(
+            "transcription", TRANSCRIPTION_MODEL,
+            lambda: scheduled(TRANSCRIPTION_MODEL, 0, call),
+            audio_bytes=len(data)
+        )
+
+    def on_progress(done, total):
+        progress.progress(done / total, text=f"文字起こし中… {done}/{total} チャンク")
+
+    try:
+        transcription = transcribe_chunks(audio_path, transcribe, boundaries, on_progress=on_progress)
+    finally:
+        progress.empty()
+    if audio_hash is not None:
+        get_result_cache().set("transcription", audio_hash, transcription, model=TRANSCRIPTION_MODEL, language=LANGUAGE)
+    return transcription
 
 def create_pdf(content):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    register_fonts()
-    
-    # カスタムスタイルの定義
-    styles.add(ParagraphStyle(name='Japanese', 
-                              fontName='NotoSansJP', 
-                              fontSize=10, 
-                              leading=14))
-
-    # コンテンツを段落に分割
-    paragraphs = []
-    for line in content.split('\n'):
-        if line.strip():
-            p = Paragraph(line, styles['Japanese'])
-            paragraphs.append(p)
-            paragraphs.append(Spacer(1, 6))  # 段落間のスペース
-
-    # PDFの生成
-    doc.build(paragraphs)
-    buffer.seek(0)
-    return buffer
+    """テキストをPDFにする（reportlabはPDF出力時にだけ読み込む）"""
+    return io.BytesIO(build_pdf([(None, content, False)]))
 
 def process_audio_file(uploaded_file, num_speakers, select_model, output_format):
+    tmp_filename = None
+    diarization_future = None
+    diarization_input = None
     try:
-        # 一時ファイルに保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            tmp_filename = tmp_file.name
+        # 同じ音声の処理結果はキャッシュから返す（再描画・再アップロード時に処理し直さない）
+        speakers = int(num_speakers) if num_speakers != '未設定' else None
+        cache = get_result_cache()
+        audio_hash = remembered_hash(uploaded_file)
+        turns = transcription = None
+        if audio_hash is not None:
+            turns = cache.get("diarization", audio_hash, num_speakers=speakers)
+            transcription = cached_transcription(audio_hash)
 
         # ==========================
-        #  話者分離 (PyAnnote)
+        #  話者分離 (PyAnnote) と文字起こし (Whisper API)
         # ==========================
-        st.subheader("話者分離結果")
-        # 話者の人数を指定して話者分離を実行
-        if num_speakers != '未設定':
-            diarization = pipeline(tmp_filename, num_speakers=int(num_speakers))
-        else:
-            diarization = pipeline(tmp_filename)
+        if turns is None or transcription is None:
+            # 処理が必要な場合だけ一時ファイルに保存する（以降の処理はこのファイルから読む）
+            tmp_filename, audio_hash = open_upload(uploaded_file)
+            audio = prepare_audio(tmp_filename, audio_hash)
+            turns = cache.get("diarization", audio_hash, num_speakers=speakers)
+            if turns is None:
+                # 話者分離（ローカル）を別スレッドで始め、その間に文字起こし（API）を進める
+                # 話者の人数を指定して話者分離を実行（モデルは初回のみ読み込み、全セッションで共有）
+                diarization_future = diarize_in_background(audio["pcm"], speakers)
+                diarization_input = audio["pcm"]
+                boundaries = audio["boundaries"]
+            else:
+                # 話者分離の結果がある場合は、発話の切れ目・話者の交代位置で区切る
+                boundaries = boundaries_from_turns(turns)
+            # 長い音声は無音の位置で区切って並行に送る（APIの25MB制限を超えないように）
+            transcription = transcribe_audio(audio["upload"], audio_hash, boundaries)
+            if turns is None:
+                with st.spinner("話者分離の完了を待っています..."):
+                    # 話者の区間は一度だけ読み出し、開始時刻順に並べて以降の処理で使い回す
+                    turns = SpeakerTimeline.from_diarization(diarization_future.result()).turns
+                cache.set("diarization", audio_hash, turns, num_speakers=speakers)
+        transcript_text = transcription["text"]
+        timeline = SpeakerTimeline(tuple(turn) for turn in turns)
 
         # 話者分離結果の表示
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            st.write(f"[{turn.start:.1f}s -> {turn.end:.1f}s] {speaker}")
+        st.subheader("話者分離結果")
+        for start, end, speaker in timeline.turns:
+            st.write(f"[{start:.1f}s -> {end:.1f}s] {speaker}")
 
-        # ==========================
-        #  文字起こし (Whisper API)
-        # ==========================
         st.subheader("文字起こし結果")
-        with open(tmp_filename, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="ja"
-            )
-
-        transcript_text = transcription.text
         st.text_area("Transcription with Speaker Separation", transcript_text, height=300)
 
         # ==========================
@@ -92,30 +305,9 @@ def process_audio_file(uploaded_file, num_speakers, select_model, output_format)
 
         st.subheader("話者分離と文字起こしの結合結果")
 
-        # 話者の発言を時間順にソート
-        sorted_turns = sorted(diarization.itertracks(yield_label=True), key=lambda x: x[0].start)
-
-        # 文字起こしテキストを単語に分割
-        words = transcript_text.split()
-        word_count = len(words)
-
-        combined_text = ""
-        current_word = 0
-
-        # 全体の長さを計算（最後のセグメントの終了時間）
-        total_duration = max(turn.end for turn, _, _ in sorted_turns)
-
-        for turn, _, speaker in sorted_turns:
-            # この発言の単語数を推定（全体の長さに対する比率で）
-            turn_duration = turn.end - turn.start
-            estimated_words = int((turn_duration / total_duration) * word_count)
-
-            # 発言テキストを取得
-            turn_text = " ".join(words[current_word:current_word + estimated_words])
-            current_word += estimated_words
-
-            # 結合テキストに追加
-            combined_text += f"{speaker}: {turn_text}\n\n"
+        # 文字起こしのセグメントごとに、時間が最も重なる話者を割り当てる
+        utterances = align_segments(transcription["segments"], timeline)
+        combined_text = format_utterances(utterances)
 
         try:
             st.text_area("話者分離と文字起こしの結合結果", combined_text, height=300)
@@ -131,19 +323,24 @@ def process_audio_file(uploaded_file, num_speakers, select_model, output_format)
             if not transcript_text.strip():
                 st.warning("文字起こし結果が空です。要約できる内容がありません。")
                 summary = "要約できる内容がありません。"
+                st.markdown("### 議事録形式の要約\n" + summary)
             else:
+                # 要約は受信しながら見出しの下に表示する（ダウンロードボタンは完了後に表示）
+                st.markdown("### 議事録形式の要約")
                 # 議事録の形式で要約を要求する日本語のプロンプトに変更
-                prompt = f"以下のテキストを議事録の形式で要約してください。\n\n{transcript_text}"
-                completion = client.chat.completions.create(
-                    model=select_model,  # ご使用のモデル名に置き換えてください
-                    messages=[{"role": "system", "content": "議事録の形式で要約してください。"},
-                              {"role": "user", "content": prompt}]
+                # 長い場合は話者の発言の区切りで分割して要約する
+                summary = summarize_transcript(
+                    transcript_text,
+                    [f"{u['speaker']}: {u['text']}" for u in utterances] or split_sentences(transcript_text),
+                    select_model,
+                    "議事録の形式で要約してください。",
+                    "以下のテキストを議事録の形式で要約してください。",
+                    "stop_summary_diarization", audio_hash, st.empty()
                 )
-                # 定義に応じて適切にメッセージコンテンツを取得
-                summary = completion.choices[0].message.content
-            st.markdown("### 議事録形式の要約\n" + summary)
         except Exception as e:
             st.error(f"要約中にエラーが発生しました: {e}")
+            # 要約に失敗しても、文字起こし結果はダウンロードできるようにする
+            summary = "エラーにより要約を生成できませんでした。"
 
         # ==========================
         #  結果の出力
@@ -159,39 +356,44 @@ def process_audio_file(uploaded_file, num_speakers, select_model, output_format)
                 mime="text/plain",
             )
         elif output_format == 'PDF':
-            pdf_buffer = create_pdf(output_text)
+            # 要約のMarkdownは見出しや箇条書きとして出力し、同じ内容のPDFは作り直さない
+            pdf_bytes = render_report([
+                ("話者分離と文字起こしの結合結果", combined_text, False),
+                ("要約", summary, True),
+            ])
             st.download_button(
                 label="結果をPDFファイルとしてダウンロード",
-                data=pdf_buffer,
+                data=pdf_bytes,
                 file_name="result.pdf",
                 mime="application/pdf",
             )
     except Exception as general_e:
         st.error(f"処理中にエラーが発生しました: {general_e}")
     finally:
-        # クリーンアップのため一時ファイルを削除
-        if os.path.exists(tmp_filename):
-            os.remove(tmp_filename)
+        # クリーンアップのため一時ファイルを削除（話者分離の完了は待たない）
+        if diarization_future is not None and diarization_input == tmp_filename:
+            # 変換できず話者分離が一時ファイルを直接読んでいる場合は、終わってから削除する
+            diarization_future.add_done_callback(lambda _, path=tmp_filename: remove_file(path))
+        else:
+            remove_file(tmp_filename)
 
 def transcribe_and_summarize(uploaded_file, select_model, output_format):
+    tmp_filename = None
     try:
-        # 一時ファイルに保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            tmp_filename = tmp_file.name
-
         # ==========================
         #  文字起こし (Whisper API)
         # ==========================
+        # 同じ音声の文字起こしはキャッシュから返す（再描画時にファイルを保存し直さない）
+        audio_hash = remembered_hash(uploaded_file)
+        transcription = cached_transcription(audio_hash) if audio_hash is not None else None
+        if transcription is None:
+            # 一時ファイルに保存（以降の処理はこのファイルから読む）
+            tmp_filename, audio_hash = open_upload(uploaded_file)
+            audio = prepare_audio(tmp_filename, audio_hash)
+            # 長い音声は無音の位置で区切って並行に送る（APIの25MB制限を超えないように）
+            transcription = transcribe_audio(audio["upload"], audio_hash, audio["boundaries"])
         st.subheader("文字起こし結果")
-        with open(tmp_filename, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="ja"
-            )
-
-        transcript_text = transcription.text
+        transcript_text = transcription["text"]
         st.text_area("Transcription with Speaker Separation", transcript_text, height=300)
 
         # ==========================
@@ -202,21 +404,24 @@ def transcribe_and_summarize(uploaded_file, select_model, output_format):
             if not transcript_text.strip():
                 st.warning("文字起こし結果が空です。要約できる内容がありません。")
                 summary = "要約できる内容がありません。"
+                st.markdown("### 議事録\n" + summary)
             else:
+                # 要約は受信しながら見出しの下に表示する（ダウンロードボタンは完了後に表示）
+                st.markdown("### 議事録")
                 # 議事録の形式で要約を要求する日本語のプロンプトに変更
-                prompt = f"以下のテキストをマークダウン記法を用いて、議事録の形式で要約してください。\n\n{transcript_text}"
-                completion = client.chat.completions.create(
-                    model=select_model,  # ご使用のモデル名に置き換えてください
-                    messages=[
-                        {"role": "system", "content": "マークダウン記法を用いて議事録の形式で要約してください。"},
-                        {"role": "user", "content": prompt}
-                    ]
+                # 長い場合は文の区切りで分割して要約する
+                summary = summarize_transcript(
+                    transcript_text,
+                    split_sentences(transcript_text),
+                    select_model,
+                    "マークダウン記法を用いて議事録の形式で要約してください。",
+                    "以下のテキストをマークダウン記法を用いて、議事録の形式で要約してください。",
+                    "stop_summary_transcription", audio_hash, st.empty()
                 )
-                # 定義に応じて適切にメッセージコンテンツを取得
-                summary = completion.choices[0].message.content
-            st.markdown("### 議事録\n" + summary)
         except Exception as e:
             st.error(f"要約中にエラーが発生しました: {e}")
+            # 要約に失敗しても、文字起こし結果はダウンロードできるようにする
+            summary = "エラーにより要約を生成できませんでした。"
 
         # ==========================
         #  結果の出力
@@ -232,10 +437,14 @@ def transcribe_and_summarize(uploaded_file, select_model, output_format):
                 mime="text/plain",
             )
         elif output_format == 'PDF':
-            pdf_buffer = create_pdf(output_text)
+            # 要約のMarkdownは見出しや箇条書きとして出力し、同じ内容のPDFは作り直さない
+            pdf_bytes = render_report([
+                ("文字起こし", transcript_text, False),
+                ("要約", summary, True),
+            ])
             st.download_button(
                 label="結果をPDFファイルとしてダウンロード",
-                data=pdf_buffer,
+                data=pdf_bytes,
                 file_name="result.pdf",
                 mime="application/pdf",
             )
@@ -243,51 +452,60 @@ def transcribe_and_summarize(uploaded_file, select_model, output_format):
         st.error(f"処理中にエラーが発生しました: {general_e}")
     finally:
         # クリーンアップのため一時ファイルを削除
-        if os.path.exists(tmp_filename):
-            os.remove(tmp_filename)
+        remove_file(tmp_filename)
 
-# ==========================
-#  OpenAI APIキーの設定
-# ==========================
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+def main():
+    """MP3音声データ処理アプリのページを表示する"""
+    # タイトル
+    st.title("MP3音声データ処理アプリ")
 
-# タイトル
-st.title("MP3音声データ処理アプリ")
-
-# 説明
-st.markdown("""
+    # 説明
+    st.markdown("""
 このアプリケーションでは、MP3形式の音声ファイルをアップロードすると、以下の処理を行います：
 - **文字起こし**
 - **要約**
 - **結果のテキストファイルとしてのダウンロード**
 """)
 
-# ファイルアップロード
-uploaded_file = st.file_uploader("MP3ファイルをアップロードしてください", type=["mp3"])
-
-select_model = st.selectbox(
-    "要約に使用するモデルを選択してください",
-    ['gpt-4o', 'gpt-4o-mini', 'gpt-3.5-turbo']
-)
-
-# ファイル形式の選択オプションを追加
-output_format = st.selectbox(
-    "出力ファイル形式を選択してください",
-    ['TXT', 'PDF']
-)
-
-# 話者人数の選択
-num_speakers = st.selectbox(
-    "話者の人数を選択してください（未設定の場合は自動検出されます）",
-    ['未設定', '1', '2', '3', '4', '5']
-)
-
-if st.button('話者分離する'):
-    if uploaded_file is not None:
-        with st.spinner("音声ファイルを処理中..."):
-            process_audio_file(uploaded_file, num_speakers, select_model, output_format)
-
-if st.button('文字起こし・要約のみ行う'):
+    # ファイルアップロード
+    uploaded_file = st.file_uploader("MP3ファイルをアップロードしてください", type=["mp3"])
+
+    select_model = st.selectbox(
+        "要約に使用するモデルを選択してください",
+        ['gpt-4o', 'gpt-4o-mini', 'gpt-3.5-turbo']
+    )
+
+    # ファイル形式の選択オプションを追加
+    output_format = st.selectbox(
+        "出力ファイル形式を選択してください",
+        ['TXT', 'PDF']
+    )
+
+    # 話者人数の選択
+    num_speakers = st.selectbox(
+        "話者の人数を選択してください（未設定の場合は自動検出されます）",
+        ['未設定', '1', '2', '3', '4', '5']
+    )
+
+    # API呼び出しの計測値（モデルごとのp50/p95）
+    with st.sidebar:
+        render_diagnostics()
+
+    # 実行した処理を覚えておき、ダウンロードボタン等による再実行でも結果を表示し続ける
+    # （処理結果はキャッシュされるため、2回目以降はすぐに表示される）
+    job = None
     if uploaded_file is not None:
+        job = (uploaded_file.file_id, num_speakers, select_model, output_format)
+    if st.button('話者分離する') and job is not None:
+        st.session_state.transcriber_job = ("diarization", job)
+    if st.button('文字起こし・要約のみ行う') and job is not None:
+        st.session_state.transcriber_job = ("transcription", job)
+
+    # ファイルや設定が変わった場合は、ボタンが押されるまで表示しない
+    mode, last_job = st.session_state.get("transcriber_job", (None, None))
+    if job is not None and last_job == job:
         with st.spinner("音声ファイルを処理中..."):
-            transcribe_and_summarize(uploaded_file, select_model, output_format)
+            if mode == "diarization":
+                process_audio_file(uploaded_file, num_speakers, select_model, output_format)
+            else:
+                transcribe_and_summarize(uploaded_file, select_model, output_format)